@@ -1,32 +1,42 @@
 import os
-import time
-import threading
+import json
+import asyncio
 
 import uvicorn
 import uuid
-import shutil
 import zipfile
-from fastapi.responses import JSONResponse
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Query
 from pathlib import Path
-from utils.v2 import (
-    extract_replay,
-    read_replay_data,
-    process_replay_files,
-    decompress_gzip_file,
-    read_replay_data_file,
-    parse_replay_data
-)
-from utils.v1 import (
-    extract_replay as v1_extract_replay,
-    read_replay_data as v1_read_replay_data,
-    process_replay_files as v1_process_replay_files,
-    decompress_gzip_file as v1_decompress_gzip_file,
-    read_replay_data_file as v1_read_replay_data_file,
-    parse_replay_data as v1_parse_replay_data
+from utils.engine import (
+    ReplayArchiveError,
+    ARCHIVE_FLIGHTS,
+    archive_content_hash,
+    process_archive_coalesced,
+    iter_archive_concurrently,
+    result_extras,
+    is_replay_archive_name,
+    unpack_archive_bundle,
+    process_archive_batch,
+    process_archive_on_disk,
+    process_archive_v1,
+    index_archive_items,
+    process_handle_item,
+    get_replay_cache,
+    get_replay_library
 )
+from utils.admission import AdmissionController, AdmissionControlMiddleware
+from utils.handles import ArchiveHandleStore
+from utils.timeline import ReplayTimeline
+from utils.encoding import JSON_MEDIA_TYPE, ReplayJSONResponse, negotiate_media_type, encode_results, json_default
+from utils.metrics import REGISTRY, ERRORS, STAGE_SECONDS, MetricsMiddleware
+from utils.logs import LOG_DIR, log_file_path, parse_level, tail_offset, iter_log_bytes, iter_log_records
+from utils.uploads import UploadSizeLimitMiddleware, UploadTooLargeError, copy_upload, max_upload_bytes
+from utils.workers import ReplayWorkerPool, WorkerPoolFullError
+from utils.workspace import WorkspacePool, run_janitor
 from fastapi.middleware.cors import CORSMiddleware
-from logging import getLogger
+from logging import getLogger, NOTSET
 import setup_logging
 from dotenv import load_dotenv
 import datetime
@@ -35,18 +45,25 @@ load_dotenv()
 
 setup_logging.setup_logger()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
 class AuthSession:
-    def __init__(self, session_uuid: str, ip_address: str, timestamp: float):
+    def __init__(self, session_uuid: str, ip_address: str, timestamp: float, ttl: float = 3600.0):
         self.session_uuid = session_uuid
         self.ip_address = ip_address
         self.timestamp = timestamp
+        self.ttl = ttl
 
     @staticmethod
     def get_current_timestamp() -> float:
         return datetime.datetime.utcnow().timestamp()
 
+    def is_expired(self) -> bool:
+        return self.timestamp is None or self.get_current_timestamp() - self.timestamp > self.ttl
+
     def get(self):
-        if self.get_current_timestamp() - self.timestamp > 3600.0:
+        if self.is_expired():
             return {}
 
         self.timestamp = self.get_current_timestamp()
@@ -62,9 +79,42 @@ class AuthSession:
         self.timestamp = None
 
 
+class ReplaySession(AuthSession):
+    """
+    Session holding the parsed replays of one uploaded archive as timelines, for window queries
+    """
+    def __init__(self, session_uuid: str, ip_address: str, timestamp: float, timelines: dict[str, ReplayTimeline], ttl: float = 3600.0):
+        super().__init__(session_uuid, ip_address, timestamp, ttl)
+        self.timelines = timelines
+
+    def delete(self):
+        super().delete()
+        self.timelines = {}
+
+
 class Client(FastAPI):
     def __init__(self):
-        super().__init__()
+        super().__init__(lifespan=self.lifespan)
+        self.session: dict[str, AuthSession] = {}
+        self.session_ttl = float(os.environ.get("REPLAY_SESSION_TTL", 600))
+        self.max_sessions = int(os.environ.get("REPLAY_SESSION_MAX", 32))
+        self.archive_mode = os.environ.get("REPLAY_ARCHIVE_MODE", "memory").lower()
+        self.worker_pool = ReplayWorkerPool.from_env()
+        if self.worker_pool.mode == "process":
+            # Worker processes log through this process, the queue is handed to them whatever the start method
+            self.worker_pool.initializer = setup_logging.init_worker_logging
+            self.worker_pool.initargs = (setup_logging.worker_log_queue(),)
+        self.max_upload_bytes = max_upload_bytes()
+        self.batch_parallelism = int(os.environ.get("REPLAY_BATCH_PARALLELISM", 2))
+        self.archive_handles = ArchiveHandleStore.from_env()
+        self.workspaces = WorkspacePool.from_env()
+        self.janitor_interval = float(os.environ.get("REPLAY_JANITOR_INTERVAL", 60))
+        self.add_middleware(UploadSizeLimitMiddleware, paths=("/replayv2", "/replayv2/index", "/replayv2/session", "/replayv1"), max_bytes=self.max_upload_bytes)
+        self.add_middleware(UploadSizeLimitMiddleware, paths=("/replayv2/batch",), max_bytes=max_upload_bytes("REPLAY_MAX_BATCH_UPLOAD_BYTES", 1024 * 1024 * 1024))
+        self.admission = AdmissionController.from_env()
+        self.add_middleware(AdmissionControlMiddleware, paths=("/replayv2", "/replayv2/batch", "/replayv2/index", "/replayv2/session", "/replayv1"), controller=self.admission)
+        self.add_middleware(MetricsMiddleware, paths=("/replayv2", "/replayv2/batch", "/replayv2/index", "/replayv2/session", "/replayv1"))
+        # Added last so it is the outermost middleware: the 413/429/503 answers of the ones above get CORS headers too
         origins = ["*"]
         self.add_middleware(
             CORSMiddleware,
@@ -73,36 +123,56 @@ class Client(FastAPI):
             allow_methods=["*"],
             allow_headers=["*"],
         )
-        self.session: dict[str, AuthSession] = {}
         self.log = getLogger(__name__)
-        self.log.info("API Handler Client initialized for V2 (multi-replay support).")
+        self.log.info(f"API Handler Client initialized for V2 (multi-replay support, archive mode: {self.archive_mode}).")
         self.add_api_route("/replayv2", self.send_replay, methods=["POST"])
+        self.add_api_route("/replayv2/batch", self.send_replay_batch, methods=["POST"])
+        self.add_api_route("/replayv2/index", self.send_replay_index, methods=["POST"])
+        self.add_api_route("/replayv2/index/{handle}/{item_filename}", self.send_indexed_replay, methods=["GET"])
+        self.add_api_route("/replayv2/index/{handle}", self.release_replay_index, methods=["DELETE"])
+        self.add_api_route("/replayv2/session", self.create_replay_session, methods=["POST"])
+        self.add_api_route("/replayv2/session/{session_uuid}/{item_filename}", self.send_replay_window, methods=["GET"])
+        self.add_api_route("/replayv2/session/{session_uuid}", self.delete_replay_session, methods=["DELETE"])
+        self.add_api_route("/library/replays", self.list_library_replays, methods=["GET"])
+        self.add_api_route("/library/replays/{replay_id}", self.send_library_replay, methods=["GET"])
         self.add_api_route("/replayv1", self.replay_v1_handler, methods=["POST"])
         self.add_api_route("/get_log", self.get_log, methods=["GET", "HEAD"])
+        self.add_api_route("/cache_stats", self.cache_stats, methods=["GET"])
+        self.add_api_route("/metrics", self.metrics, methods=["GET"])
+
+    @asynccontextmanager
+    async def lifespan(self, app: FastAPI):
+        janitor = asyncio.create_task(run_janitor(self.workspaces, self.janitor_interval))
+        yield
+        janitor.cancel()
+        try:
+            await janitor
+        except asyncio.CancelledError:
+            pass
+        self.workspaces.close()
+        self.archive_handles.close()
+        self.worker_pool.shutdown()
 
     @staticmethod
     def generate_uuid():
         return str(uuid.uuid4())
 
-    @staticmethod
-    def clean_up(f: Path):
-        logger = getLogger(__name__)
-        if f.exists() and f.is_dir():
-            try:
-                shutil.rmtree(f)
-                logger.info(f"Successfully cleaned up temporary directory: {f}")
-            except Exception as e:
-                logger.error(f"Error during clean_up of {f}: {e}", exc_info=True)
-        else:
-            logger.info(f"Path {f} does not exist or is not a directory. No cleanup needed for {f}.")
-
     def raise_error(self, code, message) -> None:
         self.log.error(f"HTTPException raised: Status {code}, Detail: {message}")
+        ERRORS.inc(type=f"http_{code}")
         raise HTTPException(status_code=code, detail=message)
 
-    async def send_replay(self, file: UploadFile = File(...)):
+    async def send_replay(self, request: Request, file: UploadFile = File(...), stream: bool = False, analytics: bool = False,
+                          verify: bool = False):
         """
         Endpoint v2
+
+        With ?stream=true or "Accept: application/x-ndjson" the response is NDJSON,
+        one {"item": ..., "data": ...} record per replay item as soon as it is parsed.
+        Otherwise the Accept header picks JSON (default), application/x-replay-frame or application/msgpack.
+        With ?analytics=true every replay item also carries the precomputed "analytics" block
+        (decoded times, combo series, max combo, judgment buckets, accuracy histograms),
+        and with ?verify=true a "verification" verdict of its claimed result.
         """
         request_uuid = self.generate_uuid()
         self.log.info(f"[{request_uuid}] Received file: {file.filename}, Content-Type: {file.content_type}")
@@ -110,150 +180,149 @@ class Client(FastAPI):
         if not file.filename.endswith('.zip') and not file.filename.endswith(".scp"):
             self.raise_error(code=400, message="File must be a .zip or a .scp (Sonolus Collection Package) archive.")
 
-        temp_dir_for_request = Path(f"temp/processing_{request_uuid}")
+        stream = stream or "application/x-ndjson" in request.headers.get("accept", "")
+        extras = result_extras(analytics, verify)
+
+        if self.archive_mode == "memory":
+            all_processed_replays_data = await self._send_replay_in_memory(file, request_uuid, stream, extras)
+            if stream:
+                return all_processed_replays_data
+        else:
+            all_processed_replays_data = await self._send_replay_on_disk(file, request_uuid, extras)
+            if stream:
+                records = (self.ndjson_record(name, result) for name, result in all_processed_replays_data.items())
+                return StreamingResponse(records, media_type=NDJSON_MEDIA_TYPE)
+
+        media_type = negotiate_media_type(request.headers.get("accept"))
+        with STAGE_SECONDS.time(stage="serialize"):
+            if media_type == JSON_MEDIA_TYPE:
+                return ReplayJSONResponse(content=all_processed_replays_data)
+            self.log.info(f"[{request_uuid}] Encoding response as {media_type}.")
+            return Response(content=encode_results(all_processed_replays_data, media_type), media_type=media_type)
+
+    @staticmethod
+    def ndjson_record(item_filename: str, result: dict) -> str:
+        with STAGE_SECONDS.time(stage="serialize"):
+            return json.dumps({"item": item_filename, "data": result}, default=json_default) + "\n"
+
+    async def _stream_replay_records(self, file: UploadFile, request_uuid: str, extras: tuple[str, ...] = ()):
+        with self.worker_pool.reserve():
+            count = 0
+            try:
+                async for item_filename, result in iter_archive_concurrently(self.worker_pool, file.file, request_uuid, extras):
+                    count += 1
+                    yield self.ndjson_record(item_filename, result)
+            except Exception as e:
+                if count == 0:
+                    raise
+                self.log.error(f"[{request_uuid}] Streaming aborted after {count} item(s): {e}", exc_info=True)
+                yield json.dumps({"error": f"An unexpected server error occurred: {type(e).__name__}."}) + "\n"
+                return
+        self.log.info(f"[{request_uuid}] Streaming complete. Sent {count} item(s).")
+
+    async def _send_replay_in_memory(self, file: UploadFile, request_uuid: str, stream: bool = False, extras: tuple[str, ...] = ()):
+        """
+        Read the replay items and the gameplay members they point to straight from the uploaded
+        (spooled) archive, without extracting anything to disk. The items are processed concurrently on the worker pool.
+        Returns the results keyed by item, or a StreamingResponse of NDJSON records if ``stream`` is set.
+        """
+        try:
+            file.file.seek(0)
+            if stream:
+                records = self._stream_replay_records(file, request_uuid, extras)
+                # Pull the first record before answering so archive errors still map to a proper status code
+                first_record = await anext(records, None)
+                if first_record is None:
+                    self.raise_error(code=400, message="No replay item data (e.g., local-*.json) found in the archive's 'replays' folder.")
+
+                async def all_records():
+                    yield first_record
+                    async for record in records:
+                        yield record
+
+                return StreamingResponse(all_records(), media_type=NDJSON_MEDIA_TYPE)
+
+            with self.worker_pool.reserve():
+                all_processed_replays_data = await process_archive_coalesced(self.worker_pool, file.file, request_uuid, extras)
+
+            if not all_processed_replays_data:
+                self.raise_error(code=400, message="No replay item data (e.g., local-*.json) found in the archive's 'replays' folder.")
+
+            self.log.info(f"[{request_uuid}] Processing complete. Returning data for {len(all_processed_replays_data)} item(s).")
+            return all_processed_replays_data
+
+        except HTTPException:
+            raise
+        except WorkerPoolFullError as e:
+            self.log.warning(f"[{request_uuid}] {e}")
+            self.raise_error(code=503, message="Server is busy processing other replays, please retry later.")
+        except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+            self.log.warning(f"[{request_uuid}] Invalid or unsupported ZIP/SCP file: {e}", exc_info=True)
+            self.raise_error(code=400, message=f"The provided archive file is invalid or unsupported: {e}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.log.warning(f"[{request_uuid}] Malformed replay item JSON: {e}")
+            self.raise_error(code=400, message=f"A replay item (local-*.json) of the archive is not valid JSON: {e}")
+        except KeyError as e:
+            self.log.error(f"[{request_uuid}] Missing expected key in archive structure: {e}", exc_info=True)
+            self.raise_error(code=400, message=f"Archive content is missing expected data or has incorrect structure (Global KeyError: {e}).")
+        except Exception as e:
+            self.log.error(f"[{request_uuid}] Unhandled global error in send_replay: {e}", exc_info=True)
+            self.raise_error(code=500, message=f"An unexpected server error occurred: {type(e).__name__}.")
+
+    async def _send_replay_on_disk(self, file: UploadFile, request_uuid: str, extras: tuple[str, ...] = ()):
+        """
+        Legacy mode: save the upload to a workspace under temp/ (see utils.workspace) and extract the whole archive.
+        Concurrent uploads of the same archive share one save, extract and parse run.
+        """
+        archive_hash = await asyncio.to_thread(archive_content_hash, file.file)
+        return await ARCHIVE_FLIGHTS.do("-".join(("disk", archive_hash, *extras)), lambda: self._process_upload_on_disk(file, request_uuid, extras))
 
+    async def _process_upload_on_disk(self, file: UploadFile, request_uuid: str, extras: tuple[str, ...] = ()):
         try:
-            temp_dir_for_request.mkdir(parents=True, exist_ok=True)
+            workspace = await asyncio.to_thread(self.workspaces.acquire)
         except OSError as e:
-            self.log.error(f"[{request_uuid}] Could not create temp directory {temp_dir_for_request}: {e}", exc_info=True)
+            self.log.error(f"[{request_uuid}] Could not create a workspace under {self.workspaces.root}: {e}", exc_info=True)
             self.raise_error(code=500, message="Server error: Could not create temporary directory.")
+        temp_dir_for_request = workspace.path
 
         original_suffix = Path(file.filename).suffix
         target_filename = f"upload_archive_{request_uuid}{original_suffix}"
         uploaded_file_path = temp_dir_for_request / target_filename
 
-        all_processed_replays_data = {}
-
         try:
             self.log.info(f"[{request_uuid}] Saving uploaded file to {uploaded_file_path}")
-            with open(uploaded_file_path, "wb") as f_out:
-                content = await file.read()
-                f_out.write(content)
+            with STAGE_SECONDS.time(stage="save_upload"):
+                await copy_upload(file, uploaded_file_path, self.max_upload_bytes)
 
-            self.log.info(f"[{request_uuid}] File saved. Extracting archive: {uploaded_file_path}")
-            sonolus_content_dir = extract_replay(uploaded_file_path)
-            self.log.info(f"[{request_uuid}] Archive extracted. Sonolus content root: {sonolus_content_dir}")
+            self.log.info(f"[{request_uuid}] File saved. Processing archive: {uploaded_file_path}")
+            all_processed_replays_data = await self.worker_pool.run(process_archive_on_disk, uploaded_file_path, request_uuid, extras)
 
-            if not sonolus_content_dir.exists() or not sonolus_content_dir.is_dir():
+            if all_processed_replays_data is None:
                 self.raise_error(code=500, message="Archive structure error: Core content directory not found after extraction.")
 
-            self.log.info(f"[{request_uuid}] Reading all replay item data from {sonolus_content_dir / 'replays'}")
-            all_replay_items_map = read_replay_data(sonolus_content_dir)
-
-            if not all_replay_items_map:
-                self.raise_error(code=400, message="No replay item data (e.g., local-*.json) found in the archive's 'replays' folder.")
-
-            self.log.info(f"[{request_uuid}] Found {len(all_replay_items_map)} replay item(s) to process.")
-
-            for item_filename, item_content_json in all_replay_items_map.items():
-                item_processing_uuid = self.generate_uuid()
-                self.log.info(f"[{request_uuid}/{item_processing_uuid}] Processing replay item: {item_filename}")
-
-                item_temp_decompression_dir = temp_dir_for_request / f"item_{item_processing_uuid}_decompressed"
-                item_temp_decompression_dir.mkdir(exist_ok=True)
-
-                try:
-                    raw_replay_metadata = process_replay_files(item_content_json)
-                    if not raw_replay_metadata:
-                        self.log.warning(f"[{request_uuid}/{item_processing_uuid}] Failed to process metadata for {item_filename}. Skipping.")
-                        all_processed_replays_data[item_filename] = {"error": "Failed to process metadata from item JSON."}
-                        continue
-
-                    gameplay_data_url_in_json = raw_replay_metadata.gameplay_data
-                    self.log.info(f"[{request_uuid}/{item_processing_uuid}] Raw gameplay data URL from JSON: {gameplay_data_url_in_json}")
-
-                    path_suffix_from_url = Path(gameplay_data_url_in_json)
-                    path_inside_sonolus_dir: Path
-                    if str(path_suffix_from_url).lower().startswith(("/sonolus/", "\\sonolus\\")):
-                        path_inside_sonolus_dir = Path(*path_suffix_from_url.parts[2:])
-                    else:
-                        path_inside_sonolus_dir = Path(str(path_suffix_from_url).lstrip('/\\'))
-
-                    gameplay_data_gzip_path = (sonolus_content_dir / path_inside_sonolus_dir).resolve()
-
-                    self.log.info(f"[{request_uuid}/{item_processing_uuid}] Sonolus content directory: {sonolus_content_dir}")
-                    self.log.info(f"[{request_uuid}/{item_processing_uuid}] Calculated path suffix from URL: {path_inside_sonolus_dir}")
-                    self.log.info(f"[{request_uuid}/{item_processing_uuid}] Attempting to locate GZIP file at: {gameplay_data_gzip_path}")
-
-                    try:
-                        resolved_sonolus_content_dir = sonolus_content_dir.resolve()
-                        resolved_gameplay_data_path = gameplay_data_gzip_path # Already resolved
-
-                        is_safe_path = False
-                        if hasattr(Path, 'is_relative_to'):
-                            if resolved_gameplay_data_path.is_relative_to(resolved_sonolus_content_dir):
-                                is_safe_path = True
-                        else:
-                            try:
-                                common = Path(os.path.commonpath([str(resolved_sonolus_content_dir), str(resolved_gameplay_data_path)]))
-                                if common == resolved_sonolus_content_dir:
-                                    is_safe_path = True
-                            except ValueError:
-                                is_safe_path = False
-
-                        if not is_safe_path:
-                            self.log.warning(f"[{request_uuid}/{item_processing_uuid}] Security Alert or Path Mismatch: Resolved GZIP path {resolved_gameplay_data_path} is not confirmed to be within {resolved_sonolus_content_dir}. Check archive structure and JSON URLs.")
-                    except Exception as e_path_check:
-                        self.log.error(f"[{request_uuid}/{item_processing_uuid}] Error during path safety check: {e_path_check}", exc_info=True)
-
-
-                    if not gameplay_data_gzip_path.exists():
-                        self.log.warning(f"[{request_uuid}/{item_processing_uuid}] Gameplay data GZIP file not found for {item_filename} at {gameplay_data_gzip_path}. Skipping.")
-                        all_processed_replays_data[item_filename] = {"error": f"Gameplay data GZIP file not found at expected location: {gameplay_data_gzip_path.name}"}
-                        continue
-
-                    self.log.info(f"[{request_uuid}/{item_processing_uuid}] Decompressing GZIP file: {gameplay_data_gzip_path} for {item_filename}")
-                    decompressed_gameplay_json_path_str = decompress_gzip_file(gameplay_data_gzip_path, item_temp_decompression_dir)
-
-                    if not decompressed_gameplay_json_path_str:
-                        self.log.warning(f"[{request_uuid}/{item_processing_uuid}] Failed to decompress GZIP for {item_filename}. Skipping.")
-                        all_processed_replays_data[item_filename] = {"error": "Failed to decompress gameplay GZIP data."}
-                        continue
-
-                    decompressed_gameplay_json_path = Path(decompressed_gameplay_json_path_str)
-                    self.log.info(f"[{request_uuid}/{item_processing_uuid}] Decompressed GZIP to JSON: {decompressed_gameplay_json_path} for {item_filename}")
-
-                    gameplay_frames_list = read_replay_data_file(decompressed_gameplay_json_path)
-                    if gameplay_frames_list is None:
-                        self.log.warning(f"[{request_uuid}/{item_processing_uuid}] Failed to read/parse decompressed JSON for {item_filename}. Skipping.")
-                        all_processed_replays_data[item_filename] = {"error": "Failed to read or parse decompressed gameplay data JSON."}
-                        continue
-
-                    if not isinstance(gameplay_frames_list, list) or len(gameplay_frames_list) == 0:
-                        self.log.warning(f"[{request_uuid}/{item_processing_uuid}] Decompressed data for {item_filename} is not a list or is empty. Skipping.")
-                        all_processed_replays_data[item_filename] = {"error": "Decompressed gameplay data is not in expected list format or is empty."}
-                        continue
-
-                    self.log.info(f"[{request_uuid}/{item_processing_uuid}] Parsing final replay object for {item_filename}...")
-                    parsed_single_replay_data = parse_replay_data(raw_replay_metadata, gameplay_frames_list[0])
-
-                    all_processed_replays_data[item_filename] = parsed_single_replay_data.to_dict()
-                    self.log.info(f"[{request_uuid}/{item_processing_uuid}] Successfully processed {item_filename}.")
-
-                except KeyError as e:
-                    self.log.error(f"[{request_uuid}/{item_processing_uuid}] Missing key during processing of {item_filename}: {e}", exc_info=True)
-                    all_processed_replays_data[item_filename] = {"error": f"Missing expected data key '{e}' for item {item_filename}."}
-                except Exception as e:
-                    self.log.error(f"[{request_uuid}/{item_processing_uuid}] Unhandled error processing item {item_filename}: {e}", exc_info=True)
-                    all_processed_replays_data[item_filename] = {"error": f"Unexpected server error processing item {item_filename}: {type(e).__name__}."}
-                finally:
-                    self.clean_up(item_temp_decompression_dir)
-
             if not all_processed_replays_data:
-                self.log.warning(f"[{request_uuid}] No replay items could be successfully processed from the archive.")
-                self.raise_error(code=400, message="No replay items in the archive could be successfully processed.")
+                self.raise_error(code=400, message="No replay item data (e.g., local-*.json) found in the archive's 'replays' folder.")
 
             self.log.info(f"[{request_uuid}] Processing complete. Returning data for {len(all_processed_replays_data)} item(s).")
-            return JSONResponse(content=all_processed_replays_data)
+            return all_processed_replays_data
 
         except HTTPException:
             raise
+        except UploadTooLargeError as e:
+            self.log.warning(f"[{request_uuid}] {e}")
+            self.raise_error(code=413, message=str(e))
+        except WorkerPoolFullError as e:
+            self.log.warning(f"[{request_uuid}] {e}")
+            self.raise_error(code=503, message="Server is busy processing other replays, please retry later.")
         except FileNotFoundError as e:
             self.log.error(f"[{request_uuid}] File not found error during global processing: {e}", exc_info=True)
             self.raise_error(code=404, message=f"A required file or directory was not found: {e.filename or e}")
         except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
             self.log.warning(f"[{request_uuid}] Invalid or unsupported ZIP/SCP file: {e}", exc_info=True)
             self.raise_error(code=400, message=f"The provided archive file is invalid or unsupported: {e}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.log.warning(f"[{request_uuid}] Malformed replay item JSON: {e}")
+            self.raise_error(code=400, message=f"A replay item (local-*.json) of the archive is not valid JSON: {e}")
         except KeyError as e:
             self.log.error(f"[{request_uuid}] Missing expected key in archive structure: {e}", exc_info=True)
             self.raise_error(code=400, message=f"Archive content is missing expected data or has incorrect structure (Global KeyError: {e}).")
@@ -261,109 +330,385 @@ class Client(FastAPI):
             self.log.error(f"[{request_uuid}] Unhandled global error in send_replay: {e}", exc_info=True)
             self.raise_error(code=500, message=f"An unexpected server error occurred: {type(e).__name__}.")
         finally:
-            self.log.info(f"[{request_uuid}] Cleaning up main temporary directory: {temp_dir_for_request}")
-            self.clean_up(temp_dir_for_request)
+            self.log.info(f"[{request_uuid}] Releasing workspace: {temp_dir_for_request}")
+            await asyncio.to_thread(self.workspaces.release, workspace)
 
-    async def replay_v1_handler(self, file: UploadFile = File(...)):
+    async def send_replay_batch(self, files: list[UploadFile] = File(default=[]), bundle: UploadFile | None = File(default=None), analytics: bool = False,
+                                verify: bool = False):
         """
-        Endpoint v1
+        Endpoint v2 batch: many archives in one request, as repeated "files" fields and/or a "bundle" zip of archives.
+        Returns {archive: {item: data}}; an archive that cannot be processed gets {"error": ...} like a failed item.
         """
-        self.log.info(f"Received file: {file.filename}")
-        if not file.filename.endswith('.zip') and not file.filename.endswith(".scp"):
-            self.raise_error(code=400, message="File must be a zip or a vaild sonolus collection archive.")
-            return
+        request_uuid = self.generate_uuid()
+        archives = {}
+        rejected = {}
+        unpacked = {}
 
-        session_uuid = self.generate_uuid()
-        file_location = Path(f"temp/{session_uuid}/")
+        try:
+            for file in files:
+                archive_name = file.filename
+                suffix = 2
+                while archive_name in archives or archive_name in rejected:
+                    archive_name = f"{file.filename}#{suffix}"
+                    suffix += 1
+                if not is_replay_archive_name(file.filename):
+                    rejected[archive_name] = {"error": "File must be a .zip or a .scp (Sonolus Collection Package) archive."}
+                    continue
+                file.file.seek(0)
+                archives[archive_name] = file.file
+
+            if bundle is not None:
+                self.log.info(f"[{request_uuid}] Unpacking archive bundle: {bundle.filename}")
+                bundle.file.seek(0)
+                unpacked = await asyncio.to_thread(unpack_archive_bundle, bundle.file)
+                archives.update({name: spool for name, spool in unpacked.items() if name not in archives and name not in rejected})
+
+            if not archives and not rejected:
+                self.raise_error(code=400, message="No replay archives were uploaded.")
+
+            self.log.info(f"[{request_uuid}] Received batch of {len(archives)} archive(s), {len(rejected)} rejected.")
+            with self.worker_pool.reserve():
+                all_archives_data = await process_archive_batch(self.worker_pool, archives, request_uuid, self.batch_parallelism,
+                                                              result_extras(analytics, verify))
+
+            all_archives_data.update(rejected)
+
+            self.log.info(f"[{request_uuid}] Batch complete. Returning data for {len(all_archives_data)} archive(s).")
+            with STAGE_SECONDS.time(stage="serialize"):
+                return ReplayJSONResponse(content=all_archives_data)
 
-        file_location.mkdir(parents=True, exist_ok=True)
+        except HTTPException:
+            raise
+        except WorkerPoolFullError as e:
+            self.log.warning(f"[{request_uuid}] {e}")
+            self.raise_error(code=503, message="Server is busy processing other replays, please retry later.")
+        except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+            self.log.warning(f"[{request_uuid}] Invalid or unsupported bundle file: {e}", exc_info=True)
+            self.raise_error(code=400, message=f"The provided bundle file is invalid or unsupported: {e}")
+        except Exception as e:
+            self.log.error(f"[{request_uuid}] Unhandled global error in send_replay_batch: {e}", exc_info=True)
+            self.raise_error(code=500, message=f"An unexpected server error occurred: {type(e).__name__}.")
+        finally:
+            for spool in unpacked.values():
+                spool.close()
 
-        with open(file_location / f"replay-data-{session_uuid}.scp", "wb") as f:
-            content = await file.read()
-            f.write(content)
-            f.close()
+    async def send_replay_index(self, file: UploadFile = File(...)):
+        """
+        Endpoint v2 index: only the metadata of every replay item, without touching the gameplay data.
+        The archive is kept under the returned handle for REPLAY_HANDLE_TTL seconds after its last use,
+        so GET /replayv2/index/{handle}/{item} can parse a single item later.
+        """
+        request_uuid = self.generate_uuid()
+        self.log.info(f"[{request_uuid}] Received file for indexing: {file.filename}")
 
-        f = next(file_location.glob("*.scp"), None)
-        if f is None:
-            self.log.warning(f"[{session_uuid}] Replay file not found in the uploaded archive")
-            self.clean_up(file_location)
-            self.raise_error(code=502, message="Replay file not found in the uploaded archive.")
-            return
+        if not is_replay_archive_name(file.filename):
+            self.raise_error(code=400, message="File must be a .zip or a .scp (Sonolus Collection Package) archive.")
 
-        data = v1_extract_replay(f)
-        jsondata = v1_read_replay_data(data)
+        try:
+            handle = await asyncio.to_thread(self.archive_handles.open, file.file)
+        except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+            self.log.warning(f"[{request_uuid}] Invalid or unsupported ZIP/SCP file: {e}")
+            self.raise_error(code=400, message=f"The provided archive file is invalid or unsupported: {e}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.log.warning(f"[{request_uuid}] Malformed replay item JSON: {e}")
+            self.raise_error(code=400, message=f"A replay item (local-*.json) of the archive is not valid JSON: {e}")
+        except (KeyError, ReplayArchiveError) as e:
+            self.log.warning(f"[{request_uuid}] Unusable archive structure: {e}")
+            self.raise_error(code=400, message=f"Archive content is missing expected data or has incorrect structure: {e}")
+        except Exception as e:
+            self.log.error(f"[{request_uuid}] Unhandled global error in send_replay_index: {e}", exc_info=True)
+            self.raise_error(code=500, message=f"An unexpected server error occurred: {type(e).__name__}.")
 
-        if not jsondata:
-            self.log.warning(f"[{session_uuid}] Replay data not found in the uploaded archive.")
-            self.clean_up(file_location)
-            self.raise_error(code=400, message="Replay data not found in the uploaded archive.")
-            return
+        if not handle.items:
+            self.archive_handles.release(handle.handle)
+            self.raise_error(code=400, message="No replay item data (e.g., local-*.json) found in the archive's 'replays' folder.")
 
-        replay_data = v1_process_replay_files(jsondata)
-        gameplay_data_gzip = Path("." + replay_data.gameplay_data)
+        items = index_archive_items(handle.items)
+        self.log.info(f"[{request_uuid}] Indexed {len(items)} replay item(s) under handle {handle.handle}.")
+        return JSONResponse(content={"handle": handle.handle, "expiresIn": handle.ttl, "items": items})
 
-        if not gameplay_data_gzip.exists():
-            self.clean_up(file_location)
-            self.raise_error(code=400, message="Gameplay data file not found in the uploaded archive.")
-            return
+    async def send_indexed_replay(self, handle: str, item_filename: str, analytics: bool = False, verify: bool = False):
+        """
+        Endpoint v2 index: parse one replay item of an indexed archive
+        """
+        archive_handle = self.archive_handles.get(handle)
+        if archive_handle is None:
+            self.raise_error(code=404, message="Unknown or expired archive handle.")
+
+        try:
+            with self.worker_pool.reserve():
+                result = await process_handle_item(self.worker_pool, archive_handle, item_filename, handle, result_extras(analytics, verify))
+        except WorkerPoolFullError as e:
+            self.log.warning(f"[{handle}] {e}")
+            self.raise_error(code=503, message="Server is busy processing other replays, please retry later.")
+
+        if result is None:
+            self.raise_error(code=404, message=f"Replay item {item_filename} not found under this handle.")
+        if "error" in result:
+            self.raise_error(code=400, message=result["error"])
+
+        with STAGE_SECONDS.time(stage="serialize"):
+            return ReplayJSONResponse(content=result)
+
+    async def release_replay_index(self, handle: str):
+        """
+        Endpoint v2 index: drop an archive handle before it expires
+        """
+        if not self.archive_handles.release(handle):
+            self.raise_error(code=404, message="Unknown or expired archive handle.")
+        return JSONResponse(content={"released": handle})
+
+    def get_replay_session(self, request: Request, session_uuid: str) -> ReplaySession:
+        session = self.session.get(session_uuid)
+        if not isinstance(session, ReplaySession) or not session.get():
+            self.raise_error(code=404, message="Unknown or expired session.")
+        if session.ip_address != (request.client.host if request.client else None):
+            self.raise_error(code=403, message="Forbidden: Session belongs to another client.")
+        return session
+
+    def store_replay_session(self, session: ReplaySession):
+        for expired_uuid in [key for key, value in self.session.items() if value.is_expired()]:
+            self.session.pop(expired_uuid).delete()
+        replay_sessions = [value for value in self.session.values() if isinstance(value, ReplaySession)]
+        for oldest in sorted(replay_sessions, key=lambda value: value.timestamp)[:max(0, len(replay_sessions) - self.max_sessions + 1)]:
+            self.session.pop(oldest.session_uuid).delete()
+        self.session[session.session_uuid] = session
+
+    async def create_replay_session(self, request: Request, file: UploadFile = File(...)):
+        """
+        Endpoint v2 session: parse an archive and keep its replays server-side for REPLAY_SESSION_TTL seconds
+        (refreshed on every query), so clients can seek with GET /replayv2/session/{session}/{item}?start=&end=
+        instead of downloading and replaying the full inputs.
+        """
+        session_uuid = self.generate_uuid()
+        self.log.info(f"[{session_uuid}] Received file for a replay session: {file.filename}")
+
+        if not is_replay_archive_name(file.filename):
+            self.raise_error(code=400, message="File must be a .zip or a .scp (Sonolus Collection Package) archive.")
+
+        try:
+            file.file.seek(0)
+            with self.worker_pool.reserve():
+                results = await process_archive_coalesced(self.worker_pool, file.file, session_uuid)
+        except WorkerPoolFullError as e:
+            self.log.warning(f"[{session_uuid}] {e}")
+            self.raise_error(code=503, message="Server is busy processing other replays, please retry later.")
+        except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+            self.log.warning(f"[{session_uuid}] Invalid or unsupported ZIP/SCP file: {e}")
+            self.raise_error(code=400, message=f"The provided archive file is invalid or unsupported: {e}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.log.warning(f"[{session_uuid}] Malformed replay item JSON: {e}")
+            self.raise_error(code=400, message=f"A replay item (local-*.json) of the archive is not valid JSON: {e}")
+        except (KeyError, ReplayArchiveError) as e:
+            self.log.warning(f"[{session_uuid}] Unusable archive structure: {e}")
+            self.raise_error(code=400, message=f"Archive content is missing expected data or has incorrect structure: {e}")
+        except Exception as e:
+            self.log.error(f"[{session_uuid}] Unhandled global error in create_replay_session: {e}", exc_info=True)
+            self.raise_error(code=500, message=f"An unexpected server error occurred: {type(e).__name__}.")
+
+        if not results:
+            self.raise_error(code=400, message="No replay item data (e.g., local-*.json) found in the archive's 'replays' folder.")
+
+        def build_timelines():
+            return {name: ReplayTimeline.from_result(result) for name, result in results.items() if "error" not in result}
+
+        timelines = await asyncio.to_thread(build_timelines)
+        session = ReplaySession(
+            session_uuid, request.client.host if request.client else None, ReplaySession.get_current_timestamp(), timelines, self.session_ttl
+        )
+        self.store_replay_session(session)
+
+        items = {
+            name: {"metadata": result["metadata"], "count": len(timelines[name]), "duration": timelines[name].duration}
+            if name in timelines else result
+            for name, result in results.items()
+        }
+        self.log.info(f"[{session_uuid}] Replay session created with {len(timelines)} replay(s).")
+        return JSONResponse(content={"session": session_uuid, "expiresIn": self.session_ttl, "items": items})
 
-        file_replay = v1_decompress_gzip_file(gameplay_data_gzip, file_location)
+    async def send_replay_window(self, request: Request, session_uuid: str, item_filename: str,
+                                 start: float = 0.0, end: float | None = None, limit: int = 10000, cursor: int | None = None):
+        """
+        Endpoint v2 session: the events with start <= time < end (decoded, absolute times), plus the combo,
+        max combo and judgment counts right before ``start``. At most ``limit`` events, continue with ?cursor=<nextCursor>.
+        """
+        session = self.get_replay_session(request, session_uuid)
+        timeline = session.timelines.get(item_filename)
+        if timeline is None:
+            self.raise_error(code=404, message=f"Replay item {item_filename} not found in this session.")
+        if end is None:
+            end = float("inf")
+        if end < start or limit <= 0 or (cursor is not None and cursor < 0):
+            self.raise_error(code=400, message="Expected start <= end, a positive limit and a non-negative cursor.")
+
+        window = timeline.window(start, end, limit, cursor)
+        if window["end"] == float("inf"):
+            window["end"] = None
+        return JSONResponse(content=window)
+
+    async def delete_replay_session(self, request: Request, session_uuid: str):
+        """
+        Endpoint v2 session: drop a replay session before it expires
+        """
+        self.get_replay_session(request, session_uuid)
+        self.session.pop(session_uuid).delete()
+        return JSONResponse(content={"deleted": session_uuid})
+
+    def get_library(self):
+        library = get_replay_library()
+        if library is None:
+            self.raise_error(code=404, message="The replay library is not enabled on this server.")
+        return library
+
+    async def list_library_replays(self, difficulty: str | None = None, level: str | None = None, mod: list[str] = Query(default=[]),
+                                   min_rating: int | None = None, max_rating: int | None = None, grade: str | None = None,
+                                   title: str | None = None, sort: str = "added", order: str = "desc", limit: int = 50, offset: int = 0):
+        """
+        Endpoint library: stored replays, filtered (every ?mod= must be present), sorted and paginated.
+        Replays are stored automatically when REPLAY_LIBRARY_PATH is set.
+        """
+        library = self.get_library()
+        if order not in ("asc", "desc"):
+            self.raise_error(code=400, message="order must be 'asc' or 'desc'.")
+        try:
+            page = await asyncio.to_thread(
+                library.query, difficulty, level, mod, min_rating, max_rating, grade, title, sort, order == "desc", limit, offset
+            )
+        except ValueError as e:
+            self.raise_error(code=400, message=str(e))
+        return JSONResponse(content=page)
+
+    async def send_library_replay(self, replay_id: str, inputs: bool = True):
+        """
+        Endpoint library: one stored replay in the /replayv2 item shape
+        """
+        library = self.get_library()
+        replay = await asyncio.to_thread(library.get, replay_id, inputs)
+        if replay is None:
+            self.raise_error(code=404, message=f"Replay {replay_id} not found in the library.")
+        return JSONResponse(content=replay)
 
-        if not file_replay:
-            self.log.warning(f"[{session_uuid}] Failed to decompress gameplay data file.")
-            self.clean_up(file_location)
-            self.raise_error(code=400, message="Failed to decompress / search for replay data.")
+    async def replay_v1_handler(self, file: UploadFile = File(...), verify: bool = False):
+        """
+        Endpoint v1: only the first replay of the archive, served by the same in-memory engine as v2
+        """
+        self.log.info(f"Received file: {file.filename}")
+        if not file.filename.endswith('.zip') and not file.filename.endswith(".scp"):
+            self.raise_error(code=400, message="File must be a zip or a vaild sonolus collection archive.")
             return
 
-        replay_data_rel = v1_read_replay_data_file(Path(file_replay))
-        final_data = v1_parse_replay_data(replay_data, replay_data_rel[0])
+        session_uuid = self.generate_uuid()
 
-        self.clean_up(file_location)
+        try:
+            file.file.seek(0)
+            with self.worker_pool.reserve():
+                final_data = await process_archive_v1(self.worker_pool, file.file, session_uuid, result_extras(verify=verify))
+        except WorkerPoolFullError as e:
+            self.log.warning(f"[{session_uuid}] {e}")
+            self.raise_error(code=503, message="Server is busy processing other replays, please retry later.")
+            return
+        except ReplayArchiveError as e:
+            self.log.warning(f"[{session_uuid}] {e}")
+            self.raise_error(code=400, message=str(e))
+            return
+        except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+            self.log.warning(f"[{session_uuid}] Invalid or unsupported ZIP/SCP file: {e}")
+            self.raise_error(code=400, message=f"The provided archive file is invalid or unsupported: {e}")
+            return
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.log.warning(f"[{session_uuid}] Malformed replay item JSON: {e}")
+            self.raise_error(code=400, message=f"A replay item (local-*.json) of the archive is not valid JSON: {e}")
+            return
+        except KeyError as e:
+            self.log.warning(f"[{session_uuid}] Unusable archive structure: {e}")
+            self.raise_error(code=400, message=f"Archive content is missing expected data or has incorrect structure: {e}")
+            return
+        except Exception as e:
+            self.log.error(f"[{session_uuid}] Unhandled global error in replay_v1_handler: {e}", exc_info=True)
+            self.raise_error(code=500, message=f"An unexpected server error occurred: {type(e).__name__}.")
+            return
 
-        return JSONResponse(content=final_data.to_dict())
+        with STAGE_SECONDS.time(stage="serialize"):
+            return ReplayJSONResponse(content=final_data)
 
-    async def get_log(self, authentication_key: str = None):
+    async def get_log(self, request: Request, authentication_key: str = None, tail: int | None = None,
+                      start: int | None = None, end: int | None = None, level: str | None = None,
+                      backup: int = 0, stream: bool = False):
         """
         Endpoint to get the log, requires authentication
+
+        tail: only the last N lines, start/end: byte range [start, end) of the file,
+        level: only records of this level and above (e.g. WARNING), backup: rotated file (1 = most recent).
+        With ?stream=true or "Accept: text/plain" the log is streamed as plain text, otherwise it is returned as {"log": ...}.
+        The X-Log-Size/X-Log-End headers tell where to continue reading from.
         """
 
         if authentication_key != os.environ.get("ADMIN_KEY"):
             self.raise_error(code=403, message="Forbidden: Invalid authentication.")
             return
 
-        log_path = Path("./.logs")
-        if not log_path.exists():
+        if not LOG_DIR.exists():
             self.raise_error(code=404, message="Log file not found.")
             return
 
-        log_files = list(log_path.glob("*.log"))
-        if not log_files:
+        log_file = log_file_path(backup)
+        if backup < 0 or not log_file.is_file():
             self.raise_error(code=404, message="No log files found.")
             return
 
-        with open(log_files[0], "r") as f:
-            log_content = f.read()
-            if not log_content:
-                self.raise_error(code=404, message="Log file is empty.")
+        min_level = NOTSET
+        if level is not None:
+            min_level = parse_level(level)
+            if min_level is None:
+                self.raise_error(code=400, message=f"Unknown log level '{level}'.")
                 return
 
+        size = log_file.stat().st_size
+        range_end = size if end is None else max(0, min(end, size))
+        range_start = 0 if start is None else max(0, min(start, range_end))
+        if tail is not None:
+            range_start = max(range_start, await asyncio.to_thread(tail_offset, log_file, tail, range_end))
 
+        if level is not None:
+            chunks = iter_log_records(log_file, range_start, range_end, min_level)
+        else:
+            chunks = iter_log_bytes(log_file, range_start, range_end)
+        headers = {"X-Log-Size": str(size), "X-Log-Start": str(range_start), "X-Log-End": str(range_end)}
 
-        return JSONResponse(content={"log": log_content})
+        if stream or "text/plain" in request.headers.get("accept", ""):
+            return StreamingResponse(chunks, media_type="text/plain; charset=utf-8", headers=headers)
 
-def keep_alive():
-    """
-    Keep the server alive
-    """
-    try:
-        while True:
-            logger.debug("Still Alive...")
-            time.sleep(40)
-    except KeyboardInterrupt:
-        pass
+        log_content = await asyncio.to_thread(lambda: b"".join(chunks).decode("utf-8", errors="replace"))
+        if not log_content and size == 0:
+            self.raise_error(code=404, message="Log file is empty.")
+            return
+
+        return JSONResponse(content={"log": log_content}, headers=headers)
+
+    async def cache_stats(self, authentication_key: str = None):
+        """
+        Endpoint to get the parsed replay cache hit/miss counters, requires authentication
+        """
+
+        if authentication_key != os.environ.get("ADMIN_KEY"):
+            self.raise_error(code=403, message="Forbidden: Invalid authentication.")
+            return
+
+        return JSONResponse(content=get_replay_cache().stats())
+
+    async def metrics(self, authentication_key: str = None):
+        """
+        Endpoint to get the pipeline metrics in Prometheus text format, requires authentication
+        """
+
+        if authentication_key != os.environ.get("ADMIN_KEY"):
+            self.raise_error(code=403, message="Forbidden: Invalid authentication.")
+            return
+
+        return Response(content=REGISTRY.render(), media_type=PROMETHEUS_MEDIA_TYPE)
 
 if __name__ == '__main__':
     logger = getLogger(__name__)
     logger.info("Starting server on port 8000 using uvicorn...")
-    threading.Thread(target=keep_alive, daemon=True).start()
-    uvicorn.run(Client, factory=True, host="0.0.0.0", port=8000, log_config=setup_logging.LOGGING_CONFIG)
\ No newline at end of file
+    # Logging is already configured by setup_logger(), uvicorn's loggers propagate to it
+    uvicorn.run(Client, factory=True, host="0.0.0.0", port=8000, log_config=None)
\ No newline at end of file
@@ -0,0 +1,111 @@
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import pathlib
+import random
+import zipfile
+
+JUDGMENT_WEIGHTS = {1: 70, 2: 15, 3: 5, 0: 10} # perfect, great, good, miss
+DIFFICULTIES = ("EASY", "NORMAL", "HARD", "EXPERT", "MASTER", "APPEND")
+
+def generate_replay_frame(n_inputs: int, rng: random.Random) -> dict:
+    """
+    Gameplay frame like the ones stored gzipped under sonolus/repository/<hash>: result plus delta encoded inputs.
+    """
+    judgment = rng.choices(list(JUDGMENT_WEIGHTS), weights=list(JUDGMENT_WEIGHTS.values()), k=n_inputs)
+    time = [round(rng.uniform(0.05, 0.5), 6) for _ in range(n_inputs)]
+    accuracy = [round(rng.gauss(0, 0.03), 6) if value else 0.0 for value in judgment]
+
+    combo = max_combo = 0
+    for value in judgment:
+        combo = combo + 1 if value in (1, 2) else 0
+        max_combo = max(max_combo, combo)
+
+    return {
+        "startTime": 1700000000000,
+        "saveTime": 1700000000000 + int(sum(time) * 1000),
+        "duration": round(sum(time) + 2.0, 3),
+        "inputOffset": 0,
+        "result": {
+            "grade": "A",
+            "arcadeScore": rng.randint(900000, 1010000),
+            "accuracyScore": round(rng.uniform(90, 101), 4),
+            "combo": max_combo,
+            "perfect": judgment.count(1),
+            "great": judgment.count(2),
+            "good": judgment.count(3),
+            "miss": judgment.count(0),
+            "totalCount": n_inputs
+        },
+        "inputs": {
+            "entityIndex": list(range(n_inputs)),
+            "time": time,
+            "judgment": judgment,
+            "accuracy": accuracy
+        }
+    }
+
+def generate_replay_item(index: int, gameplay_url: str, thumbnail_url: str, rng: random.Random) -> dict:
+    """
+    sonolus/replays/local-* item JSON with the keys utils.v2.process_replay_files reads.
+    """
+    return {
+        "item": {
+            "name": f"local-{index}",
+            "version": 1,
+            "title": f"Synthetic replay {index}",
+            "tags": [{"title": "Level Speed 120%"}, {"title": "Hidden 50%"}] if index % 2 else [],
+            "level": {
+                "name": f"level-{index}",
+                "title": f"Synthetic level {index}",
+                "rating": rng.randint(5, 40),
+                "tags": [{"title": f"#{rng.choice(DIFFICULTIES)}"}],
+                "engine": {"name": "pjsekai", "thumbnail": {"url": thumbnail_url}}
+            },
+            "data": {"url": gameplay_url}
+        }
+    }
+
+def generate_collection(replays: int = 3, inputs: int = 1000, assets: int = 0, asset_bytes: int = 0, seed: int = 0) -> bytes:
+    """
+    Synthetic Sonolus collection package (.scp and .zip share the layout): ``replays`` items under
+    sonolus/replays/local-*, their gzipped gameplay frames under sonolus/repository/<hash>, and
+    ``assets`` extra random repository files of ``asset_bytes`` each (thumbnails, charts, ...)
+    that the parser has to skip over. The same arguments always produce the same bytes.
+    """
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        thumbnail_url = ""
+        for index in range(assets):
+            asset = rng.randbytes(asset_bytes)
+            asset_hash = hashlib.sha1(asset).hexdigest()
+            archive.writestr(f"sonolus/repository/{asset_hash}", asset)
+            thumbnail_url = thumbnail_url or f"/sonolus/repository/{asset_hash}"
+
+        for index in range(replays):
+            blob = gzip.compress((json.dumps(generate_replay_frame(inputs, rng)) + "\n").encode("utf-8"), mtime=0)
+            blob_hash = hashlib.sha1(blob).hexdigest()
+            archive.writestr(f"sonolus/repository/{blob_hash}", blob)
+            item = generate_replay_item(index, f"/sonolus/repository/{blob_hash}", thumbnail_url, rng)
+            archive.writestr(f"sonolus/replays/local-{index}", json.dumps(item))
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Sonolus collection package.")
+    parser.add_argument("output", type=pathlib.Path, help="output .scp or .zip file")
+    parser.add_argument("--replays", type=int, default=3, help="replay items in the package")
+    parser.add_argument("--inputs", type=int, default=1000, help="inputs per replay")
+    parser.add_argument("--assets", type=int, default=0, help="extra repository files")
+    parser.add_argument("--asset-bytes", type=int, default=0, help="size of every extra repository file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = generate_collection(args.replays, args.inputs, args.assets, args.asset_bytes, args.seed)
+    args.output.write_bytes(data)
+    print(f"Wrote {args.output} ({len(data)} bytes, {args.replays} replay(s) x {args.inputs} inputs)")
+
+if __name__ == "__main__":
+    main()
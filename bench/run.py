@@ -0,0 +1,215 @@
+import argparse
+import json
+import multiprocessing
+import os
+import pathlib
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# name: (replays, inputs per replay, extra assets, bytes per asset)
+SCENARIOS = {
+    "small": (3, 1000, 0, 0),
+    "many-replays": (50, 500, 0, 0),
+    "long-replays": (4, 20000, 0, 0),
+    "heavy-assets": (3, 1000, 20, 512 * 1024)
+}
+
+def timed(fn, repeat: int) -> dict:
+    """
+    Run ``fn`` ``repeat`` times, return the median and best wall time in seconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {"median": statistics.median(samples), "min": min(samples)}
+
+def peak_rss_bytes() -> int | None:
+    try:
+        import resource
+    except ImportError: # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def bench_pipeline(data: bytes, repeat: int) -> dict:
+    """
+    Time every pipeline function on its own, over all replay items of the package.
+    """
+    from utils.v2 import decode_gzip_data, parse_replay_data, process_replay_files
+    from utils.engine import open_archive_items, read_replay_item_blob, process_archive
+    from utils.analytics import compute_replay_analytics
+    from utils.encoding import JSON_MEDIA_TYPE, REPLAY_FRAME_MEDIA_TYPE, encode_results
+    import io
+
+    archive, items = open_archive_items(io.BytesIO(data))
+    with archive:
+        blobs = {name: read_replay_item_blob(archive, item) for name, item in items.items()}
+        metadata = {name: process_replay_files(item) for name, item in items.items()}
+        frames = {name: decode_gzip_data(blob) for name, blob in blobs.items()}
+        parsed = {name: parse_replay_data(metadata[name], frames[name]) for name in items}
+        results = {name: replay.to_dict() for name, replay in parsed.items()}
+
+        def open_and_list():
+            opened, _ = open_archive_items(io.BytesIO(data))
+            opened.close()
+
+        timings = {
+            "open_archive": timed(open_and_list, repeat),
+            "read_member": timed(lambda: [read_replay_item_blob(archive, item) for item in items.values()], repeat),
+            "metadata": timed(lambda: [process_replay_files(item) for item in items.values()], repeat),
+            "decompress": timed(lambda: [decode_gzip_data(blob) for blob in blobs.values()], repeat),
+            "parse": timed(lambda: [parse_replay_data(metadata[name], frames[name]) for name in items], repeat),
+            "to_dict": timed(lambda: [replay.to_dict() for replay in parsed.values()], repeat),
+            "analytics": timed(lambda: [compute_replay_analytics(replay.replay) for replay in parsed.values()], repeat),
+            "encode_json": timed(lambda: encode_results(results, JSON_MEDIA_TYPE), repeat),
+            "encode_frame": timed(lambda: encode_results(results, REPLAY_FRAME_MEDIA_TYPE), repeat),
+            "process_archive": timed(lambda: process_archive(archive), repeat)
+        }
+    return timings
+
+def bench_endpoint(data: bytes, repeat: int, keep_logging: bool) -> dict:
+    """
+    Full POST /replayv2 path through an in-process ASGI test client, with the per-stage breakdown
+    taken from the /metrics histograms.
+    """
+    import logging
+    from fastapi.testclient import TestClient
+    import api_handler
+    from utils.metrics import STAGE_SECONDS
+
+    if not keep_logging:
+        logging.disable(logging.CRITICAL)
+
+    with TestClient(api_handler.Client()) as client:
+        def post():
+            response = client.post("/replayv2", files={"file": ("bench.scp", data, "application/octet-stream")})
+            response.raise_for_status()
+
+        post() # warm up imports, worker pool and lazily created singletons
+        before = STAGE_SECONDS.totals()
+        timing = timed(post, repeat)
+        after = STAGE_SECONDS.totals()
+
+    stages = {}
+    for key, (count, total) in after.items():
+        previous_count, previous_total = before.get(key, (0, 0.0))
+        if count > previous_count:
+            stages[key[0]] = {"seconds_per_request": (total - previous_total) / repeat, "calls_per_request": (count - previous_count) / repeat}
+    return {**timing, "stages": stages}
+
+def run_scenario(name: str, repeat: int, archive_mode: str, worker_mode: str, keep_logging: bool) -> dict:
+    """
+    Runs in a fresh process, so the peak RSS belongs to this scenario alone.
+    """
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+    # Every request must go through the full pipeline
+    os.environ["REPLAY_CACHE_MEMORY_BYTES"] = "0"
+    os.environ["REPLAY_CACHE_DISK_BYTES"] = "0"
+    os.environ["REPLAY_ARCHIVE_MODE"] = archive_mode
+    os.environ["REPLAY_WORKER_MODE"] = worker_mode
+    os.environ.setdefault("REPLAY_MAX_UPLOAD_BYTES", "0")
+    os.environ.setdefault("REPLAY_IP_RATE", "0") # one client posts back to back
+
+    from bench.generate import generate_collection
+
+    replays, inputs, assets, asset_bytes = SCENARIOS[name]
+    data = generate_collection(replays, inputs, assets, asset_bytes)
+    pipeline = bench_pipeline(data, repeat)
+    endpoint = bench_endpoint(data, repeat, keep_logging)
+
+    seconds = endpoint["median"]
+    return {
+        "package_bytes": len(data),
+        "replays": replays,
+        "inputs_per_replay": inputs,
+        "pipeline": pipeline,
+        "endpoint": endpoint,
+        "throughput": {
+            "archives_per_second": 1 / seconds,
+            "replays_per_second": replays / seconds,
+            "inputs_per_second": replays * inputs / seconds,
+            "megabytes_per_second": len(data) / seconds / (1024 * 1024)
+        },
+        "peak_rss_bytes": peak_rss_bytes()
+    }
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Print median time changes against a baseline run and return the timings that got slower by more than ``threshold``.
+    """
+    regressions = []
+    print(f"\n{'scenario':<14} {'timing':<18} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, scenario in results["scenarios"].items():
+        base_scenario = baseline.get("scenarios", {}).get(name)
+        if base_scenario is None:
+            continue
+        pairs = [(f"pipeline.{key}", value["median"], base_scenario["pipeline"].get(key, {}).get("median")) for key, value in scenario["pipeline"].items()]
+        pairs.append(("endpoint", scenario["endpoint"]["median"], base_scenario["endpoint"]["median"]))
+        for label, current, previous in pairs:
+            if not previous:
+                continue
+            change = current / previous - 1
+            marker = " !" if change > threshold else ""
+            print(f"{name:<14} {label:<18} {previous * 1000:>9.2f}ms {current * 1000:>9.2f}ms {change:>+7.1%}{marker}")
+            if change > threshold:
+                regressions.append(f"{name}/{label}")
+    return regressions
+
+def report(results: dict):
+    for name, scenario in results["scenarios"].items():
+        endpoint = scenario["endpoint"]
+        throughput = scenario["throughput"]
+        rss = scenario["peak_rss_bytes"]
+        print(f"\n== {name}: {scenario['replays']} replay(s) x {scenario['inputs_per_replay']} inputs, {scenario['package_bytes'] / 1024:.0f} KiB")
+        peak = f" | peak RSS {rss / (1024 * 1024):.1f} MiB" if rss else ""
+        print(f"POST /replayv2: {endpoint['median'] * 1000:.2f}ms median, {endpoint['min'] * 1000:.2f}ms best | "
+              f"{throughput['replays_per_second']:.1f} replays/s, {throughput['megabytes_per_second']:.2f} MiB/s{peak}")
+        print("  stages (per request):")
+        for stage, values in endpoint["stages"].items():
+            print(f"    {stage:<14} {values['seconds_per_request'] * 1000:>9.2f}ms  x{values['calls_per_request']:.0f}")
+        print("  pipeline functions (all replays, median):")
+        for key, values in scenario["pipeline"].items():
+            print(f"    {key:<16} {values['median'] * 1000:>9.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the replay pipeline on synthetic Sonolus collections.")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="scenario to run, repeatable (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per measurement")
+    parser.add_argument("--archive-mode", default="memory", choices=("memory", "disk"))
+    parser.add_argument("--worker-mode", default="thread", choices=("thread", "process"))
+    parser.add_argument("--logging", action="store_true", help="keep application logging enabled while timing the endpoint")
+    parser.add_argument("--output", type=pathlib.Path, help="write the results as JSON, to be used as a later --baseline")
+    parser.add_argument("--baseline", type=pathlib.Path, help="results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown ratio reported as a regression (default: 0.10)")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": {"repeat": args.repeat, "archive_mode": args.archive_mode, "worker_mode": args.worker_mode, "logging": args.logging},
+        "scenarios": {}
+    }
+    for name in args.scenario or SCENARIOS:
+        print(f"Running {name}...", flush=True)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results["scenarios"][name] = executor.submit(run_scenario, name, args.repeat, args.archive_mode, args.worker_mode, args.logging).result()
+
+    report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} timing(s) slower than the baseline by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
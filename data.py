@@ -1,7 +1,7 @@
+from array import array
 from dataclasses import dataclass
-from typing import List
 
-@dataclass
+@dataclass(slots=True)
 class RawReplayData:
     name: str
     version: int
@@ -31,7 +31,7 @@ class RawReplayData:
     def __getitem__(self, item):
         return getattr(self, item)
 
-@dataclass
+@dataclass(slots=True)
 class ReplayResult:
     grade: str
     arcadeScore: int
@@ -43,14 +43,50 @@ class ReplayResult:
     miss: int
     totalCount: int
 
-@dataclass
+    def to_dict(self):
+        return {
+            "grade": self.grade,
+            "arcadeScore": self.arcadeScore,
+            "accuracyScore": self.accuracyScore,
+            "combo": self.combo,
+            "perfect": self.perfect,
+            "great": self.great,
+            "good": self.good,
+            "miss": self.miss,
+            "totalCount": self.totalCount
+        }
+
+@dataclass(slots=True)
 class Inputs:
-    entityIndex: List[int]
-    time: List[int]
-    judgment: List[int]
-    accuracy: List[int]
+    # Typed arrays instead of lists of boxed numbers, a long chart has tens of thousands of inputs
+    entityIndex: array # array("i")
+    time: array # array("d"), delta encoded
+    judgment: array # array("b")
+    accuracy: array # array("d")
+
+    def __len__(self):
+        return len(self.judgment)
+
+    def to_dict(self):
+        # The arrays themselves, not list copies: the pipeline reads them as buffers and
+        # utils.encoding.json_default turns them into lists only when a response is serialized
+        return {
+            "entityIndex": self.entityIndex,
+            "time": self.time,
+            "judgment": self.judgment,
+            "accuracy": self.accuracy
+        }
+
+    @classmethod
+    def parser(cls, data) -> "Inputs":
+        return cls(
+            entityIndex=array("i", data["entityIndex"]),
+            time=array("d", data["time"]),
+            judgment=array("b", data["judgment"]),
+            accuracy=array("d", data["accuracy"])
+        )
 
-@dataclass
+@dataclass(slots=True)
 class ReplayDataRel:
     startTime: int
     saveTime: int
@@ -65,8 +101,8 @@ class ReplayDataRel:
             "saveTime": self.saveTime,
             "duration": self.duration,
             "inputOffset": self.inputOffset,
-            "result": self.result.__dict__,
-            "inputs": self.inputs.__dict__
+            "result": self.result.to_dict(),
+            "inputs": self.inputs.to_dict()
         }
 
     @classmethod
@@ -77,10 +113,10 @@ class ReplayDataRel:
             duration=data["duration"],
             inputOffset=data["inputOffset"],
             result=ReplayResult(**data["result"]),
-            inputs=Inputs(**data["inputs"])
+            inputs=Inputs.parser(data["inputs"])
         )
 
-@dataclass
+@dataclass(slots=True)
 class MetaData:
     name: str
     version: int
@@ -116,7 +152,7 @@ class MetaData:
             thumbnail=data["thumbnail"]
         )
 
-@dataclass
+@dataclass(slots=True)
 class ReplayData:
     meta: MetaData
     replay: ReplayDataRel
@@ -126,17 +162,7 @@ class ReplayData:
         return {
             "metadata": self.meta.to_dict(),
             "replay": self.replay.to_dict(),
-            "result": {
-                "grade": self.result.grade,
-                "arcadeScore": self.result.arcadeScore,
-                "accuracyScore": self.result.accuracyScore,
-                "combo": self.result.combo,
-                "perfect": self.result.perfect,
-                "great": self.result.great,
-                "good": self.result.good,
-                "miss": self.result.miss,
-                "totalCount": self.result.totalCount
-            }
+            "result": self.result.to_dict()
         }
 
     @classmethod
@@ -1,10 +1,21 @@
+import argparse
 import json
+import pathlib
+import sched
 import time
 
+import numpy as np
+
+JUDGMENT_MAP = {0: "Miss", 1: "Perfect", 2: "Great", 3: "Good"}
+
 def decode_delta(delta_array):
     if not isinstance(delta_array, (list, tuple)):
         print(f"Warning: decode_delta received non-list input: {type(delta_array)}. Returning empty list.")
         return []
+    try:
+        return np.cumsum(np.asarray(delta_array, dtype=np.float64)).tolist()
+    except (ValueError, TypeError):
+        pass # some values are not numbers, fall back to converting them one by one
     decoded = []
     current_value = 0.0
     for delta in delta_array:
@@ -32,7 +43,7 @@ def load_replay(filepath):
         if isinstance(replay_data_list, list) and len(replay_data_list) > 0:
             return replay_data_list[0]
         elif isinstance(replay_data_list, dict):
-            print(f"Warning: JSON root is an object, not a list as expected. Using the object directly.")
+            print("Warning: JSON root is an object, not a list as expected. Using the object directly.")
             return replay_data_list
         else:
             print(f"Warning: Unexpected JSON structure in {filepath}.")
@@ -56,23 +67,27 @@ def _accuracy(score) -> float:
     return (score / default) * 100
 
 
-def run_viewer(replay_data):
+def prepare_events(replay_data):
+    """
+    Validate the replay and return its events ordered by time as arrays
+    (index, time, judgment, accuracy), or None if the replay cannot be played.
+    """
     if not replay_data:
         print("Cannot run viewer, invalid replay data provided.")
-        return
+        return None
 
     try:
         if 'inputs' not in replay_data or 'time' not in replay_data['inputs']:
             print("Error: Replay data is missing 'inputs' or 'inputs.time'")
-            return
+            return None
         decoded_times = decode_delta(replay_data['inputs']['time'])
 
         if 'judgment' not in replay_data['inputs'] or 'accuracy' not in replay_data['inputs']:
             print("Error: Replay data is missing 'inputs.judgment' or 'inputs.accuracy'")
-            return
+            return None
         if 'duration' not in replay_data:
             print("Error: Replay data is missing 'duration'")
-            return
+            return None
 
         judgments = replay_data['inputs']['judgment']
         accuracies = replay_data['inputs']['accuracy']
@@ -84,86 +99,107 @@ def run_viewer(replay_data):
             judgments = judgments[:min_len]
             accuracies = accuracies[:min_len]
             print(f"Warning: Truncating input arrays to minimum length: {min_len}")
-            if min_len == 0: return
+
+        times = np.asarray(decoded_times, dtype=np.float64)
+        order = np.argsort(times, kind="stable")
+        return {
+            "index": order,
+            "time": times[order],
+            "judgment": np.asarray(judgments, dtype=np.int64)[order],
+            "accuracy": np.asarray(accuracies, dtype=np.float64)[order]
+        }
 
     except KeyError as e:
         print(f"Error: Missing expected key: {e}")
-        return
+        return None
     except Exception as e:
         print(f"An error occurred during data preparation: {e}")
-        return
-
-    processed_inputs = []
-    for i in range(len(decoded_times)):
-        processed_inputs.append({
-            "index": i,
-            "time": decoded_times[i],
-            "judgment": judgments[i],
-            "accuracy": accuracies[i]
-        })
-
-    if not processed_inputs:
-        print("No input events to process.")
-        duration = replay_data.get('duration', 0)
-        print(f"--- Replay (Duration: {duration:.2f}s) ---")
-        print("--- No input events ---")
-        if 'result' in replay_data: print(f"Final Result: {replay_data['result']}")
-        return
-
-    processed_inputs.sort(key=lambda x: x['time'])
-
-    duration = replay_data['duration']
-    start_real_time = time.time()
-    current_replay_time = 0.0
-    next_event_index = 0
-    combo = 0
-    max_combo = 0
-
-    judgment_map = {0: "Miss", 1: "Perfect", 2: "Great", 3: "Good"}
+        return None
 
-    print(f"--- Starting Replay (Duration: {duration:.2f}s) ---")
-    print("!!! TESTING: player-v2 !!!")
+def compute_combo(judgments):
+    """
+    Combo before and after every event and the running max combo, for the whole replay at once.
+    Perfect/Great add one, Miss/Good reset it, unknown judgments leave it unchanged.
+    """
+    hits = np.cumsum((judgments == 1) | (judgments == 2))
+    resets = (judgments == 0) | (judgments == 3)
+    combo_after = hits - np.maximum.accumulate(np.where(resets, hits, 0))
+    combo_before = np.concatenate(([0], combo_after[:-1])) if len(combo_after) else combo_after
+    max_combo = np.maximum.accumulate(combo_after) if len(combo_after) else combo_after
+    return combo_before, combo_after, max_combo
+
+def format_event(events, table, i) -> str:
+    combo_before, combo_after, max_combo = table
+    judg_val = int(events['judgment'][i])
+    judg_text = JUDGMENT_MAP.get(judg_val, "Unknown")
+    return (f"{int(events['index'][i]):<3} | {events['time'][i]:<7.3f} | {judg_val:<10} | {judg_text:<8} | "
+            f"{events['accuracy'][i]:<+8.4f} | {int(combo_before[i]):<12} | {int(combo_after[i]):<11} | {int(max_combo[i])}")
+
+def print_table_header():
     print("Idx | Time    | Judg Value | Judgment | Accuracy | Combo Before | Combo After | Combo ")
     print("----|---------|------------|----------|----------|--------------|-------------|-------")
 
-    while current_replay_time <= duration:
-        current_real_time = time.time()
-        current_replay_time = current_real_time - start_real_time
-        time.sleep(0.001)
-
-        while next_event_index < len(processed_inputs) and \
-                processed_inputs[next_event_index]['time'] <= current_replay_time:
+def print_no_events(replay_data):
+    print("No input events to process.")
+    duration = replay_data.get('duration', 0)
+    print(f"--- Replay (Duration: {duration:.2f}s) ---")
+    print("--- No input events ---")
+    if 'result' in replay_data: print(f"Final Result: {replay_data['result']}")
+
+def run_headless(replay_data, print_table=False):
+    """
+    Compute the same per-event table, combo and max combo as run_viewer, as fast as the CPU allows.
+    Returns a summary dict, or None if the replay cannot be played.
+    """
+    events = prepare_events(replay_data)
+    if events is None:
+        return None
 
-            event = processed_inputs[next_event_index]
-            original_idx = event['index']
-            judg_val = event['judgment']
-            judg_text = judgment_map.get(judg_val, f"Unknown")
-            accuracy = event['accuracy']
-            combo_before = combo
+    table = compute_combo(events['judgment'])
+    if print_table:
+        print_table_header()
+        print("\n".join(format_event(events, table, i) for i in range(len(events['time']))))
 
-            match judg_val:
-                case 0:
-                    combo = 0
-                case 1:
-                    combo += 1
-                case 2:
-                    combo += 1
-                case 3:
-                    combo = 0
+    _, combo_after, max_combo = table
+    return {
+        "events": len(events['time']),
+        "duration": replay_data['duration'],
+        "maxCombo": int(max_combo[-1]) if len(max_combo) else 0,
+        "finalCombo": int(combo_after[-1]) if len(combo_after) else 0,
+        "judgmentCounts": {name: int(np.count_nonzero(events['judgment'] == value)) for value, name in JUDGMENT_MAP.items()}
+    }
 
-            max_combo = max(max_combo, combo)
+def run_viewer(replay_data):
+    """
+    Real-time playback: every event is printed when its replay time is reached, driven by a scheduler
+    that sleeps until the next event instead of polling.
+    """
+    events = prepare_events(replay_data)
+    if events is None:
+        return
+    if not len(events['time']):
+        print_no_events(replay_data)
+        return
 
-            print(f"{original_idx:<3} | {event['time']:<7.3f} | {judg_val:<10} | {judg_text:<8} | {accuracy:<+8.4f} | {combo_before:<12} | {combo:<11} | {max_combo}")
+    table = compute_combo(events['judgment'])
+    duration = replay_data['duration']
 
-            next_event_index += 1
+    print(f"--- Starting Replay (Duration: {duration:.2f}s) ---")
+    print("!!! TESTING: player-v2 !!!")
+    print_table_header()
 
-        if next_event_index >= len(processed_inputs) and current_replay_time > duration + 0.5:
-            print("\n--- Reached end of input events and duration ---")
-            break
+    scheduler = sched.scheduler(time.monotonic, time.sleep)
+    start_real_time = time.monotonic()
+    for i, event_time in enumerate(events['time']):
+        scheduler.enterabs(start_real_time + max(float(event_time), 0.0), 0, lambda i=i: print(format_event(events, table, i), flush=True))
+    scheduler.enterabs(start_real_time + max(duration, float(events['time'][-1])) + 0.5, 1,
+                       lambda: print("\n--- Reached end of input events and duration ---"))
+    scheduler.run()
 
-    end_real_time = time.time()
+    end_real_time = time.monotonic()
+    max_combo = int(table[2][-1])
 
-    print(f"\n--- Replay Finished ---")
+    print("\n--- Replay Finished ---")
     if 'result' in replay_data:
         print(f"Final Result (from data): {replay_data['result']}")
     else:
@@ -172,10 +208,47 @@ def run_viewer(replay_data):
     print(f"Max Combo (Live Calc): {max_combo}")
     print(f"Total Time: {end_real_time - start_real_time:.2f}s")
 
+def collect_replay_files(paths):
+    files = []
+    for path in map(pathlib.Path, paths):
+        files.extend(sorted(path.glob("*.json")) if path.is_dir() else [path])
+    return files
+
+def run_directory(paths, print_table=False):
+    """
+    Headless run over replay files and directories of them, reporting throughput.
+    """
+    files = collect_replay_files(paths)
+    total_events = 0
+    played = 0
+    started = time.perf_counter()
+    for file in files:
+        replay_data = load_replay(file)
+        summary = run_headless(replay_data, print_table)
+        if summary is None:
+            continue
+        played += 1
+        total_events += summary['events']
+        print(f"{file.name}: {summary['events']} events, max combo {summary['maxCombo']}, "
+              f"duration {summary['duration']:.2f}s, judgments {summary['judgmentCounts']}")
+    elapsed = time.perf_counter() - started
+    print(f"\n--- {played}/{len(files)} replay(s), {total_events} events in {elapsed:.3f}s "
+          f"({played / elapsed if elapsed else 0:.1f} replays/s, {total_events / elapsed if elapsed else 0:.0f} events/s) ---")
 
 
 replay_file = 'b7ab40e922ed57078f6423b3758ae15cf7d1b777.json'
 
-data = load_replay(replay_file)
-if data:
-    run_viewer(data)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="player-v2: replay viewer for decoded replay JSON files.")
+    parser.add_argument("paths", nargs="*", default=[replay_file], help="replay JSON files or directories of them")
+    parser.add_argument("--realtime", action="store_true", help="play the replay back in real time instead of fast-forwarding")
+    parser.add_argument("--table", action="store_true", help="print the per-event table in headless mode")
+    args = parser.parse_args()
+
+    if args.realtime:
+        for file in collect_replay_files(args.paths):
+            data = load_replay(file)
+            if data:
+                run_viewer(data)
+    else:
+        run_directory(args.paths, args.table)
@@ -3,10 +3,16 @@
 # Chỉ cần import vào thôi, code nó tự chạy <(")
 #########################################################
 
-from logging import Filter, StreamHandler, INFO, ERROR, Formatter, WARNING, basicConfig, FileHandler, DEBUG, getLogger
-from os import makedirs
+from logging import Filter, StreamHandler, INFO, ERROR, Formatter, WARNING, basicConfig, DEBUG, getLogger
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from multiprocessing import Queue
+from os import makedirs, environ, register_at_fork
+from queue import SimpleQueue
 from sys import stdout, stderr
 from logging.config import dictConfig
+from threading import Lock
+from time import monotonic
+import atexit
 
 from colorama import Fore, Style, init
 
@@ -16,6 +22,10 @@ except FileNotFoundError:
     makedirs(".logs", exist_ok=True)
     open(".logs/Access_log.log", "w").close()
 
+## Rotation: Access_log.log is rolled over to Access_log.log.1 ... .N once it reaches LOG_MAX_BYTES
+LOG_MAX_BYTES = int(environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(environ.get("LOG_BACKUP_COUNT", 5))
+
 asyncio_logger = getLogger("asyncio")
 
 asyncio_logger.disabled = True
@@ -34,38 +44,94 @@ INFO_FORMAT = f"{Style.DIM}[%(asctime)s]{Style.RESET_ALL} [%(name)s:%(lineno)d]
 WARNING_FORMAT = f"{Style.DIM}[%(asctime)s]{Style.RESET_ALL} [%(name)s:%(lineno)d] [%(funcName)s] [⚠️]  {Fore.YELLOW}[%(levelname)s] - {Fore.LIGHTBLUE_EX}%(message)s{Style.RESET_ALL}"
 ERROR_FORMAT = f"{Style.DIM}[%(asctime)s]{Style.RESET_ALL} [%(name)s:%(lineno)d] [%(funcName)s] [❌] {Fore.RED}[%(levelname)s] - {Fore.LIGHTRED_EX}%(message)s{Style.RESET_ALL}"
 DEBUG_FORMAT = f"{Style.DIM}[%(asctime)s]{Style.RESET_ALL} [%(name)s:%(lineno)d] [🐛] {Fore.BLUE}[%(levelname)s] - %(message)s{Style.RESET_ALL}"
+FILE_FORMAT = "%(asctime)s %(name)s:%(lineno)d [%(levelname)s] - %(message)s"
 
 DATEFMT="%d-%m-%Y %H:%M:%S"
 
+## Loggers that emit a few INFO lines per replay item
+PER_ITEM_LOGGERS = ("utils.engine", "utils.cache")
+
+
+class LevelFormatter(Formatter):
+    """
+    Picks the console format by level, so a single handler replaces the four level-filtered ones
+    """
+    def __init__(self, datefmt: str = DATEFMT):
+        super().__init__(datefmt=datefmt)
+        self.formatters = {
+            DEBUG: Formatter(DEBUG_FORMAT, datefmt=datefmt),
+            INFO: Formatter(INFO_FORMAT, datefmt=datefmt),
+            WARNING: Formatter(WARNING_FORMAT, datefmt=datefmt),
+            ERROR: Formatter(ERROR_FORMAT, datefmt=datefmt)
+        }
+
+    def format(self, record) -> str:
+        if record.levelno >= ERROR:
+            return self.formatters[ERROR].format(record)
+        if record.levelno >= WARNING:
+            return self.formatters[WARNING].format(record)
+        if record.levelno >= INFO:
+            return self.formatters[INFO].format(record)
+        return self.formatters[DEBUG].format(record)
+
+
+class LevelDispatchHandler(StreamHandler):
+    """
+    Console handler: INFO and WARNING go to stdout, DEBUG, ERROR and CRITICAL to stderr
+    """
+    def __init__(self):
+        super().__init__(stream=stdout)
+        self.setFormatter(LevelFormatter())
+
+    def emit(self, record):
+        self.stream = stdout if INFO <= record.levelno < ERROR else stderr
+        super().emit(record)
+
+
+class InfoRateLimitFilter(Filter):
+    """
+    Token bucket for INFO (and lower) records: at most ``rate`` per second with bursts of ``burst``.
+    WARNING and above always pass. The next record that passes says how many were dropped.
+    """
+    def __init__(self, rate: float, burst: int):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = monotonic()
+        self.suppressed = 0
+        self.lock = Lock()
+
+    def filter(self, record) -> bool:
+        if record.levelno >= WARNING:
+            return True
+        with self.lock:
+            now = monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+            self.tokens -= 1
+            suppressed, self.suppressed = self.suppressed, 0
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} INFO record(s) suppressed by rate limit)"
+            record.args = None
+        return True
+
+
 ## Create handlers
-infoHandler = StreamHandler(stream=stdout)
-infoHandler.setLevel(INFO)
-infoHandler.addFilter(SpectificLevelFilter(INFO))
-infoHandler.setFormatter(Formatter(INFO_FORMAT, datefmt=DATEFMT))
-
-warningHandler = StreamHandler(stream=stdout)
-warningHandler.setLevel(WARNING)
-warningHandler.addFilter(SpectificLevelFilter(WARNING))
-warningHandler.setFormatter(Formatter(WARNING_FORMAT, datefmt=DATEFMT))
-
-errorHandler = StreamHandler(stream=stderr)
-errorHandler.setLevel(ERROR)
-errorHandler.addFilter(SpectificLevelFilter(ERROR))
-errorHandler.setFormatter(Formatter(ERROR_FORMAT, datefmt=DATEFMT))
-
-debugHandler = StreamHandler(stream=stderr)
-debugHandler.setLevel(DEBUG)
-debugHandler.addFilter(SpectificLevelFilter(DEBUG))
-debugHandler.setFormatter(Formatter(DEBUG_FORMAT, datefmt=DATEFMT))
-
-fileHandler = FileHandler(".logs/Access_log.log", mode="w", encoding="utf-8")
+consoleHandler = LevelDispatchHandler()
+consoleHandler.setLevel(DEBUG)
+
+fileHandler = RotatingFileHandler(".logs/Access_log.log", mode="a", maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
 fileHandler.setLevel(INFO)
-fileHandler.setFormatter(Formatter("%(asctime)s %(name)s:%(lineno)d [%(levelname)s] - %(message)s", datefmt=DATEFMT))
+fileHandler.setFormatter(Formatter(FILE_FORMAT, datefmt=DATEFMT))
 
 ## Configure
 basicConfig(
     level=INFO,
-    handlers=[infoHandler, warningHandler, errorHandler, fileHandler, debugHandler]
+    handlers=[consoleHandler, fileHandler]
 )
 
 
@@ -73,89 +139,142 @@ LOGGING_CONFIG = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
-        "info": {
-            "format": INFO_FORMAT,
-            "datefmt": DATEFMT
-        },
-        "warning": {
-            "format": WARNING_FORMAT,
-            "datefmt": DATEFMT
-        },
-        "error": {
-            "format": ERROR_FORMAT,
-            "datefmt": DATEFMT
-        },
-        "debug": {
-            "format": DEBUG_FORMAT,
-            "datefmt": DATEFMT
-        },
         "file": {
-            "format": "%(asctime)s %(name)s:%(lineno)d [%(levelname)s] - %(message)s",
+            "format": FILE_FORMAT,
             "datefmt": DATEFMT
         }
     },
-    "filters": {
-        "info_filter": {
-            "()": SpectificLevelFilter,
-            "level": INFO
-        },
-        "warning_filter": {
-            "()": SpectificLevelFilter,
-            "level": WARNING
-        },
-        "error_filter": {
-            "()": SpectificLevelFilter,
-            "level": ERROR
-        },
-        "debug_filter": {
-            "()": SpectificLevelFilter,
-            "level": DEBUG
-        }
-    },
     "handlers": {
-        "info_console": {
-            "class": "logging.StreamHandler",
-            "level": "INFO",
-            "formatter": "info",
-            "filters": ["info_filter"],
-            "stream": "ext://sys.stdout"
-        },
-        "warning_console": {
-            "class": "logging.StreamHandler",
-            "level": "WARNING",
-            "formatter": "warning",
-            "filters": ["warning_filter"],
-            "stream": "ext://sys.stdout"
-        },
-        "error_console": {
-            "class": "logging.StreamHandler",
-            "level": "ERROR",
-            "formatter": "error",
-            "filters": ["error_filter"],
-            "stream": "ext://sys.stderr"
-        },
-        "debug_console": {
-            "class": "logging.StreamHandler",
-            "level": "DEBUG",
-            "formatter": "debug",
-            "filters": ["debug_filter"],
-            "stream": "ext://sys.stderr"
+        "console": {
+            "()": LevelDispatchHandler,
+            "level": "DEBUG"
         },
         "file": {
-            "class": "logging.FileHandler",
+            "class": "logging.handlers.RotatingFileHandler",
             "formatter": "file",
             "level": "INFO",
             "filename": ".logs/Access_log.log",
-            "mode": "w",
+            "mode": "a",
+            "maxBytes": LOG_MAX_BYTES,
+            "backupCount": LOG_BACKUP_COUNT,
             "encoding": "utf-8"
         }
     },
     "root": {
         "level": "DEBUG",
-        "handlers": ["info_console", "warning_console", "error_console", "debug_console", "file"]
+        "handlers": ["console", "file"]
     }
 }
 
+_listener: QueueListener | None = None
+## Records of worker processes, written by the parent's handlers
+_child_queue = None
+_child_listener: QueueListener | None = None
+
+def _root_handlers() -> list:
+    if _listener is not None:
+        return list(_listener.handlers)
+    return [handler for handler in getLogger().handlers if not isinstance(handler, QueueHandler)]
+
+def _start_queue_logging():
+    """
+    Move the root handlers behind a QueueListener thread, the logging call only enqueues the record
+    """
+    global _listener
+    root = getLogger()
+    handlers = [handler for handler in root.handlers if not isinstance(handler, QueueHandler)]
+    log_queue = SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    _listener.start()
+
+def _start_child_forwarding():
+    global _child_listener
+    _child_listener = QueueListener(_child_queue, *_root_handlers(), respect_handler_level=True)
+    _child_listener.start()
+
+def worker_log_queue():
+    """
+    Queue that worker processes log through, drained by this process's handlers so only the parent writes
+    (and rotates) the log file. Created on first use: only a process-mode worker pool needs it
+    """
+    global _child_queue
+    if _child_queue is None:
+        _child_queue = Queue()
+    if _child_listener is None:
+        _start_child_forwarding()
+    return _child_queue
+
+def init_worker_logging(log_queue):
+    """
+    ProcessPoolExecutor initializer: send every record of this worker process to ``log_queue`` (see worker_log_queue).
+    Passed explicitly, so it works with the fork, spawn and forkserver start methods alike
+    """
+    global _listener, _child_listener
+    root = getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    _listener = None
+    _child_listener = None
+
+def _detach_logging_in_child():
+    # A forked process inherits the handlers but not the listener threads, and must not write the log file
+    # itself: rollovers from several processes clobber each other. Worker processes then log through
+    # init_worker_logging
+    global _listener, _child_listener
+    root = getLogger()
+    handlers = _root_handlers()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        if not isinstance(handler, RotatingFileHandler):
+            root.addHandler(handler)
+    _listener = None
+    _child_listener = None
+
+def stop_queue_logging():
+    """
+    Flush the queued records and write them synchronously from now on
+    """
+    global _listener, _child_listener
+    if _child_listener is not None:
+        _child_listener.stop()
+        _child_listener = None
+    if _listener is None:
+        return
+    _listener.stop()
+    root = getLogger()
+    for handler in [handler for handler in root.handlers if isinstance(handler, QueueHandler)]:
+        root.removeHandler(handler)
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+    _listener = None
+
+register_at_fork(after_in_child=_detach_logging_in_child)
+atexit.register(stop_queue_logging)
+
 def setup_logger():
+    """
+    LOG_ASYNC=0 keeps the handlers on the logging thread (default: queued to a background listener).
+    Worker processes send their records to this process, see worker_log_queue.
+    LOG_ITEM_INFO_RATE caps the per-item INFO records per second (default: 0, no limit), LOG_ITEM_INFO_BURST is the burst size.
+    """
     init(autoreset=True)
-    dictConfig(LOGGING_CONFIG)
\ No newline at end of file
+    stop_queue_logging()
+    dictConfig(LOGGING_CONFIG)
+
+    rate = float(environ.get("LOG_ITEM_INFO_RATE", 0))
+    for name in PER_ITEM_LOGGERS:
+        logger = getLogger(name)
+        for log_filter in [f for f in logger.filters if isinstance(f, InfoRateLimitFilter)]:
+            logger.removeFilter(log_filter)
+        if rate > 0:
+            logger.addFilter(InfoRateLimitFilter(rate, int(environ.get("LOG_ITEM_INFO_BURST", 50))))
+
+    if environ.get("LOG_ASYNC", "1") != "0":
+        _start_queue_logging()
+    if _child_queue is not None:
+        _start_child_forwarding()
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils.admission import AdmissionControlMiddleware, AdmissionController, AdmissionRejected
+
+async def upload(request):
+    return JSONResponse({"ok": True})
+
+def make_client(controller: AdmissionController) -> TestClient:
+    app = Starlette(routes=[Route("/upload", upload, methods=["GET", "POST"])])
+    app.add_middleware(AdmissionControlMiddleware, paths=("/upload",), controller=controller)
+    return TestClient(app)
+
+def test_client_over_its_rate_gets_429():
+    client = make_client(AdmissionController(max_in_flight=0, ip_rate=0.01, ip_burst=2))
+    assert [client.post("/upload").status_code for _ in range(2)] == [200, 200]
+    response = client.post("/upload")
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    assert "detail" in response.json()
+
+def test_only_posts_are_admitted():
+    client = make_client(AdmissionController(max_in_flight=0, ip_rate=0.01, ip_burst=1))
+    assert [client.get("/upload").status_code for _ in range(3)] == [200, 200, 200]
+
+def test_saturated_server_gets_503():
+    controller = AdmissionController(max_in_flight=1, max_queue=0, ip_rate=0)
+    client = make_client(controller)
+    controller.in_flight = 1 # a request is being processed
+    response = client.post("/upload")
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+
+def test_queued_request_times_out_with_503():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.05, ip_rate=0)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.status == 503
+        assert controller.queued == 0
+        assert controller.in_flight == 1
+
+    asyncio.run(scenario())
+
+def test_full_queue_is_rejected_right_away():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=10, ip_rate=0)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire()
+        assert rejected.value.status == 503
+
+        # Releasing the slot hands it over to the queued request
+        controller.release()
+        await asyncio.wait_for(waiter, 1)
+        assert controller.in_flight == 1
+        controller.release()
+        assert controller.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,67 @@
+from utils.cache import CACHE_COUNTERS, ReplayCache, replay_cache_key, replay_library_id
+
+ITEM = {"item": {"name": "local-1", "data": {"url": "/sonolus/repository/abc"}}}
+
+def counters(cache: ReplayCache) -> dict[str, int]:
+    stats = cache.stats()
+    return {name: stats[name] for name in CACHE_COUNTERS}
+
+def delta(before: dict[str, int], after: dict[str, int]) -> dict[str, int]:
+    return {name: after[name] - before[name] for name in CACHE_COUNTERS if after[name] != before[name]}
+
+def test_key_depends_on_blob_metadata_and_extras():
+    key = replay_cache_key(b"blob", ITEM)
+    assert key == replay_cache_key(b"blob", {"item": dict(ITEM["item"])})
+    assert key != replay_cache_key(b"other blob", ITEM)
+    assert key != replay_cache_key(b"blob", {"item": {"name": "local-2"}})
+    assert key != replay_cache_key(b"blob", ITEM, ("analytics",))
+
+def test_library_id_ignores_extras():
+    library_id = replay_library_id(replay_cache_key(b"blob", ITEM))
+    assert library_id == replay_library_id(replay_cache_key(b"blob", ITEM, ("analytics", "verification")))
+    assert library_id != replay_library_id(replay_cache_key(b"other blob", ITEM))
+
+def test_miss_store_then_memory_hit(tmp_path):
+    cache = ReplayCache(memory_budget=1024 * 1024, disk_dir=tmp_path, disk_budget=1024 * 1024)
+    before = counters(cache)
+    assert cache.get("key") is None
+    cache.put("key", {"result": 1})
+    assert cache.get("key") == {"result": 1}
+    assert delta(before, counters(cache)) == {"misses": 1, "stores": 1, "memory_hits": 1}
+
+def test_disk_hit_from_another_instance(tmp_path):
+    ReplayCache(memory_budget=1024 * 1024, disk_dir=tmp_path, disk_budget=1024 * 1024).put("key", {"result": 1})
+    cache = ReplayCache(memory_budget=1024 * 1024, disk_dir=tmp_path, disk_budget=1024 * 1024)
+    before = counters(cache)
+    assert cache.get("key") == {"result": 1}
+    assert cache.get("key") == {"result": 1}
+    assert delta(before, counters(cache)) == {"disk_hits": 1, "memory_hits": 1}
+
+def test_memory_tier_evicts_least_recently_used():
+    value = {"data": "x" * 100}
+    cache = ReplayCache(memory_budget=250, disk_budget=0)
+    before = counters(cache)
+    cache.put("first", value)
+    cache.put("second", value)
+    cache.put("third", value)
+    assert cache.get("first") is None
+    assert cache.get("third") == value
+    assert delta(before, counters(cache)) == {"stores": 3, "evictions": 1, "misses": 1, "memory_hits": 1}
+    assert cache.stats()["memory_entries"] == 2
+
+def test_disk_tier_evicts_down_to_its_budget(tmp_path):
+    value = {"data": "x" * 100}
+    cache = ReplayCache(memory_budget=0, disk_dir=tmp_path, disk_budget=250)
+    before = counters(cache)
+    for key in ("first", "second", "third"):
+        cache.put(key, value)
+    assert delta(before, counters(cache)) == {"stores": 3, "evictions": 1}
+    assert len(list(tmp_path.glob("*.json"))) == 2
+    assert cache.stats()["disk_bytes"] <= 250
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = ReplayCache(memory_budget=0, disk_dir=tmp_path, disk_budget=0)
+    before = counters(cache)
+    cache.put("key", {"result": 1})
+    assert cache.get("key") is None
+    assert delta(before, counters(cache)) == {"misses": 1}
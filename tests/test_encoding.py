@@ -0,0 +1,67 @@
+import json
+import struct
+from array import array
+
+import pytest
+
+from utils.encoding import (
+    JSON_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, REPLAY_FRAME_MAGIC, REPLAY_FRAME_MEDIA_TYPE, ReplayJSONResponse, encode_replay_frame,
+    encode_results, negotiate_media_type
+)
+
+INPUTS = {"entityIndex": [3, 1, 2], "time": [0.5, 0.25, 0.0], "judgment": [1, 0, 2], "accuracy": [0.01, -0.02, 0.0]}
+RESULTS = {
+    "local-1": {"metadata": {"name": "local-1"}, "replay": {"duration": 2, "inputs": INPUTS}, "result": {"combo": 1}},
+    "local-2": {"error": "Failed to decompress gameplay GZIP data."}
+}
+
+def decode_replay_frame(payload: bytes) -> tuple[dict, bytes]:
+    assert payload[:4] == REPLAY_FRAME_MAGIC
+    version, header_length = struct.unpack_from("<II", payload, 4)
+    assert version == 1
+    assert header_length % 4 == 0
+    return json.loads(payload[12:12 + header_length]), payload[12 + header_length:]
+
+def read_column(columns: bytes, offset: int, dtype: str, count: int) -> list:
+    column = array("i" if dtype == "int32" else "f")
+    column.frombytes(columns[offset:offset + count * 4])
+    return column.tolist()
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, JSON_MEDIA_TYPE),
+    ("text/html, */*", JSON_MEDIA_TYPE),
+    ("application/x-replay-frame", REPLAY_FRAME_MEDIA_TYPE),
+    ("text/html;q=0.9, application/X-Replay-Frame;q=0.8, application/json", REPLAY_FRAME_MEDIA_TYPE)
+])
+def test_negotiate_media_type(accept, expected):
+    assert negotiate_media_type(accept) == expected
+
+def test_replay_frame_round_trip():
+    header, columns = decode_replay_frame(encode_replay_frame(RESULTS))
+    assert header["local-2"] == RESULTS["local-2"]
+    item = header["local-1"]
+    assert item["metadata"] == {"name": "local-1"}
+    assert item["replay"]["duration"] == 2
+    layout = item["replay"]["inputs"]
+    assert layout["count"] == 3
+    assert read_column(columns, *layout["columns"]["entityIndex"], 3) == [3, 1, 2]
+    assert read_column(columns, *layout["columns"]["judgment"], 3) == [1, 0, 2]
+    assert read_column(columns, *layout["columns"]["time"], 3) == pytest.approx(INPUTS["time"])
+    assert read_column(columns, *layout["columns"]["accuracy"], 3) == pytest.approx(INPUTS["accuracy"])
+    assert all(offset % 4 == 0 for offset, _ in layout["columns"].values())
+
+def test_encode_results_json():
+    assert json.loads(encode_results(RESULTS, JSON_MEDIA_TYPE)) == RESULTS
+
+def test_encode_results_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+    assert msgpack.unpackb(encode_results(RESULTS, MSGPACK_MEDIA_TYPE)) == RESULTS
+
+def test_typed_input_arrays():
+    # freshly parsed replays carry data.Inputs arrays instead of lists
+    inputs = {"entityIndex": array("i", [3, 1, 2]), "time": array("d", INPUTS["time"]), "judgment": array("b", [1, 0, 2]),
+              "accuracy": array("d", INPUTS["accuracy"])}
+    results = {**RESULTS, "local-1": {**RESULTS["local-1"], "replay": {"duration": 2, "inputs": inputs}}}
+    assert json.loads(encode_results(results, JSON_MEDIA_TYPE)) == RESULTS
+    assert json.loads(ReplayJSONResponse(results).body) == RESULTS
+    assert encode_replay_frame(results) == encode_replay_frame(RESULTS)
@@ -0,0 +1,59 @@
+import pytest
+
+from utils.library import ReplayLibrary, pack_inputs, unpack_inputs
+
+INPUTS = {"entityIndex": [0, 5, 2], "time": [0.125, 1.5, 0.0], "judgment": [1, 0, 3], "accuracy": [0.015, -0.1, 0.0]}
+
+def make_result(name: str = "local-1", difficulty: str = "EXPERT", rating: int = 30, mods: list[str] | None = None) -> dict:
+    replay_result = {"grade": "s", "arcadeScore": 900000, "accuracyScore": 0.9, "combo": 1,
+                     "perfect": 1, "great": 0, "good": 1, "miss": 1, "totalCount": 3}
+    return {
+        "metadata": {"name": name, "title": f"Replay {name}", "difficulty": difficulty, "rating": rating, "mod": mods or []},
+        "replay": {"startTime": 1, "saveTime": 2, "duration": 3.5, "inputOffset": 0, "result": replay_result, "inputs": INPUTS},
+        "result": replay_result
+    }
+
+@pytest.fixture
+def library(tmp_path):
+    library = ReplayLibrary(tmp_path / "library.sqlite3")
+    yield library
+    library.close()
+
+def test_pack_unpack_keeps_the_input_values():
+    assert unpack_inputs(pack_inputs(INPUTS)) == INPUTS
+
+def test_pack_unpack_empty_inputs():
+    empty = {key: [] for key in INPUTS}
+    assert unpack_inputs(pack_inputs(empty)) == empty
+
+def test_add_and_get_round_trip(library):
+    result = make_result()
+    replay_id = library.add(result, {"name": "level-1", "title": "Level 1"})
+    stored = library.get(replay_id)
+    assert stored["metadata"] == result["metadata"]
+    assert stored["replay"]["inputs"] == INPUTS
+    assert stored["result"] == result["result"]
+    assert "inputs" not in library.get(replay_id, with_inputs=False)["replay"]
+
+def test_same_replay_is_stored_once(library):
+    assert library.add(make_result()) == library.add(make_result())
+    assert library.query()["total"] == 1
+
+def test_errors_are_not_stored(library):
+    assert library.add({"error": "Failed to decompress gameplay GZIP data."}) is None
+    assert library.query()["total"] == 0
+
+def test_query_filters_by_difficulty_and_mods(library):
+    library.add(make_result("local-1", "EXPERT", mods=["hd"]))
+    library.add(make_result("local-2", "MASTER", mods=["HD", "DT"]))
+    library.add(make_result("local-3", "MASTER"))
+    assert [item["name"] for item in library.query(difficulty="master", sort="title", descending=False)["items"]] == ["local-2", "local-3"]
+    assert sorted(item["name"] for item in library.query(mods=["HD"])["items"]) == ["local-1", "local-2"]
+    assert [item["name"] for item in library.query(mods=["HD", "DT"])["items"]] == ["local-2"]
+
+def test_known_replay_id_is_not_packed_again(library, monkeypatch):
+    replay_id = library.add(make_result(), replay_id="abc")
+    assert replay_id == "abc"
+    monkeypatch.setattr("utils.library.pack_inputs", lambda inputs: pytest.fail("packed a stored replay again"))
+    assert library.add(make_result(), replay_id="abc") == "abc"
+    assert library.query()["total"] == 1
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from utils.singleflight import SingleFlight
+
+def test_concurrent_calls_with_one_key_share_a_run():
+    async def scenario():
+        flights = SingleFlight("test")
+        calls = []
+
+        async def work(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return {"key": key}
+
+        results = await asyncio.gather(*(flights.do(key, lambda key=key: work(key)) for key in ("a", "a", "a", "b")))
+        assert calls == ["a", "b"]
+        assert results[0] is results[1] is results[2]
+        assert results[3] == {"key": "b"}
+        assert len(flights) == 0
+
+    asyncio.run(scenario())
+
+def test_later_calls_run_again():
+    async def scenario():
+        flights = SingleFlight("test")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return len(calls)
+
+        assert await flights.do("a", work) == 1
+        assert await flights.do("a", work) == 2
+
+    asyncio.run(scenario())
+
+def test_failed_run_is_retried_by_the_waiters():
+    async def scenario():
+        flights = SingleFlight("test")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            if len(calls) == 1:
+                raise ValueError("bad upload")
+            return "ok"
+
+        first, second = await asyncio.gather(flights.do("a", work), flights.do("a", work), return_exceptions=True)
+        assert isinstance(first, ValueError)
+        assert second == "ok"
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+def test_cancelled_caller_does_not_cancel_the_shared_run():
+    async def scenario():
+        flights = SingleFlight("test")
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.ensure_future(flights.do("a", work))
+        await started.wait()
+        second = asyncio.ensure_future(flights.do("a", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == "done"
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+from utils.analytics import GOOD, GREAT, MISS, PERFECT
+from utils.timeline import ReplayTimeline
+
+def make_timeline(time_deltas: list[float], judgments: list[int]) -> ReplayTimeline:
+    count = len(judgments)
+    return ReplayTimeline({
+        "time": time_deltas, "judgment": judgments, "accuracy": [0.0] * count, "entityIndex": list(range(count))
+    })
+
+def test_window_and_state_before_start():
+    timeline = make_timeline([1.0, 1.0, 1.0, 1.0], [PERFECT, PERFECT, MISS, GREAT])
+    window = timeline.window(2.5, 4.5)
+    assert window["firstIndex"] == 2
+    assert window["events"]["time"] == [3.0, 4.0]
+    assert window["state"] == {"combo": 2, "maxCombo": 2, "judgmentCounts": {"perfect": 2, "great": 0, "good": 0, "miss": 0}}
+    assert window["next"] is None and window["nextCursor"] is None
+
+def test_paging_with_the_cursor_never_repeats_events_of_one_chord():
+    # five events at t=1.0, then two at t=2.0
+    timeline = make_timeline([1.0, 0, 0, 0, 0, 1.0, 0], [PERFECT, GREAT, GOOD, MISS, PERFECT, PERFECT, GREAT])
+    pages = [timeline.window(0.0, float("inf"), limit=2)]
+    while pages[-1]["nextCursor"] is not None:
+        assert len(pages) < 10
+        pages.append(timeline.window(0.0, float("inf"), limit=2, cursor=pages[-1]["nextCursor"]))
+
+    entities = [entity for page in pages for entity in page["events"]["entityIndex"]]
+    assert sorted(entities) == list(range(7))
+    assert len(entities) == 7
+    assert [page["firstIndex"] for page in pages] == [0, 2, 4, 6]
+    assert pages[1]["next"] == 1.0
+    assert pages[2]["state"]["judgmentCounts"] == {"perfect": 1, "great": 1, "good": 1, "miss": 1}
+
+def test_cursor_stops_at_end():
+    timeline = make_timeline([1.0, 1.0, 1.0], [PERFECT, PERFECT, PERFECT])
+    window = timeline.window(0.0, 2.5, limit=10, cursor=1)
+    assert window["events"]["time"] == [2.0]
+    assert window["nextCursor"] == 2
+    assert timeline.window(0.0, 2.5, cursor=5)["events"]["time"] == []
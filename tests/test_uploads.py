@@ -0,0 +1,40 @@
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils.uploads import UploadSizeLimitMiddleware
+
+MAX_BYTES = 1000
+
+async def upload(request: Request):
+    return JSONResponse({"received": len(await request.body())})
+
+def make_client() -> TestClient:
+    app = Starlette(routes=[Route("/upload", upload, methods=["POST"]), Route("/other", upload, methods=["POST"])])
+    app.add_middleware(UploadSizeLimitMiddleware, paths=("/upload",), max_bytes=MAX_BYTES)
+    return TestClient(app)
+
+def chunks(count: int, size: int = 100):
+    for _ in range(count):
+        yield b"x" * size
+
+def test_chunked_upload_over_the_limit_is_rejected():
+    response = make_client().post("/upload", content=chunks(20))
+    assert response.status_code == 413
+    assert "1000 bytes" in response.json()["detail"]
+
+def test_chunked_upload_within_the_limit_passes():
+    response = make_client().post("/upload", content=chunks(10))
+    assert response.status_code == 200
+    assert response.json() == {"received": 1000}
+
+def test_content_length_over_the_limit_is_rejected_up_front():
+    response = make_client().post("/upload", content=b"x" * (MAX_BYTES + 1))
+    assert response.status_code == 413
+
+def test_other_paths_are_not_limited():
+    response = make_client().post("/other", content=chunks(20))
+    assert response.status_code == 200
+    assert response.json() == {"received": 2000}
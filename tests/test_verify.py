@@ -0,0 +1,51 @@
+import numpy as np
+
+from utils.analytics import GOOD, GREAT, MISS, PERFECT
+from utils.verify import MISMATCH, OK, UNVERIFIABLE, recompute_results, verify_results
+
+def replay(judgments: list[int], **claimed) -> dict:
+    result = {"perfect": 0, "great": 0, "good": 0, "miss": 0, "totalCount": 0, "combo": 0}
+    result.update(claimed)
+    return {
+        "replay": {"inputs": {"time": [0.1] * len(judgments), "judgment": judgments, "accuracy": [0.0] * len(judgments)}},
+        "result": result
+    }
+
+def test_recompute_counts_and_combo_per_replay():
+    columns = [
+        np.array([PERFECT, PERFECT, GREAT, MISS, PERFECT, GOOD, PERFECT]),
+        np.array([], dtype=np.int64),
+        np.array([GREAT, GREAT, GREAT]),
+        np.array([MISS, 7, PERFECT])
+    ]
+    recomputed = recompute_results(columns)
+    assert recomputed["perfect"].tolist() == [4, 0, 0, 1]
+    assert recomputed["great"].tolist() == [1, 0, 3, 0]
+    assert recomputed["good"].tolist() == [1, 0, 0, 0]
+    assert recomputed["miss"].tolist() == [1, 0, 0, 1]
+    assert recomputed["totalCount"].tolist() == [7, 0, 3, 2]
+    # the combo of a replay never carries over into the next one
+    assert recomputed["combo"].tolist() == [3, 0, 3, 1]
+    assert recomputed["invalidJudgments"].tolist() == [0, 0, 0, 1]
+
+def test_matching_result_is_ok():
+    [verdict] = verify_results([replay([PERFECT, GREAT, MISS, PERFECT], perfect=2, great=1, miss=1, totalCount=4, combo=2)])
+    assert verdict["status"] == OK
+    assert verdict["mismatches"] == {}
+    assert verdict["computed"]["combo"] == 2
+
+def test_inflated_result_is_a_mismatch():
+    [verdict] = verify_results([replay([PERFECT, MISS], perfect=2, miss=0, totalCount=2, combo=2)])
+    assert verdict["status"] == MISMATCH
+    assert verdict["mismatches"]["perfect"] == {"claimed": 2, "computed": 1}
+    assert verdict["mismatches"]["combo"] == {"claimed": 2, "computed": 1}
+    assert "great" not in verdict["mismatches"]
+
+def test_error_entries_are_unverifiable_without_shifting_the_others():
+    entries = [
+        {"error": "Failed to decompress gameplay GZIP data."},
+        replay([GOOD, PERFECT], good=1, perfect=1, totalCount=2, combo=1)
+    ]
+    verdicts = verify_results(entries)
+    assert verdicts[0]["status"] == UNVERIFIABLE
+    assert verdicts[1]["status"] == OK
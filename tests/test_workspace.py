@@ -0,0 +1,103 @@
+import os
+import time
+import uuid
+
+from utils.workspace import WorkspacePool, is_workspace_entry
+
+def make_entry(root, name: str, size: int = 100, age: float = 0.0, directory: bool = True):
+    path = root / name
+    if directory:
+        path.mkdir()
+        (path / "data").write_bytes(b"x" * size)
+    else:
+        path.write_bytes(b"x" * size)
+    if age:
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+    return path
+
+def dead_pid() -> int:
+    pid = 4_000_000
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid += 1
+
+def test_workspace_entry_names():
+    assert is_workspace_entry("processing_123_abcd1234_ff")
+    assert is_workspace_entry(f"processing_{uuid.uuid4()}")
+    assert is_workspace_entry(str(uuid.uuid4()))
+    assert not is_workspace_entry("notes.txt")
+    assert not is_workspace_entry("uploads")
+    assert not is_workspace_entry(f"{uuid.uuid4()}.zip")
+
+def test_foreign_entries_are_never_swept(tmp_path):
+    foreign = [
+        make_entry(tmp_path, "notes.txt", age=10_000, directory=False),
+        make_entry(tmp_path, "uploads", size=10_000, age=10_000),
+        make_entry(tmp_path, f"{uuid.uuid4()}.zip", age=10_000, directory=False)
+    ]
+    pool = WorkspacePool(tmp_path, stale_seconds=60, budget_bytes=10)
+    stats = pool.sweep()
+    assert stats["swept"] == 0
+    assert stats["usage_bytes"] == 0
+    assert all(path.exists() for path in foreign)
+
+def test_orphaned_and_stale_legacy_entries_are_swept(tmp_path):
+    orphaned = make_entry(tmp_path, f"processing_{dead_pid()}_abcd1234_{uuid.uuid4().hex}")
+    stale_legacy = [make_entry(tmp_path, f"processing_{uuid.uuid4()}", age=10_000), make_entry(tmp_path, str(uuid.uuid4()), age=10_000)]
+    recent_legacy = make_entry(tmp_path, str(uuid.uuid4()))
+    pool = WorkspacePool(tmp_path, stale_seconds=60)
+    stats = pool.sweep()
+    assert stats["swept"] == 3
+    assert not orphaned.exists()
+    assert not any(path.exists() for path in stale_legacy)
+    assert recent_legacy.exists()
+
+def test_over_budget_drops_idle_workspaces_and_oldest_leftovers_only(tmp_path):
+    foreign = make_entry(tmp_path, "keep", size=1000)
+    older = make_entry(tmp_path, str(uuid.uuid4()), size=1000, age=30)
+    newer = make_entry(tmp_path, str(uuid.uuid4()), size=1000, age=10)
+    pool = WorkspacePool(tmp_path, stale_seconds=60, budget_bytes=1500)
+    idle = pool.acquire()
+    (idle.path / "data").write_bytes(b"x" * 100)
+    pool.release(idle)
+    in_use = pool.acquire()
+    (in_use.path / "data").write_bytes(b"x" * 100)
+
+    pool.sweep()
+    assert foreign.exists()
+    assert in_use.path.exists() and (in_use.path / "data").exists()
+    assert not older.exists()
+    assert newer.exists()
+    assert pool.stats()["idle"] == 0
+
+def test_released_workspaces_are_emptied_and_reused(tmp_path):
+    pool = WorkspacePool(tmp_path, max_idle=1)
+    workspace = pool.acquire()
+    (workspace.path / "upload.zip").write_bytes(b"x")
+    pool.release(workspace)
+    assert list(workspace.path.iterdir()) == []
+    assert pool.acquire() is workspace
+    assert pool.stats()["reused"] == 1
+
+def test_workspaces_of_another_pool_of_this_process_are_kept(tmp_path):
+    first = WorkspacePool(tmp_path, budget_bytes=10)
+    second = WorkspacePool(tmp_path, budget_bytes=10)
+    in_use = second.acquire()
+    (in_use.path / "data").write_bytes(b"x" * 100)
+    idle = second.acquire()
+    second.release(idle)
+
+    assert first.sweep()["swept"] == 0
+    assert in_use.path.exists() and idle.path.exists()
+
+    # Left behind by a previous process that had the same pid, e.g. pid 1 in a container
+    leftover = make_entry(tmp_path, f"processing_{os.getpid()}_0badf00d_{uuid.uuid4().hex}")
+    assert first.sweep()["swept"] == 1
+    assert not leftover.exists()
+    assert in_use.path.exists() and idle.path.exists()
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from logging import getLogger
+
+from utils.metrics import ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+log = getLogger(__name__)
+
+MAX_IP_BUCKETS = 10000
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, retry_after: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+class TokenBucket:
+    """
+    At most ``rate`` requests per second with bursts of ``burst``.
+    """
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """
+        Take one token. Returns 0 on success, else the seconds until a token is available.
+        """
+        self.refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AdmissionController:
+    """
+    Admission of upload requests: at most ``max_in_flight`` are processed at once, at most ``max_queue`` more
+    wait (first come, first served) up to ``queue_timeout`` seconds for a slot, and every client IP gets a token
+    bucket of ``ip_rate`` requests per second with bursts of ``ip_burst``. Everything else is rejected right away,
+    429 for a client over its rate and 503 when the server is saturated, with a Retry-After estimated from the
+    recent processing times. ``max_in_flight`` or ``ip_rate`` of 0 disables that limit.
+    Runs on the event loop only, no locking needed.
+    """
+    def __init__(self, max_in_flight: int = 4, max_queue: int = 16, queue_timeout: float = 10.0,
+                 ip_rate: float = 0.5, ip_burst: int = 10):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.in_flight = 0
+        self.average_seconds = 1.0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._buckets: dict[str, TokenBucket] = {}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_in_flight=int(os.environ.get("REPLAY_MAX_IN_FLIGHT", 2 * (os.cpu_count() or 1))),
+            max_queue=int(os.environ.get("REPLAY_ADMISSION_QUEUE", 16)),
+            queue_timeout=float(os.environ.get("REPLAY_ADMISSION_TIMEOUT", 10)),
+            ip_rate=float(os.environ.get("REPLAY_IP_RATE", 0.5)),
+            ip_burst=int(os.environ.get("REPLAY_IP_BURST", 10))
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        slots = max(self.max_in_flight, 1)
+        return max(1, math.ceil(self.average_seconds * (len(self._waiters) + 1) / slots))
+
+    def check_rate(self, ip_address: str | None):
+        if self.ip_rate <= 0 or ip_address is None:
+            return
+        bucket = self._buckets.get(ip_address)
+        if bucket is None:
+            if len(self._buckets) >= MAX_IP_BUCKETS:
+                self._prune_buckets()
+            bucket = self._buckets[ip_address] = TokenBucket(self.ip_rate, self.ip_burst)
+        wait = bucket.take()
+        if wait:
+            raise AdmissionRejected(429, max(1, math.ceil(wait)), "Too many uploads from this address, please retry later.")
+
+    async def acquire(self):
+        """
+        Wait for a processing slot, or raise AdmissionRejected.
+        """
+        if self.max_in_flight <= 0:
+            return
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue or self.queue_timeout <= 0:
+            raise AdmissionRejected(503, self.retry_after(), "Server is busy processing other replays, please retry later.")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        ADMISSION_QUEUED.inc()
+        start = time.perf_counter()
+        try:
+            # The slot is handed over by release(), in_flight already counts it
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(future)
+            raise AdmissionRejected(503, self.retry_after(), "Server is busy processing other replays, please retry later.")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._discard(future)
+            raise
+        finally:
+            ADMISSION_QUEUED.dec()
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    def release(self, seconds: float | None = None):
+        if self.max_in_flight <= 0:
+            return
+        if seconds is not None:
+            self.average_seconds += 0.2 * (seconds - self.average_seconds)
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _discard(self, future: asyncio.Future):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        for ip_address, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self._buckets[ip_address]
+
+class AdmissionControlMiddleware:
+    """
+    Applies ``controller`` to requests for ``paths`` before their body is received, so rejected uploads cost nothing.
+    """
+    def __init__(self, app, paths: tuple[str, ...], controller: AdmissionController):
+        self.app = app
+        self.paths = paths
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        client = scope.get("client")
+        try:
+            self.controller.check_rate(client[0] if client else None)
+            await self.controller.acquire()
+        except AdmissionRejected as e:
+            log.warning(f"Rejected request to {scope['path']} from {client[0] if client else 'unknown'} with {e.status}: {e}")
+            ADMISSION_REJECTED.inc(status=e.status)
+            await self._send_rejected(send, e)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - start)
+
+    @staticmethod
+    async def _send_rejected(send, rejection: AdmissionRejected):
+        body = json.dumps({"detail": rejection.message}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": rejection.status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejection.retry_after).encode())
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,93 @@
+import numpy as np
+
+from data import ReplayDataRel
+
+# Judgment values as stored in inputs.judgment
+MISS, PERFECT, GREAT, GOOD = 0, 1, 2, 3
+JUDGMENT_NAMES = {PERFECT: "perfect", GREAT: "great", GOOD: "good", MISS: "miss"}
+
+TIME_BUCKET_SECONDS = 1.0
+# Durations and times come from the upload: longer replays get wider buckets instead of more of them
+MAX_TIME_BUCKETS = 3600
+ACCURACY_BINS = 40
+
+def ordered_events(time_deltas, judgments, accuracies, entity_indices=None) -> dict[str, np.ndarray]:
+    """
+    Decode the delta encoded times into absolute ones and order every column by time, like the players do.
+    """
+    n = min(len(time_deltas), len(judgments), len(accuracies))
+    times = np.cumsum(np.asarray(time_deltas, dtype=np.float64)[:n])
+    order = np.argsort(times, kind="stable")
+    events = {
+        "time": times[order],
+        "judgment": np.asarray(judgments, dtype=np.int8)[:n][order],
+        "accuracy": np.asarray(accuracies, dtype=np.float64)[:n][order]
+    }
+    if entity_indices is not None:
+        events["entityIndex"] = np.asarray(entity_indices, dtype=np.int32)[:n][order]
+    return events
+
+def combo_series(judgments: np.ndarray) -> np.ndarray:
+    """
+    Combo after every event: perfect/great add one, miss/good reset it.
+    """
+    hits = np.cumsum((judgments == PERFECT) | (judgments == GREAT))
+    resets = (judgments == MISS) | (judgments == GOOD)
+    return hits - np.maximum.accumulate(np.where(resets, hits, 0))
+
+def compute_replay_analytics(replay: ReplayDataRel, bucket_seconds: float = TIME_BUCKET_SECONDS, accuracy_bins: int = ACCURACY_BINS) -> dict:
+    """
+    Everything the players derive by simulating the replay event by event, computed in one batch:
+    decoded (cumulative) times, combo after every event, max combo, judgment counts in total and per
+    time bucket, and accuracy histograms. Events are ordered by time like the players do.
+    Combo rules follow the players: perfect/great add one, miss/good reset it.
+    There are at most MAX_TIME_BUCKETS buckets, "size" is widened for longer replays.
+    """
+    inputs = replay.inputs
+    events = ordered_events(
+        np.frombuffer(inputs.time, dtype=np.float64),
+        np.frombuffer(inputs.judgment, dtype=np.int8),
+        np.frombuffer(inputs.accuracy, dtype=np.float64)
+    )
+    times, judgments, accuracies = events["time"], events["judgment"], events["accuracy"]
+    n = len(times)
+    combo = combo_series(judgments)
+
+    finite_times = times[np.isfinite(times)]
+    duration = max(float(replay.duration or 0), float(finite_times.max()) if len(finite_times) else 0.0)
+    if not np.isfinite(duration):
+        duration = float(finite_times.max()) if len(finite_times) else 0.0
+    bucket_seconds = max(bucket_seconds, duration / MAX_TIME_BUCKETS)
+    bucket_count = min(int(duration // bucket_seconds) + 1, MAX_TIME_BUCKETS)
+    bucket_index = np.clip(
+        np.nan_to_num(np.floor(times / bucket_seconds), nan=0.0, posinf=bucket_count - 1, neginf=0.0),
+        0, bucket_count - 1
+    ).astype(np.int64)
+
+    buckets = {"size": bucket_seconds}
+    judgment_counts = {}
+    for value, name in JUDGMENT_NAMES.items():
+        mask = judgments == value
+        judgment_counts[name] = int(np.count_nonzero(mask))
+        buckets[name] = np.bincount(bucket_index[mask], minlength=bucket_count).tolist()
+
+    judged = (judgments != MISS) & np.isfinite(accuracies)
+    limit = float(np.max(np.abs(accuracies[judged]))) if np.any(judged) else 0.0
+    edges = np.linspace(-limit, limit, accuracy_bins + 1) if limit > 0 else np.linspace(-1.0, 1.0, accuracy_bins + 1)
+    accuracy_histogram = {
+        "edges": edges.tolist(),
+        "all": np.histogram(accuracies[judged], bins=edges)[0].tolist()
+    }
+    for value in (PERFECT, GREAT, GOOD):
+        mask = judged & (judgments == value)
+        accuracy_histogram[JUDGMENT_NAMES[value]] = np.histogram(accuracies[mask], bins=edges)[0].tolist()
+
+    return {
+        "times": times.tolist(),
+        "combo": combo.tolist(),
+        "maxCombo": int(combo.max()) if n else 0,
+        "judgmentCounts": judgment_counts,
+        "buckets": buckets,
+        "accuracyHistogram": accuracy_histogram,
+        "meanAccuracy": float(accuracies[judged].mean()) if np.any(judged) else 0.0
+    }
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import pathlib
+import threading
+from collections import OrderedDict
+from logging import getLogger
+
+from utils.encoding import json_default
+from utils.metrics import CACHE_EVENTS
+
+log = getLogger(__name__)
+
+# Bump when the shape of the cached ReplayData.to_dict() output changes
+CACHE_FORMAT_VERSION = 6
+CACHE_COUNTERS = ("memory_hits", "disk_hits", "misses", "stores", "evictions")
+
+def replay_cache_key(gameplay_blob: bytes, item_content_json: dict, extras: tuple[str, ...] = ()) -> str:
+    """
+    Content address of a parsed replay: hash of the gameplay blob bytes plus hash of the item metadata,
+    plus the optional blocks (``extras``) the result carries.
+    The blob is hashed instead of trusting the /sonolus/repository/<hash> name from the uploaded archive.
+    """
+    blob_hash = hashlib.sha1(gameplay_blob).hexdigest()
+    meta_hash = hashlib.sha1(json.dumps(item_content_json, sort_keys=True).encode("utf-8")).hexdigest()
+    return "-".join((f"v{CACHE_FORMAT_VERSION}", blob_hash, meta_hash, *extras))
+
+def replay_library_id(cache_key: str) -> str:
+    """
+    Library id of the replay behind a replay_cache_key(): only the blob and metadata hashes count,
+    not the cache format version nor the extras.
+    """
+    _, blob_hash, meta_hash, *_ = cache_key.split("-")
+    return hashlib.sha1(f"{blob_hash}-{meta_hash}".encode("utf-8")).hexdigest()
+
+class ReplayCache:
+    """
+    Two-tier cache of parsed replays (ReplayData.to_dict() output) keyed by replay_cache_key.
+
+    Tier 1 is an in-memory LRU bounded by ``memory_budget`` bytes of serialized JSON,
+    tier 2 is a directory of JSON files bounded by ``disk_budget`` bytes, evicting the least recently used.
+    A budget of 0 disables that tier. In process worker mode every worker keeps its own memory tier and the disk tier
+    is shared. The counters are the CACHE_EVENTS metric, which process workers ship back to the parent with their results,
+    so stats() covers every worker.
+    """
+    def __init__(self, memory_budget: int = 64 * 1024 * 1024, disk_dir: pathlib.Path | None = None, disk_budget: int = 512 * 1024 * 1024):
+        self.memory_budget = memory_budget
+        self.disk_dir = disk_dir if disk_budget > 0 else None
+        self.disk_budget = disk_budget
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = 0
+        self._lock = threading.Lock()
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_size = sum(f.stat().st_size for f in self.disk_dir.glob("*.json"))
+
+    @classmethod
+    def from_env(cls) -> "ReplayCache":
+        return cls(
+            memory_budget=int(os.environ.get("REPLAY_CACHE_MEMORY_BYTES", 64 * 1024 * 1024)),
+            disk_dir=pathlib.Path(os.environ.get("REPLAY_CACHE_DIR", ".cache/replays")),
+            disk_budget=int(os.environ.get("REPLAY_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+        )
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                CACHE_EVENTS.inc(event="memory_hits")
+                return json.loads(payload)
+
+        payload = self._read_disk(key)
+        with self._lock:
+            if payload is None:
+                CACHE_EVENTS.inc(event="misses")
+                return None
+            CACHE_EVENTS.inc(event="disk_hits")
+            self._store_memory(key, payload)
+        return json.loads(payload)
+
+    def put(self, key: str, value: dict):
+        if self.memory_budget <= 0 and self.disk_dir is None:
+            return
+        payload = json.dumps(value, separators=(",", ":"), default=json_default).encode("utf-8")
+        with self._lock:
+            CACHE_EVENTS.inc(event="stores")
+            self._store_memory(key, payload)
+        self._write_disk(key, payload)
+
+    def stats(self) -> dict:
+        """
+        Counters of every worker; the memory tier figures are the ones of this process.
+        """
+        counters = {event: int(CACHE_EVENTS.value(event=event)) for event in CACHE_COUNTERS}
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        with self._lock:
+            return {
+                **counters,
+                "hit_ratio": (lookups - counters["misses"]) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "memory_budget": self.memory_budget,
+                "disk_bytes": self._disk_size,
+                "disk_budget": self.disk_budget
+            }
+
+    def _store_memory(self, key: str, payload: bytes):
+        if len(payload) > self.memory_budget:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = payload
+        self._memory_size += len(payload)
+        while self._memory_size > self.memory_budget:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            CACHE_EVENTS.inc(event="evictions")
+
+    def _read_disk(self, key: str) -> bytes | None:
+        if self.disk_dir is None:
+            return None
+        path = self.disk_dir / f"{key}.json"
+        try:
+            payload = path.read_bytes()
+            os.utime(path)
+            return payload
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            log.warning(f"Could not read replay cache entry {path}: {e}")
+            return None
+
+    def _write_disk(self, key: str, payload: bytes):
+        if self.disk_dir is None or len(payload) > self.disk_budget:
+            return
+        path = self.disk_dir / f"{key}.json"
+        if path.exists():
+            return
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning(f"Could not write replay cache entry {path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+        with self._lock:
+            self._disk_size += len(payload)
+            if self._disk_size > self.disk_budget:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for f in self.disk_dir.glob("*.json"):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+        entries.sort()
+        self._disk_size = sum(size for _, size, _ in entries)
+        for _, size, f in entries:
+            if self._disk_size <= self.disk_budget:
+                break
+            f.unlink(missing_ok=True)
+            self._disk_size -= size
+            CACHE_EVENTS.inc(event="evictions")
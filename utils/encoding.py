@@ -0,0 +1,107 @@
+import json
+import struct
+from array import array
+
+import numpy as np
+from fastapi.responses import JSONResponse
+
+try:
+    import msgpack
+except ImportError: # optional, only needed for Accept: application/msgpack
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+REPLAY_FRAME_MEDIA_TYPE = "application/x-replay-frame"
+
+REPLAY_FRAME_MAGIC = b"SRPF"
+REPLAY_FRAME_VERSION = 1
+
+# (input key, little-endian dtype) of every column, in the order they are written
+REPLAY_FRAME_COLUMNS = (
+    ("entityIndex", "<i4"),
+    ("time", "<f4"),
+    ("judgment", "<i4"),
+    ("accuracy", "<f4")
+)
+
+def json_default(value):
+    """
+    ``default`` for json.dumps: freshly parsed replays keep their input columns as typed arrays (data.Inputs).
+    """
+    if isinstance(value, array):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class ReplayJSONResponse(JSONResponse):
+    """
+    JSONResponse for parsed replay results, see json_default.
+    """
+    def render(self, content) -> bytes:
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=json_default).encode("utf-8")
+
+def supported_media_types() -> list[str]:
+    media_types = [JSON_MEDIA_TYPE, REPLAY_FRAME_MEDIA_TYPE]
+    if msgpack is not None:
+        media_types.append(MSGPACK_MEDIA_TYPE)
+    return media_types
+
+def negotiate_media_type(accept: str | None) -> str:
+    """
+    Pick the response encoding from an Accept header: the first supported media type wins, JSON is the default.
+    """
+    supported = supported_media_types()
+    for entry in (accept or "").split(","):
+        media_type = entry.split(";")[0].strip().lower()
+        if media_type in supported:
+            return media_type
+    return JSON_MEDIA_TYPE
+
+def encode_msgpack(results: dict[str, dict]) -> bytes:
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed.")
+    return msgpack.packb(results, use_bin_type=True, default=json_default)
+
+def encode_replay_frame(results: dict[str, dict]) -> bytes:
+    """
+    Encode /replayv2 results as a typed-array frame, so clients can map the input columns with
+    Int32Array/Float32Array instead of parsing JSON number arrays.
+
+    Layout (all little-endian):
+        magic "SRPF" | uint32 version | uint32 header length | header JSON (space padded to 4 bytes) | columns
+
+    The header is the usual JSON response, except that every successful item's replay.inputs is replaced by
+    {"count": n, "columns": {"entityIndex": [offset, "int32"], "time": [offset, "float32"], ...}}
+    where offset is the byte offset of that column from the start of the columns block.
+    Every column is n * 4 bytes, so each one stays 4-byte aligned. time is still delta encoded.
+    """
+    header = {}
+    columns = bytearray()
+    for item_filename, result in results.items():
+        inputs = result.get("replay", {}).get("inputs") if isinstance(result, dict) else None
+        if inputs is None:
+            header[item_filename] = result
+            continue
+
+        layout = {}
+        for key, dtype in REPLAY_FRAME_COLUMNS:
+            # Typed arrays are read as buffers, without going through Python numbers
+            column = np.asarray(inputs[key], dtype=dtype)
+            layout[key] = [len(columns), "int32" if dtype == "<i4" else "float32"]
+            columns += column.tobytes()
+
+        header[item_filename] = {
+            **result,
+            "replay": {**result["replay"], "inputs": {"count": len(inputs["judgment"]), "columns": layout}}
+        }
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % 4)
+    return REPLAY_FRAME_MAGIC + struct.pack("<II", REPLAY_FRAME_VERSION, len(header_bytes)) + header_bytes + bytes(columns)
+
+def encode_results(results: dict[str, dict], media_type: str) -> bytes:
+    if media_type == REPLAY_FRAME_MEDIA_TYPE:
+        return encode_replay_frame(results)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        return encode_msgpack(results)
+    return json.dumps(results, default=json_default).encode("utf-8")
@@ -0,0 +1,518 @@
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import uuid
+import zipfile
+from logging import getLogger
+
+from utils.v2 import (
+    extract_replay,
+    read_replay_data,
+    decode_gzip_data,
+    open_replay_archive,
+    read_replay_data_from_archive,
+    process_replay_files,
+    gameplay_data_member,
+    read_archive_member,
+    parse_replay_data
+)
+from utils.analytics import compute_replay_analytics
+from utils.cache import ReplayCache, replay_cache_key, replay_library_id
+from utils.handles import ArchiveHandle
+from utils.library import ReplayLibrary
+from utils.metrics import ARCHIVE_ITEMS, ERRORS, STAGE_SECONDS
+from utils.singleflight import SingleFlight
+from utils.verify import verify_results
+from utils.workers import ReplayWorkerPool
+from data import MetaData
+
+log = getLogger(__name__)
+
+ARCHIVE_SUFFIXES = (".zip", ".scp")
+# Optional blocks of an item result, only computed when requested
+ANALYTICS = "analytics"
+VERIFICATION = "verification"
+BUNDLE_SPOOL_BYTES = 8 * 1024 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Identical archives / replay items being processed right now, shared by concurrent requests
+ARCHIVE_FLIGHTS = SingleFlight("archive")
+ITEM_FLIGHTS = SingleFlight("item")
+
+class ReplayArchiveError(ValueError):
+    """
+    The archive was readable but does not contain usable replay data. The message is safe to return to the client.
+    """
+
+_replay_cache: ReplayCache | None = None
+
+def get_replay_cache() -> ReplayCache:
+    global _replay_cache
+    if _replay_cache is None:
+        _replay_cache = ReplayCache.from_env()
+    return _replay_cache
+
+_replay_library: ReplayLibrary | None = None
+_replay_library_pid: int | None = None
+
+def get_replay_library() -> ReplayLibrary | None:
+    """
+    The persistent replay library, or None when REPLAY_LIBRARY_PATH is not set.
+    Opened once per process: a forked worker must not reuse the parent's SQLite connection.
+    """
+    global _replay_library, _replay_library_pid
+    if _replay_library_pid != os.getpid():
+        _replay_library = ReplayLibrary.from_env()
+        _replay_library_pid = os.getpid()
+    return _replay_library
+
+def store_in_library(result: dict, item_content_json: dict, cache_key: str | None, log_prefix: str = ""):
+    """
+    Add a successfully parsed item to the replay library, if it is enabled. Never fails the request.
+    The library id comes from ``cache_key``, so an item stored before (e.g. a cache hit) is only looked up.
+    """
+    library = get_replay_library()
+    if library is None or "error" in result or cache_key is None:
+        return
+    try:
+        with STAGE_SECONDS.time(stage="library_store"):
+            library.add(without_analytics(result), (item_content_json.get("item") or {}).get("level"), replay_library_id(cache_key))
+    except Exception as e:
+        log.error(f"[{log_prefix}] Could not store replay in the library: {e}", exc_info=True)
+        ERRORS.inc(type="library_store")
+
+def result_extras(analytics: bool = False, verify: bool = False) -> tuple[str, ...]:
+    """
+    The optional result blocks to compute, in cache key order.
+    """
+    return tuple(extra for extra, requested in ((ANALYTICS, analytics), (VERIFICATION, verify)) if requested)
+
+def decode_replay_item(raw_replay_metadata, item_content_json: dict, gameplay_blob: bytes, item_filename: str, log_prefix: str = "",
+                       extras: tuple[str, ...] = (), cache_key: str | None = None) -> dict:
+    """
+    Turn a gameplay gzip blob into ReplayData.to_dict(), plus the optional blocks named in ``extras``: an "analytics" block
+    and a "verification" verdict (the result recomputed from the inputs). The decode is skipped entirely when the same blob
+    and metadata were parsed before with the same extras. ``cache_key`` is the replay_cache_key() of the item, when the
+    caller already has it.
+    """
+    cache = get_replay_cache()
+    with STAGE_SECONDS.time(stage="cache_lookup"):
+        if cache_key is None:
+            cache_key = replay_cache_key(gameplay_blob, item_content_json, extras)
+        cached = cache.get(cache_key)
+    if cached is not None:
+        log.info(f"[{log_prefix}] Cache hit for {item_filename} ({cache_key}).")
+        return cached
+
+    with STAGE_SECONDS.time(stage="decompress"):
+        gameplay_frame = decode_gzip_data(gameplay_blob)
+    if gameplay_frame is None:
+        log.warning(f"[{log_prefix}] Failed to decompress GZIP for {item_filename}. Skipping.")
+        ERRORS.inc(type="gzip_decode")
+        return {"error": "Failed to decompress gameplay GZIP data."}
+
+    if not isinstance(gameplay_frame, dict):
+        log.warning(f"[{log_prefix}] Decompressed data for {item_filename} is not a replay frame. Skipping.")
+        ERRORS.inc(type="invalid_frame")
+        return {"error": "Decompressed gameplay data is not in the expected replay frame format."}
+
+    with STAGE_SECONDS.time(stage="parse"):
+        replay_data = parse_replay_data(raw_replay_metadata, gameplay_frame)
+        parsed_single_replay_data = replay_data.to_dict()
+    if ANALYTICS in extras:
+        with STAGE_SECONDS.time(stage="analytics"):
+            parsed_single_replay_data["analytics"] = compute_replay_analytics(replay_data.replay)
+    if VERIFICATION in extras:
+        with STAGE_SECONDS.time(stage="verify"):
+            parsed_single_replay_data["verification"] = verify_results([parsed_single_replay_data])[0]
+    with STAGE_SECONDS.time(stage="cache_store"):
+        cache.put(cache_key, parsed_single_replay_data)
+    return parsed_single_replay_data
+
+def without_analytics(result: dict) -> dict:
+    """
+    Shallow copy of an item result without the optional "analytics" block.
+    """
+    if "analytics" not in result:
+        return result
+    return {key: value for key, value in result.items() if key != "analytics"}
+
+def read_replay_item_blob(archive: zipfile.ZipFile, item_content_json: dict) -> bytes | None:
+    """
+    I/O half of an item: read the gameplay member the item points to. Returns None if it cannot be located.
+    """
+    try:
+        url = item_content_json["item"]["data"]["url"]
+    except (KeyError, TypeError):
+        return None
+    with STAGE_SECONDS.time(stage="read_member"):
+        return read_archive_member(archive, gameplay_data_member(url))
+
+def read_keyed_item_blob(archive: zipfile.ZipFile, item_content_json: dict, extras: tuple[str, ...] = ()) -> tuple[bytes | None, str | None]:
+    """
+    read_replay_item_blob plus the replay_cache_key of the blob, both blocking, for one asyncio.to_thread call.
+    """
+    gameplay_blob = read_replay_item_blob(archive, item_content_json)
+    if gameplay_blob is None:
+        return None, None
+    return gameplay_blob, replay_cache_key(gameplay_blob, item_content_json, extras)
+
+def process_replay_item_blob(item_filename: str, item_content_json: dict, gameplay_blob: bytes | None, log_prefix: str = "",
+                             extras: tuple[str, ...] = (), cache_key: str | None = None) -> dict:
+    """
+    CPU half of an item: metadata, gzip decode and parse. Only takes picklable arguments so it can run in a process worker.
+    Failures are returned as {"error": ...} so one bad item does not fail the whole archive.
+    """
+    try:
+        raw_replay_metadata = process_replay_files(item_content_json)
+        if not raw_replay_metadata:
+            log.warning(f"[{log_prefix}] Failed to process metadata for {item_filename}. Skipping.")
+            ERRORS.inc(type="metadata")
+            return {"error": "Failed to process metadata from item JSON."}
+
+        member = gameplay_data_member(raw_replay_metadata.gameplay_data)
+        if gameplay_blob is None:
+            log.warning(f"[{log_prefix}] Gameplay data GZIP member not found for {item_filename} at {member}. Skipping.")
+            ERRORS.inc(type="gameplay_missing")
+            return {"error": f"Gameplay data GZIP file not found at expected location: {pathlib.PurePosixPath(member).name}"}
+
+        parsed_single_replay_data = decode_replay_item(raw_replay_metadata, item_content_json, gameplay_blob, item_filename, log_prefix, extras,
+                                                       cache_key)
+        if "error" not in parsed_single_replay_data:
+            log.info(f"[{log_prefix}] Successfully processed {item_filename}.")
+        return parsed_single_replay_data
+
+    except KeyError as e:
+        log.error(f"[{log_prefix}] Missing key during processing of {item_filename}: {e}", exc_info=True)
+        ERRORS.inc(type="missing_key")
+        return {"error": f"Missing expected data key '{e}' for item {item_filename}."}
+    except Exception as e:
+        log.error(f"[{log_prefix}] Unhandled error processing item {item_filename}: {e}", exc_info=True)
+        ERRORS.inc(type=type(e).__name__)
+        return {"error": f"Unexpected server error processing item {item_filename}: {type(e).__name__}."}
+
+def process_replay_item(archive: zipfile.ZipFile, item_filename: str, item_content_json: dict, log_prefix: str = "",
+                        extras: tuple[str, ...] = ()) -> dict:
+    """
+    Process one replays/local-* item straight from the archive, reading only the gameplay member it points to.
+    """
+    gameplay_blob = read_replay_item_blob(archive, item_content_json)
+    return process_replay_item_blob(item_filename, item_content_json, gameplay_blob, log_prefix, extras)
+
+def open_archive_items(source) -> tuple[zipfile.ZipFile, dict]:
+    """
+    Open an archive and read its replay item JSONs. The caller closes the returned archive.
+    """
+    with STAGE_SECONDS.time(stage="open_archive"):
+        archive = open_replay_archive(source)
+        try:
+            all_replay_items_map = read_replay_data_from_archive(archive)
+        except Exception:
+            archive.close()
+            raise
+    ARCHIVE_ITEMS.observe(len(all_replay_items_map))
+    return archive, all_replay_items_map
+
+def process_archive(archive: zipfile.ZipFile, log_prefix: str = "", extras: tuple[str, ...] = ()) -> dict[str, dict]:
+    """
+    Process every replay item of an opened archive, one after another.
+    Returns an empty dict if the archive has no replay items.
+    """
+    all_replay_items_map = read_replay_data_from_archive(archive)
+    log.info(f"[{log_prefix}] Found {len(all_replay_items_map)} replay item(s) to process.")
+
+    all_processed_replays_data = {}
+    for item_filename, item_content_json in all_replay_items_map.items():
+        all_processed_replays_data[item_filename] = process_replay_item(archive, item_filename, item_content_json, log_prefix, extras)
+    return all_processed_replays_data
+
+def archive_content_hash(source) -> str:
+    """
+    sha1 of an uploaded archive's bytes. Leaves ``source`` at the start.
+    """
+    with STAGE_SECONDS.time(stage="hash_upload"):
+        digest = hashlib.sha1()
+        source.seek(0)
+        while chunk := source.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+        source.seek(0)
+        return digest.hexdigest()
+
+async def parse_item_blob(pool: ReplayWorkerPool, item_filename: str, item_content_json: dict, gameplay_blob: bytes | None,
+                          cache_key: str | None, log_prefix: str = "", extras: tuple[str, ...] = ()) -> dict:
+    """
+    process_replay_item_blob on the pool. Concurrent requests parsing the same gameplay blob with the same item
+    metadata and extras (``cache_key``, from read_keyed_item_blob off the event loop), from any archive, share one run.
+    """
+    if gameplay_blob is None or cache_key is None:
+        return await pool.submit(process_replay_item_blob, item_filename, item_content_json, gameplay_blob, log_prefix, extras)
+    return await ITEM_FLIGHTS.do(cache_key, lambda: pool.submit(
+        process_replay_item_blob, item_filename, item_content_json, gameplay_blob, log_prefix, extras, cache_key
+    ))
+
+async def process_archive_v1(pool: ReplayWorkerPool, source, log_prefix: str = "", extras: tuple[str, ...] = ()) -> dict:
+    """
+    Endpoint v1 pipeline: only the first replay item of the archive, returned as ReplayData.to_dict().
+    Runs on the in-memory engine, so concurrent requests never share files.
+    Raises ReplayArchiveError with the v1 error messages.
+    """
+    archive, all_replay_items_map = await asyncio.to_thread(open_archive_items, source)
+    with archive:
+        if not all_replay_items_map:
+            raise ReplayArchiveError("Replay data not found in the uploaded archive.")
+
+        item_filename, item_content_json = next(iter(all_replay_items_map.items()))
+        gameplay_blob, cache_key = await asyncio.to_thread(read_keyed_item_blob, archive, item_content_json, extras)
+
+    if gameplay_blob is None:
+        raise ReplayArchiveError("Gameplay data file not found in the uploaded archive.")
+
+    result = await parse_item_blob(pool, item_filename, item_content_json, gameplay_blob, cache_key, log_prefix, extras)
+    if "error" in result:
+        raise ReplayArchiveError(result["error"])
+    await asyncio.to_thread(store_in_library, result, item_content_json, cache_key, log_prefix)
+    return result
+
+async def _process_archive_item(pool: ReplayWorkerPool, archive: zipfile.ZipFile, semaphore: asyncio.Semaphore,
+                                item_filename: str, item_content_json: dict, log_prefix: str, extras: tuple[str, ...]) -> tuple[str, dict]:
+    async with semaphore:
+        cache_key = None
+        try:
+            gameplay_blob, cache_key = await asyncio.to_thread(read_keyed_item_blob, archive, item_content_json, extras)
+            result = await parse_item_blob(pool, item_filename, item_content_json, gameplay_blob, cache_key, log_prefix, extras)
+        except Exception as e:
+            log.error(f"[{log_prefix}] Worker failed processing item {item_filename}: {e}", exc_info=True)
+            ERRORS.inc(type=type(e).__name__)
+            result = {"error": f"Unexpected server error processing item {item_filename}: {type(e).__name__}."}
+        await asyncio.to_thread(store_in_library, result, item_content_json, cache_key, log_prefix)
+        return item_filename, result
+
+async def process_archive_concurrently(pool: ReplayWorkerPool, source, log_prefix: str = "", extras: tuple[str, ...] = ()) -> dict[str, dict]:
+    """
+    Fan the replay items of an archive out over the worker pool, at most ``pool.item_parallelism`` at a time.
+    Gameplay members are read here so identical items in flight can be coalesced by content;
+    only the blob bytes are shipped to the worker.
+    Returns an empty dict if the archive has no replay items.
+    """
+    archive, all_replay_items_map = await asyncio.to_thread(open_archive_items, source)
+    with archive:
+        log.info(f"[{log_prefix}] Found {len(all_replay_items_map)} replay item(s) to process.")
+        semaphore = asyncio.Semaphore(pool.item_parallelism)
+        results = await asyncio.gather(*(
+            _process_archive_item(pool, archive, semaphore, name, content, log_prefix, extras)
+            for name, content in all_replay_items_map.items()
+        ))
+    return dict(results)
+
+async def process_archive_coalesced(pool: ReplayWorkerPool, source, log_prefix: str = "", extras: tuple[str, ...] = ()) -> dict[str, dict]:
+    """
+    process_archive_concurrently, shared by concurrent requests uploading an archive with the same content and extras.
+    """
+    archive_hash = await asyncio.to_thread(archive_content_hash, source)
+    return await ARCHIVE_FLIGHTS.do("-".join((archive_hash, *extras)), lambda: process_archive_concurrently(pool, source, log_prefix, extras))
+
+async def iter_archive_concurrently(pool: ReplayWorkerPool, source, log_prefix: str = "", extras: tuple[str, ...] = ()):
+    """
+    Same as process_archive_concurrently, but yields (item_filename, result) as soon as each item is done.
+    Yields nothing if the archive has no replay items.
+    """
+    archive, all_replay_items_map = await asyncio.to_thread(open_archive_items, source)
+    with archive:
+        log.info(f"[{log_prefix}] Found {len(all_replay_items_map)} replay item(s) to stream.")
+        semaphore = asyncio.Semaphore(pool.item_parallelism)
+        tasks = [
+            asyncio.ensure_future(_process_archive_item(pool, archive, semaphore, name, content, log_prefix, extras))
+            for name, content in all_replay_items_map.items()
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+def read_item_metadata(item_filename: str, item_content_json: dict) -> dict:
+    """
+    MetaData.to_dict() of one replay item, from its item JSON only (the gameplay blob is not touched).
+    """
+    try:
+        return MetaData.parser(process_replay_files(item_content_json)).to_dict()
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        log.warning(f"Failed to read metadata for {item_filename}: {type(e).__name__}: {e}")
+        ERRORS.inc(type="metadata")
+        return {"error": "Failed to process metadata from item JSON."}
+
+def index_archive_items(all_replay_items_map: dict[str, dict]) -> dict[str, dict]:
+    with STAGE_SECONDS.time(stage="index"):
+        return {name: read_item_metadata(name, content) for name, content in all_replay_items_map.items()}
+
+async def process_handle_item(pool: ReplayWorkerPool, handle: ArchiveHandle, item_filename: str, log_prefix: str = "",
+                              extras: tuple[str, ...] = ()) -> dict | None:
+    """
+    Parse one item of an indexed archive. Returns None if the item does not exist or the handle was closed meanwhile.
+    """
+    item_content_json = handle.items.get(item_filename)
+    if item_content_json is None:
+        return None
+
+    def read_blob():
+        with handle.lock:
+            if handle.closed:
+                return None, None, False
+            return *read_keyed_item_blob(handle.archive, item_content_json, extras), True
+
+    gameplay_blob, cache_key, is_open = await asyncio.to_thread(read_blob)
+    if not is_open:
+        return None
+    result = await parse_item_blob(pool, item_filename, item_content_json, gameplay_blob, cache_key, log_prefix, extras)
+    await asyncio.to_thread(store_in_library, result, item_content_json, cache_key, log_prefix)
+    return result
+
+def is_replay_archive_name(filename: str) -> bool:
+    return filename.endswith(ARCHIVE_SUFFIXES)
+
+def unpack_archive_bundle(source) -> dict[str, tempfile.SpooledTemporaryFile]:
+    """
+    Copy every .zip/.scp member of a bundle (a zip of replay archives) into its own spooled file,
+    so the nested archives can be opened like regular uploads. The caller closes the returned files.
+    """
+    archives = {}
+    with open_replay_archive(source) as bundle:
+        for info in bundle.infolist():
+            if info.is_dir() or not is_replay_archive_name(info.filename):
+                continue
+            spool = tempfile.SpooledTemporaryFile(max_size=BUNDLE_SPOOL_BYTES)
+            with bundle.open(info) as member:
+                shutil.copyfileobj(member, spool)
+            spool.seek(0)
+            archives[info.filename] = spool
+    return archives
+
+async def process_archive_batch(pool: ReplayWorkerPool, archives: dict, log_prefix: str = "", parallelism: int = 2,
+                                extras: tuple[str, ...] = ()) -> dict[str, dict]:
+    """
+    Process many archives through process_archive_coalesced, at most ``parallelism`` archives at a time.
+    Returns the item results keyed by archive; an archive that cannot be processed gets an {"error": ...} entry instead.
+    """
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def run_archive(archive_name: str, source) -> tuple[str, dict]:
+        async with semaphore:
+            archive_prefix = f"{log_prefix}/{archive_name}"
+            try:
+                results = await process_archive_coalesced(pool, source, archive_prefix, extras)
+            except (zipfile.BadZipFile, zipfile.LargeZipFile) as e:
+                log.warning(f"[{archive_prefix}] Invalid or unsupported ZIP/SCP file: {e}")
+                return archive_name, {"error": f"The provided archive file is invalid or unsupported: {e}"}
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                log.warning(f"[{archive_prefix}] Malformed replay item JSON: {e}")
+                return archive_name, {"error": f"A replay item (local-*.json) of the archive is not valid JSON: {e}"}
+            except Exception as e:
+                log.error(f"[{archive_prefix}] Unhandled error processing archive: {e}", exc_info=True)
+                return archive_name, {"error": f"Unexpected server error processing archive {archive_name}: {type(e).__name__}."}
+
+            if not results:
+                return archive_name, {"error": "No replay item data (e.g., local-*.json) found in the archive's 'replays' folder."}
+            return archive_name, results
+
+    return dict(await asyncio.gather(*(run_archive(name, source) for name, source in archives.items())))
+
+def process_archive_on_disk(uploaded_file_path: pathlib.Path, log_prefix: str = "", extras: tuple[str, ...] = ()) -> dict[str, dict] | None:
+    """
+    Legacy mode: extract the whole archive next to the uploaded file and process the replay items from disk.
+    Returns None if the sonolus content directory is missing after extraction,
+    or an empty dict if the archive has no replay items.
+    """
+    log.info(f"[{log_prefix}] Extracting archive: {uploaded_file_path}")
+    with STAGE_SECONDS.time(stage="extract"):
+        sonolus_content_dir = extract_replay(uploaded_file_path)
+    log.info(f"[{log_prefix}] Archive extracted. Sonolus content root: {sonolus_content_dir}")
+
+    if not sonolus_content_dir.exists() or not sonolus_content_dir.is_dir():
+        return None
+
+    log.info(f"[{log_prefix}] Reading all replay item data from {sonolus_content_dir / 'replays'}")
+    all_replay_items_map = read_replay_data(sonolus_content_dir)
+    ARCHIVE_ITEMS.observe(len(all_replay_items_map))
+    log.info(f"[{log_prefix}] Found {len(all_replay_items_map)} replay item(s) to process.")
+
+    all_processed_replays_data = {}
+    for item_filename, item_content_json in all_replay_items_map.items():
+        item_processing_uuid = str(uuid.uuid4())
+        log.info(f"[{log_prefix}/{item_processing_uuid}] Processing replay item: {item_filename}")
+
+        try:
+            raw_replay_metadata = process_replay_files(item_content_json)
+            if not raw_replay_metadata:
+                log.warning(f"[{log_prefix}/{item_processing_uuid}] Failed to process metadata for {item_filename}. Skipping.")
+                ERRORS.inc(type="metadata")
+                all_processed_replays_data[item_filename] = {"error": "Failed to process metadata from item JSON."}
+                continue
+
+            gameplay_data_url_in_json = raw_replay_metadata.gameplay_data
+            log.info(f"[{log_prefix}/{item_processing_uuid}] Raw gameplay data URL from JSON: {gameplay_data_url_in_json}")
+
+            path_suffix_from_url = pathlib.Path(gameplay_data_url_in_json)
+            path_inside_sonolus_dir: pathlib.Path
+            if str(path_suffix_from_url).lower().startswith(("/sonolus/", "\\sonolus\\")):
+                path_inside_sonolus_dir = pathlib.Path(*path_suffix_from_url.parts[2:])
+            else:
+                path_inside_sonolus_dir = pathlib.Path(str(path_suffix_from_url).lstrip('/\\'))
+
+            gameplay_data_gzip_path = (sonolus_content_dir / path_inside_sonolus_dir).resolve()
+
+            log.info(f"[{log_prefix}/{item_processing_uuid}] Sonolus content directory: {sonolus_content_dir}")
+            log.info(f"[{log_prefix}/{item_processing_uuid}] Calculated path suffix from URL: {path_inside_sonolus_dir}")
+            log.info(f"[{log_prefix}/{item_processing_uuid}] Attempting to locate GZIP file at: {gameplay_data_gzip_path}")
+
+            try:
+                resolved_sonolus_content_dir = sonolus_content_dir.resolve()
+                resolved_gameplay_data_path = gameplay_data_gzip_path # Already resolved
+
+                is_safe_path = False
+                if hasattr(pathlib.Path, 'is_relative_to'):
+                    if resolved_gameplay_data_path.is_relative_to(resolved_sonolus_content_dir):
+                        is_safe_path = True
+                else:
+                    try:
+                        common = pathlib.Path(os.path.commonpath([str(resolved_sonolus_content_dir), str(resolved_gameplay_data_path)]))
+                        if common == resolved_sonolus_content_dir:
+                            is_safe_path = True
+                    except ValueError:
+                        is_safe_path = False
+
+                if not is_safe_path:
+                    log.warning(f"[{log_prefix}/{item_processing_uuid}] Security Alert or Path Mismatch: Resolved GZIP path {resolved_gameplay_data_path} is not confirmed to be within {resolved_sonolus_content_dir}. Check archive structure and JSON URLs.")
+            except Exception as e_path_check:
+                log.error(f"[{log_prefix}/{item_processing_uuid}] Error during path safety check: {e_path_check}", exc_info=True)
+
+
+            if not gameplay_data_gzip_path.exists():
+                log.warning(f"[{log_prefix}/{item_processing_uuid}] Gameplay data GZIP file not found for {item_filename} at {gameplay_data_gzip_path}. Skipping.")
+                ERRORS.inc(type="gameplay_missing")
+                all_processed_replays_data[item_filename] = {"error": f"Gameplay data GZIP file not found at expected location: {gameplay_data_gzip_path.name}"}
+                continue
+
+            log.info(f"[{log_prefix}/{item_processing_uuid}] Decoding GZIP file: {gameplay_data_gzip_path} for {item_filename}")
+            gameplay_blob = gameplay_data_gzip_path.read_bytes()
+            cache_key = replay_cache_key(gameplay_blob, item_content_json, extras)
+            all_processed_replays_data[item_filename] = decode_replay_item(
+                raw_replay_metadata, item_content_json, gameplay_blob, item_filename, f"{log_prefix}/{item_processing_uuid}", extras, cache_key
+            )
+            if "error" not in all_processed_replays_data[item_filename]:
+                log.info(f"[{log_prefix}/{item_processing_uuid}] Successfully processed {item_filename}.")
+                store_in_library(all_processed_replays_data[item_filename], item_content_json, cache_key, f"{log_prefix}/{item_processing_uuid}")
+
+        except KeyError as e:
+            log.error(f"[{log_prefix}/{item_processing_uuid}] Missing key during processing of {item_filename}: {e}", exc_info=True)
+            ERRORS.inc(type="missing_key")
+            all_processed_replays_data[item_filename] = {"error": f"Missing expected data key '{e}' for item {item_filename}."}
+        except Exception as e:
+            log.error(f"[{log_prefix}/{item_processing_uuid}] Unhandled error processing item {item_filename}: {e}", exc_info=True)
+            ERRORS.inc(type=type(e).__name__)
+            all_processed_replays_data[item_filename] = {"error": f"Unexpected server error processing item {item_filename}: {type(e).__name__}."}
+    return all_processed_replays_data
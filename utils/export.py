@@ -0,0 +1,171 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+
+log = getLogger(__name__)
+
+MANIFEST_NAME = ".export-manifest.json"
+MANIFEST_SAVE_EVERY = 500
+CHECK_MODES = ("mtime", "hash", "none")
+
+# export_blob statuses
+EXPORTED, UP_TO_DATE, INVALID, FAILED = "exported", "up-to-date", "invalid", "failed"
+
+def output_path_for(input_path: pathlib.Path, output_dir: pathlib.Path) -> pathlib.Path:
+    # Same naming as decompress_gzip_file
+    return output_dir / f"{input_path.name}.json"
+
+def file_sha1(path: pathlib.Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def export_options(compact: bool) -> dict:
+    """
+    The options that change an output's content, recorded in its manifest entry.
+    """
+    return {"compact": compact}
+
+def export_blob(input_path: pathlib.Path, output_dir: pathlib.Path, compact: bool = False, check: str = "mtime", known: dict | None = None) -> tuple:
+    """
+    Decode one gzip'd JSON-lines repository blob to <output_dir>/<name>.json, like decompress_gzip_file.
+    Skipped when the output is up to date: written with the same options (``known`` is its manifest entry) and
+    newer than the input (check="mtime") or written from an input with the same content hash (check="hash").
+    The output is written to a temporary file first, so an interrupted run never leaves a partial output behind.
+    Returns (status, input name, input bytes, output bytes, manifest entry or None, error message or None).
+    """
+    output_path = output_path_for(input_path, output_dir)
+    options = export_options(compact)
+    try:
+        input_size = input_path.stat().st_size
+        entry = {"sha1": file_sha1(input_path) if check == "hash" else None, "options": options}
+
+        if output_path.exists() and isinstance(known, dict) and known.get("options") == options:
+            if check == "mtime" and output_path.stat().st_mtime >= input_path.stat().st_mtime:
+                return UP_TO_DATE, input_path.name, input_size, 0, entry, None
+            if check == "hash" and known.get("sha1") == entry["sha1"]:
+                return UP_TO_DATE, input_path.name, input_size, 0, entry, None
+
+        with gzip.open(input_path, "rt", encoding="utf-8") as data:
+            jsonlines = [json.loads(line) for line in data if line.strip()]
+
+        tmp_path = output_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as output_file:
+                if compact:
+                    json.dump(jsonlines, output_file, separators=(",", ":"))
+                else:
+                    json.dump(jsonlines, output_file, indent=2)
+            os.replace(tmp_path, output_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return EXPORTED, input_path.name, input_size, output_path.stat().st_size, entry, None
+
+    except (OSError, EOFError, zlib.error, json.JSONDecodeError, UnicodeDecodeError) as e:
+        # Thumbnails, charts and other non gameplay blobs live in the same repository folder
+        status = INVALID if isinstance(e, (gzip.BadGzipFile, json.JSONDecodeError, UnicodeDecodeError, EOFError, zlib.error)) else FAILED
+        return status, input_path.name, 0, 0, None, f"{type(e).__name__}: {e}"
+
+def collect_inputs(folder: pathlib.Path, filters: list | None) -> list[pathlib.Path]:
+    seen = set()
+    inputs = []
+    for pattern in filters or ["*"]:
+        for path in folder.glob(str(pattern)):
+            if path.is_file() and path not in seen and not path.name.endswith((".tmp", ".json")):
+                seen.add(path)
+                inputs.append(path)
+    return sorted(inputs)
+
+def load_manifest(output_dir: pathlib.Path) -> dict[str, dict]:
+    try:
+        return json.loads((output_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(output_dir: pathlib.Path, manifest: dict[str, dict]):
+    tmp_path = output_dir / f"{MANIFEST_NAME}.tmp"
+    tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp_path, output_dir / MANIFEST_NAME)
+
+def format_progress(counts: dict, done: int, total: int, bytes_in: int, started: float) -> str:
+    elapsed = max(time.monotonic() - started, 1e-9)
+    rate = done / elapsed
+    eta = (total - done) / rate if rate else 0
+    return (f"{done}/{total} ({done / total:.0%}) | {rate:.0f} files/s, {bytes_in / elapsed / (1024 * 1024):.1f} MiB/s | "
+            f"exported {counts[EXPORTED]}, up to date {counts[UP_TO_DATE]}, invalid {counts[INVALID]}, failed {counts[FAILED]} | "
+            f"ETA {eta:.0f}s")
+
+def export_repository(folder: pathlib.Path = pathlib.Path("./sonolus/repository/"), output_dir: pathlib.Path = pathlib.Path("Export"),
+                      filters: list | None = None, jobs: int | None = None, compact: bool = False, check: str = "mtime",
+                      progress_interval: float = 1.0, chunksize: int = 16) -> dict:
+    """
+    Export every repository blob matching ``filters`` (glob patterns, default all) over a process pool.
+    Safe to re-run: outputs that are up to date are skipped, so an interrupted export resumes where it stopped.
+    Returns the per-status counts.
+    """
+    if check not in CHECK_MODES:
+        raise ValueError(f"Unknown check mode '{check}', expected one of {CHECK_MODES}.")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    inputs = collect_inputs(folder, filters)
+    # Kept in every check mode: an output only counts as up to date if it was written with the current options
+    manifest = load_manifest(output_dir)
+    counts = {EXPORTED: 0, UP_TO_DATE: 0, INVALID: 0, FAILED: 0}
+    total = len(inputs)
+    log.info(f"Exporting {total} blob(s) from {folder} to {output_dir} (check: {check}, compact: {compact}).")
+    if not total:
+        return counts
+
+    started = last_report = time.monotonic()
+    bytes_in = 0
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(
+            export_blob, inputs, [output_dir] * total, [compact] * total, [check] * total,
+            [manifest.get(path.name) for path in inputs], chunksize=chunksize
+        )
+        for done, (status, name, size, _, entry, error) in enumerate(results, start=1):
+            counts[status] += 1
+            bytes_in += size
+            if error:
+                (log.debug if status == INVALID else log.error)(f"{name}: {error}")
+            if entry and status in (EXPORTED, UP_TO_DATE):
+                manifest[name] = entry
+                if status == EXPORTED and counts[EXPORTED] % MANIFEST_SAVE_EVERY == 0:
+                    save_manifest(output_dir, manifest)
+
+            now = time.monotonic()
+            if progress_interval and (now - last_report >= progress_interval or done == total):
+                print(format_progress(counts, done, total, bytes_in, started), file=sys.stderr, flush=True)
+                last_report = now
+
+    save_manifest(output_dir, manifest)
+    log.info(f"Export finished in {time.monotonic() - started:.1f}s: {counts}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode Sonolus repository gameplay blobs to JSON files.")
+    parser.add_argument("filters", nargs="*", default=["*"], help="glob patterns inside the repository folder (default: all)")
+    parser.add_argument("--repository", type=pathlib.Path, default=pathlib.Path("./sonolus/repository/"))
+    parser.add_argument("--output", type=pathlib.Path, default=pathlib.Path("Export"))
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--compact", action="store_true", help="write compact JSON instead of indent=2")
+    parser.add_argument("--check", choices=CHECK_MODES, default="mtime",
+                        help="skip outputs newer than their input (mtime), written from identical input (hash), or never (none)")
+    args = parser.parse_args()
+
+    counts = export_repository(args.repository, args.output, args.filters, args.jobs, args.compact, args.check)
+    sys.exit(1 if counts[FAILED] else 0)
+
+if __name__ == "__main__":
+    main()
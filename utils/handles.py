@@ -0,0 +1,119 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from logging import getLogger
+
+from utils.v2 import open_replay_archive, read_replay_data_from_archive
+
+log = getLogger(__name__)
+
+HANDLE_SPOOL_BYTES = 8 * 1024 * 1024
+
+class ArchiveHandle:
+    """
+    An uploaded archive kept open after an index request, so single items can be parsed later without a re-upload.
+    Items are read under ``lock`` so a read never races close() (expiry or LRU eviction) closing the archive and its spool.
+    """
+    def __init__(self, handle: str, spool, archive: zipfile.ZipFile, items: dict[str, dict], ttl: float):
+        self.handle = handle
+        self.spool = spool
+        self.archive = archive
+        self.items = items
+        self.ttl = ttl
+        self.expires_at = time.monotonic() + ttl
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() > self.expires_at
+
+    def touch(self):
+        self.expires_at = time.monotonic() + self.ttl
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.archive.close()
+            self.spool.close()
+
+class ArchiveHandleStore:
+    """
+    Handles of indexed archives, each kept for ``ttl`` seconds after its last use. At most ``max_handles``
+    are open at once; opening one more closes the least recently used.
+    """
+    def __init__(self, ttl: float = 300.0, max_handles: int = 32):
+        self.ttl = ttl
+        self.max_handles = max_handles
+        self._handles: dict[str, ArchiveHandle] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ArchiveHandleStore":
+        return cls(
+            ttl=float(os.environ.get("REPLAY_HANDLE_TTL", 300)),
+            max_handles=int(os.environ.get("REPLAY_HANDLE_MAX", 32))
+        )
+
+    def open(self, source) -> ArchiveHandle:
+        """
+        Copy ``source`` (the upload's file object) into a spooled file owned by the handle and read its replay item JSONs.
+        Blocking, run it off the event loop.
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=HANDLE_SPOOL_BYTES)
+        try:
+            source.seek(0)
+            shutil.copyfileobj(source, spool)
+            spool.seek(0)
+            archive = open_replay_archive(spool)
+            items = read_replay_data_from_archive(archive)
+        except Exception:
+            spool.close()
+            raise
+
+        handle = ArchiveHandle(str(uuid.uuid4()), spool, archive, items, self.ttl)
+        evicted = []
+        with self._lock:
+            evicted += self._pop_expired()
+            while len(self._handles) >= self.max_handles:
+                oldest = min(self._handles.values(), key=lambda h: h.expires_at)
+                evicted.append(self._handles.pop(oldest.handle))
+            self._handles[handle.handle] = handle
+        for old in evicted:
+            old.close()
+        return handle
+
+    def get(self, handle: str) -> ArchiveHandle | None:
+        with self._lock:
+            evicted = self._pop_expired()
+            archive_handle = self._handles.get(handle)
+            if archive_handle is not None:
+                archive_handle.touch()
+        for old in evicted:
+            old.close()
+        return archive_handle
+
+    def release(self, handle: str) -> bool:
+        with self._lock:
+            archive_handle = self._handles.pop(handle, None)
+        if archive_handle is None:
+            return False
+        archive_handle.close()
+        return True
+
+    def close(self):
+        with self._lock:
+            handles, self._handles = list(self._handles.values()), {}
+        for archive_handle in handles:
+            archive_handle.close()
+
+    def _pop_expired(self) -> list[ArchiveHandle]:
+        expired = [h for h in self._handles.values() if h.expired]
+        for archive_handle in expired:
+            del self._handles[archive_handle.handle]
+            log.info(f"Archive handle {archive_handle.handle} expired.")
+        return expired
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from logging import getLogger
+
+log = getLogger(__name__)
+
+# (input key, array typecode) of every stored column, in blob order; the dtypes keep the parsed values exactly
+INPUT_COLUMNS = (
+    ("entityIndex", "i"),
+    ("time", "d"),
+    ("judgment", "b"),
+    ("accuracy", "d")
+)
+MAX_PAGE_SIZE = 500
+
+# sort parameter -> column
+SORT_COLUMNS = {
+    "added": "added_at",
+    "saved": "save_time",
+    "title": "title",
+    "level": "level_title",
+    "difficulty": "difficulty",
+    "rating": "rating",
+    "score": "arcade_score",
+    "accuracy": "accuracy_score",
+    "combo": "combo",
+    "inputs": "input_count"
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS replays (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    title TEXT,
+    version INTEGER,
+    level_name TEXT,
+    level_title TEXT,
+    rating INTEGER,
+    difficulty TEXT,
+    thumbnail TEXT,
+    grade TEXT,
+    arcade_score INTEGER,
+    accuracy_score REAL,
+    combo INTEGER,
+    perfect INTEGER,
+    great INTEGER,
+    good INTEGER,
+    miss INTEGER,
+    total_count INTEGER,
+    duration REAL,
+    start_time INTEGER,
+    save_time INTEGER,
+    input_offset REAL,
+    input_count INTEGER,
+    added_at REAL,
+    metadata TEXT,
+    inputs BLOB
+);
+CREATE TABLE IF NOT EXISTS replay_mods (
+    replay_id TEXT NOT NULL REFERENCES replays(id) ON DELETE CASCADE,
+    mod TEXT NOT NULL,
+    PRIMARY KEY (mod, replay_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS replays_difficulty ON replays (difficulty, rating);
+CREATE INDEX IF NOT EXISTS replays_level ON replays (level_title, difficulty);
+CREATE INDEX IF NOT EXISTS replays_rating ON replays (rating);
+CREATE INDEX IF NOT EXISTS replays_score ON replays (arcade_score);
+CREATE INDEX IF NOT EXISTS replays_accuracy ON replays (accuracy_score);
+CREATE INDEX IF NOT EXISTS replays_added ON replays (added_at);
+CREATE INDEX IF NOT EXISTS replays_saved ON replays (save_time);
+"""
+
+SUMMARY_COLUMNS = (
+    "id", "name", "title", "level_name", "level_title", "rating", "difficulty", "thumbnail", "grade",
+    "arcade_score", "accuracy_score", "combo", "perfect", "great", "good", "miss", "total_count",
+    "duration", "save_time", "input_count", "added_at"
+)
+
+def pack_inputs(inputs: dict) -> bytes:
+    """
+    Input columns as one zlib compressed blob: uint32 count, then every column of INPUT_COLUMNS little-endian.
+    """
+    count = len(inputs["judgment"])
+    packed = bytearray(struct.pack("<I", count))
+    for key, typecode in INPUT_COLUMNS:
+        column = array(typecode, inputs[key][:count])
+        if sys.byteorder == "big":
+            column.byteswap()
+        packed += column.tobytes()
+    return zlib.compress(bytes(packed), 6)
+
+def unpack_inputs(blob: bytes) -> dict:
+    packed = zlib.decompress(blob)
+    (count,) = struct.unpack_from("<I", packed)
+    offset = 4
+    inputs = {}
+    for key, typecode in INPUT_COLUMNS:
+        column = array(typecode)
+        size = count * column.itemsize
+        column.frombytes(packed[offset:offset + size])
+        if sys.byteorder == "big":
+            column.byteswap()
+        inputs[key] = column.tolist()
+        offset += size
+    return inputs
+
+class ReplayLibrary:
+    """
+    Persistent store of parsed replays: metadata and result columns in an indexed SQLite table
+    (mods in their own indexed table), input columns as compact blobs. Replays are keyed by a hash
+    of their gameplay blob and item metadata (utils.cache.replay_library_id), so storing the same replay
+    twice is a no-op.
+    """
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA foreign_keys=ON")
+            self._connection.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> "ReplayLibrary | None":
+        """
+        The library is optional: enabled by setting REPLAY_LIBRARY_PATH.
+        """
+        path = os.environ.get("REPLAY_LIBRARY_PATH")
+        return cls(pathlib.Path(path)) if path else None
+
+    def add(self, result: dict, level: dict | None = None, replay_id: str | None = None) -> str | None:
+        """
+        Store one parsed replay (ReplayData.to_dict() output). ``level`` is the item JSON's level, which
+        MetaData.to_dict() leaves out. A replay already stored under ``replay_id`` is not packed again;
+        without one the id is a hash of the packed inputs and metadata.
+        Returns the replay id, or None if ``result`` is not a parsed replay.
+        """
+        if replay_id is not None and self.contains(replay_id):
+            return replay_id
+        try:
+            metadata, replay, replay_result = result["metadata"], result["replay"], result["result"]
+            inputs = pack_inputs(replay["inputs"])
+        except (KeyError, TypeError):
+            return None
+
+        metadata_json = json.dumps(metadata, sort_keys=True)
+        if replay_id is None:
+            replay_id = hashlib.sha1(inputs + metadata_json.encode("utf-8")).hexdigest()
+        level = level or metadata.get("level") or {}
+        row = {
+            "id": replay_id,
+            "name": metadata.get("name"),
+            "title": metadata.get("title"),
+            "version": metadata.get("version"),
+            "level_name": level.get("name"),
+            "level_title": level.get("title"),
+            "rating": metadata.get("rating"),
+            "difficulty": metadata.get("difficulty"),
+            "thumbnail": metadata.get("thumbnail"),
+            "grade": replay_result.get("grade"),
+            "arcade_score": replay_result.get("arcadeScore"),
+            "accuracy_score": replay_result.get("accuracyScore"),
+            "combo": replay_result.get("combo"),
+            "perfect": replay_result.get("perfect"),
+            "great": replay_result.get("great"),
+            "good": replay_result.get("good"),
+            "miss": replay_result.get("miss"),
+            "total_count": replay_result.get("totalCount"),
+            "duration": replay.get("duration"),
+            "start_time": replay.get("startTime"),
+            "save_time": replay.get("saveTime"),
+            "input_offset": replay.get("inputOffset"),
+            "input_count": len(replay["inputs"]["judgment"]),
+            "added_at": time.time(),
+            "metadata": metadata_json,
+            "inputs": inputs
+        }
+        columns = ", ".join(row)
+        placeholders = ", ".join(f":{key}" for key in row)
+        with self._lock, self._connection:
+            inserted = self._connection.execute(f"INSERT OR IGNORE INTO replays ({columns}) VALUES ({placeholders})", row).rowcount
+            if inserted:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO replay_mods (replay_id, mod) VALUES (?, ?)",
+                    [(replay_id, str(mod).upper()) for mod in metadata.get("mod") or []]
+                )
+        return replay_id
+
+    def contains(self, replay_id: str) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM replays WHERE id = ?", (replay_id,)).fetchone() is not None
+
+    def query(self, difficulty: str | None = None, level: str | None = None, mods: list[str] | None = None,
+              min_rating: int | None = None, max_rating: int | None = None, grade: str | None = None,
+              title: str | None = None, sort: str = "added", descending: bool = True,
+              limit: int = 50, offset: int = 0) -> dict:
+        """
+        Filter, sort and paginate the stored replays. ``mods`` must all be present (e.g. ["HD", "DT"]).
+        ``level`` matches the level title or name, ``title`` is a substring match on the replay title.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort key '{sort}', expected one of {tuple(SORT_COLUMNS)}.")
+
+        conditions, parameters = [], []
+        if difficulty is not None:
+            conditions.append("difficulty = ?")
+            parameters.append(difficulty.upper())
+        if level is not None:
+            conditions.append("(level_title = ? OR level_name = ?)")
+            parameters += [level, level]
+        if min_rating is not None:
+            conditions.append("rating >= ?")
+            parameters.append(min_rating)
+        if max_rating is not None:
+            conditions.append("rating <= ?")
+            parameters.append(max_rating)
+        if grade is not None:
+            conditions.append("grade = ?")
+            parameters.append(grade)
+        if title is not None:
+            conditions.append("title LIKE ? ESCAPE '\\'")
+            parameters.append("%" + title.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        for mod in mods or []:
+            conditions.append("id IN (SELECT replay_id FROM replay_mods WHERE mod = ?)")
+            parameters.append(mod.upper())
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = f"{SORT_COLUMNS[sort]} {'DESC' if descending else 'ASC'}, id"
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+
+        with self._lock:
+            total = self._connection.execute(f"SELECT COUNT(*) FROM replays {where}", parameters).fetchone()[0]
+            rows = self._connection.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM replays {where} ORDER BY {order} LIMIT ? OFFSET ?",
+                [*parameters, limit, offset]
+            ).fetchall()
+            ids = [row["id"] for row in rows]
+            mods_by_id = {replay_id: [] for replay_id in ids}
+            if ids:
+                for mod_row in self._connection.execute(
+                    f"SELECT replay_id, mod FROM replay_mods WHERE replay_id IN ({', '.join('?' * len(ids))})", ids
+                ):
+                    mods_by_id[mod_row["replay_id"]].append(mod_row["mod"])
+
+        return {
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "items": [{**dict(row), "mod": mods_by_id[row["id"]]} for row in rows]
+        }
+
+    def get(self, replay_id: str, with_inputs: bool = True) -> dict | None:
+        """
+        A stored replay in the /replayv2 item shape (metadata, replay, result).
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM replays WHERE id = ?", (replay_id,)).fetchone()
+        if row is None:
+            return None
+        return self._row_to_replay(row, with_inputs)
+
+    def iter_replays(self, batch_size: int = 500):
+        """
+        Every stored replay, in batches of (id, replay) pairs in the get() shape.
+        """
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT * FROM replays WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [(row["id"], self._row_to_replay(row, True)) for row in rows]
+            last_id = rows[-1]["id"]
+
+    @staticmethod
+    def _row_to_replay(row: sqlite3.Row, with_inputs: bool) -> dict:
+        replay_result = {
+            "grade": row["grade"],
+            "arcadeScore": row["arcade_score"],
+            "accuracyScore": row["accuracy_score"],
+            "combo": row["combo"],
+            "perfect": row["perfect"],
+            "great": row["great"],
+            "good": row["good"],
+            "miss": row["miss"],
+            "totalCount": row["total_count"]
+        }
+        replay = {
+            "startTime": row["start_time"],
+            "saveTime": row["save_time"],
+            "duration": row["duration"],
+            "inputOffset": row["input_offset"],
+            "result": replay_result
+        }
+        if with_inputs:
+            replay["inputs"] = unpack_inputs(row["inputs"])
+        return {"id": row["id"], "metadata": json.loads(row["metadata"]), "replay": replay, "result": replay_result}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
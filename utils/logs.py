@@ -0,0 +1,82 @@
+import logging
+import pathlib
+import re
+
+LOG_DIR = pathlib.Path(".logs")
+ACCESS_LOG_NAME = "Access_log.log"
+READ_CHUNK_BYTES = 64 * 1024
+
+# File format: "%(asctime)s %(name)s:%(lineno)d [%(levelname)s] - %(message)s"
+RECORD_START = re.compile(rb"^\d{2}-\d{2}-\d{4} \d{2}:\d{2}:\d{2} \S+ \[(?P<level>[A-Z]+)\] - ")
+
+def log_file_path(backup: int = 0) -> pathlib.Path:
+    """
+    The current log file, or its ``backup``-th rotated file (Access_log.log.1 is the most recent one).
+    """
+    return LOG_DIR / (ACCESS_LOG_NAME if backup == 0 else f"{ACCESS_LOG_NAME}.{backup}")
+
+def parse_level(level: str) -> int | None:
+    value = logging.getLevelName(level.upper())
+    return value if isinstance(value, int) else None
+
+def tail_offset(path: pathlib.Path, lines: int, end: int) -> int:
+    """
+    Byte offset where the last ``lines`` lines before ``end`` start, found by reading backwards in chunks.
+    """
+    if lines <= 0:
+        return end
+    with open(path, "rb") as f:
+        position = end
+        # A trailing newline ends the last line instead of starting an empty one
+        f.seek(max(end - 1, 0))
+        newlines = -1 if end and f.read(1) == b"\n" else 0
+        while position > 0:
+            read_size = min(READ_CHUNK_BYTES, position)
+            position -= read_size
+            f.seek(position)
+            chunk = f.read(read_size)
+            index = len(chunk)
+            while (index := chunk.rfind(b"\n", 0, index)) != -1:
+                newlines += 1
+                if newlines == lines:
+                    return position + index + 1
+    return 0
+
+def iter_log_bytes(path: pathlib.Path, start: int, end: int):
+    """
+    Yield the bytes in [start, end) of a log file, READ_CHUNK_BYTES at a time.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0 and (chunk := f.read(min(READ_CHUNK_BYTES, remaining))):
+            remaining -= len(chunk)
+            yield chunk
+
+def iter_log_records(path: pathlib.Path, start: int, end: int, min_level: int):
+    """
+    Yield the lines in [start, end) that belong to records of ``min_level`` or above.
+    Continuation lines (tracebacks) follow the record they belong to; a partial record at ``start`` is skipped.
+    """
+    keep = False
+    pending = b""
+    for chunk in iter_log_bytes(path, start, end):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        kept = []
+        for line in lines:
+            match = RECORD_START.match(line)
+            if match:
+                level = parse_level(match["level"].decode("ascii"))
+                keep = level is not None and level >= min_level
+            if keep:
+                kept.append(line + b"\n")
+        if kept:
+            yield b"".join(kept)
+    if pending:
+        match = RECORD_START.match(pending)
+        if match:
+            level = parse_level(match["level"].decode("ascii"))
+            keep = level is not None and level >= min_level
+        if keep:
+            yield pending
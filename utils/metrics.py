@@ -0,0 +1,245 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, tuned for per-stage timings of a replay pipeline (sub-millisecond reads up to multi-second archives)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_capture = threading.local()
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _format_labels(labelnames: tuple, key: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if _record(self, "inc", amount, labels):
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        if _record(self, "set", value, labels):
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if _record(self, "observe", value, labels):
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            # cumulative bucket counts, then +Inf (which doubles as the total count) and the sum
+            counts = self._values.setdefault(key, [0] * len(self.buckets) + [0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def totals(self) -> dict[tuple, tuple[int, float]]:
+        """
+        (count, sum) of every label set
+        """
+        with self._lock:
+            return {key: (counts[-2], counts[-1]) for key, counts in self._values.items()}
+
+    def render(self) -> list[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self._values.items():
+                labels = _format_labels(self.labelnames, key)
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                lines.append(f"{self.name}_count{labels} {counts[-2]}")
+                lines.append(f"{self.name}_sum{labels} {counts[-1]}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str):
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+def _record(metric, method: str, value: float, labels: dict) -> bool:
+    """
+    Inside run_captured the observation is buffered instead of recorded, so it can be shipped back from a process worker.
+    """
+    samples = getattr(_capture, "samples", None)
+    if samples is None:
+        return False
+    samples.append((metric.name, method, value, labels))
+    return True
+
+def run_captured(fn, *args):
+    """
+    Run ``fn(*args)`` and return (result, samples) with every metric observation made during the call.
+    Used for process workers, whose registry is not the one served by /metrics.
+    """
+    _capture.samples = []
+    try:
+        return fn(*args), _capture.samples
+    finally:
+        _capture.samples = None
+
+def merge_samples(samples: list):
+    for name, method, value, labels in samples:
+        getattr(REGISTRY.get(name), method)(value, **labels)
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "replay_stage_seconds", "Time spent in each stage of the replay pipeline.", ("stage",)
+))
+ARCHIVE_ITEMS = REGISTRY.register(Histogram(
+    "replay_archive_items", "Number of replay items per processed archive.", buckets=COUNT_BUCKETS
+))
+ERRORS = REGISTRY.register(Counter(
+    "replay_errors_total", "Replay pipeline errors by type.", ("type",)
+))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "replay_http_requests_in_flight", "Requests currently being handled.", ("path",)
+))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "replay_http_request_seconds", "Request latency, from the first byte received to the last byte sent.", ("path",)
+))
+HTTP_RESPONSES = REGISTRY.register(Counter(
+    "replay_http_responses_total", "Responses by path and status code.", ("path", "status")
+))
+HTTP_BYTES_IN = REGISTRY.register(Counter(
+    "replay_http_request_bytes_total", "Request body bytes received.", ("path",)
+))
+HTTP_BYTES_OUT = REGISTRY.register(Counter(
+    "replay_http_response_bytes_total", "Response body bytes sent.", ("path",)
+))
+ADMISSION_QUEUED = REGISTRY.register(Gauge(
+    "replay_admission_queued", "Upload requests waiting for a processing slot."
+))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "replay_admission_wait_seconds", "Time queued upload requests waited for a processing slot."
+))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "replay_admission_rejected_total", "Upload requests rejected by admission control, by status code.", ("status",)
+))
+WORKSPACES = REGISTRY.register(Gauge(
+    "replay_workspaces", "On-disk pipeline workspaces by state (in_use, idle).", ("state",)
+))
+WORKSPACE_BYTES = REGISTRY.register(Gauge(
+    "replay_workspace_bytes", "Disk used under the workspace root, as of the last janitor pass."
+))
+WORKSPACE_SWEPT = REGISTRY.register(Counter(
+    "replay_workspace_swept_total", "Orphaned, stale or over budget entries removed from the workspace root."
+))
+CACHE_EVENTS = REGISTRY.register(Counter(
+    "replay_cache_events_total", "Parsed replay cache lookups, stores and evictions of every worker, by event.", ("event",)
+))
+COALESCED = REGISTRY.register(Counter(
+    "replay_coalesced_total", "Requests that shared an identical archive or replay item run already in flight, by kind.", ("kind",)
+))
+
+class MetricsMiddleware:
+    """
+    Records in-flight requests, latency, status codes and bytes in/out for ``paths``.
+    """
+    def __init__(self, app, paths: tuple[str, ...]):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        status = 500
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                HTTP_BYTES_IN.inc(len(message.get("body", b"")), path=path)
+            return message
+
+        async def counting_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                HTTP_BYTES_OUT.inc(len(message.get("body", b"")), path=path)
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(path=path)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            HTTP_IN_FLIGHT.dec(path=path)
+            HTTP_SECONDS.observe(time.perf_counter() - start, path=path)
+            HTTP_RESPONSES.inc(path=path, status=status)
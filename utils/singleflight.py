@@ -0,0 +1,43 @@
+import asyncio
+from logging import getLogger
+
+from utils.metrics import COALESCED
+
+log = getLogger(__name__)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key on the event loop: the first caller starts the work,
+    callers with the same key arriving while it runs wait for it and get the same result object (treat it as read-only).
+    The work runs in its own task, so the first caller going away does not cancel it for the others.
+    A run that fails is not shared: the waiters then run their own work, so one client's bad upload
+    or disconnect never fails the others.
+    """
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._flights: dict[str, asyncio.Future] = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def do(self, key: str, fn):
+        """
+        Result of ``await fn()``, or of the run already in flight for ``key``.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._forget(key, done))
+            return await asyncio.shield(flight)
+
+        COALESCED.inc(kind=self.kind)
+        try:
+            return await asyncio.shield(flight)
+        except Exception as e:
+            log.info(f"Shared {self.kind} run for {key} failed ({type(e).__name__}), running it again for this request.")
+            return await fn()
+
+    def _forget(self, key: str, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
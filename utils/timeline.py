@@ -0,0 +1,71 @@
+import numpy as np
+
+from utils.analytics import JUDGMENT_NAMES, combo_series, ordered_events
+
+class ReplayTimeline:
+    """
+    A parsed replay indexed by absolute event time, for seeking: events are ordered by time,
+    and combo, max combo and per-judgment counts are precomputed as running totals,
+    so the state at any time is one binary search away.
+    """
+    __slots__ = ("events", "combo", "max_combo", "judgment_counts", "duration")
+
+    def __init__(self, inputs: dict, duration: float = 0.0):
+        self.events = ordered_events(inputs["time"], inputs["judgment"], inputs["accuracy"], inputs["entityIndex"])
+        self.combo = combo_series(self.events["judgment"])
+        self.max_combo = np.maximum.accumulate(self.combo) if len(self.combo) else self.combo
+        self.judgment_counts = {
+            name: np.cumsum(self.events["judgment"] == value) for value, name in JUDGMENT_NAMES.items()
+        }
+        times = self.events["time"]
+        self.duration = max(float(duration or 0), float(times[-1]) if len(times) else 0.0)
+
+    @classmethod
+    def from_result(cls, result: dict) -> "ReplayTimeline":
+        """
+        Build from a /replayv2 item result (ReplayData.to_dict() output).
+        """
+        replay = result["replay"]
+        return cls(replay["inputs"], replay.get("duration", 0.0))
+
+    def __len__(self):
+        return len(self.events["time"])
+
+    def state_before(self, index: int) -> dict:
+        """
+        Combo, max combo and judgment counts after the first ``index`` events.
+        """
+        if index <= 0:
+            return {"combo": 0, "maxCombo": 0, "judgmentCounts": {name: 0 for name in self.judgment_counts}}
+        return {
+            "combo": int(self.combo[index - 1]),
+            "maxCombo": int(self.max_combo[index - 1]),
+            "judgmentCounts": {name: int(counts[index - 1]) for name, counts in self.judgment_counts.items()}
+        }
+
+    def window(self, start: float, end: float, limit: int | None = None, cursor: int | None = None) -> dict:
+        """
+        Events with start <= time < end (at most ``limit`` of them) and the state at ``start``.
+        With ``cursor`` the window starts at that event index instead of at ``start``.
+        "nextCursor" is the index to continue from (events sharing a time may be split across pages),
+        "next" the time of that event.
+        """
+        times = self.events["time"]
+        if cursor is not None:
+            first = min(max(cursor, 0), len(times))
+        else:
+            first = int(np.searchsorted(times, start, side="left"))
+        last = max(first, int(np.searchsorted(times, end, side="left")))
+        if limit is not None and last - first > limit:
+            last = first + limit
+        return {
+            "start": start,
+            "end": end,
+            "count": len(self),
+            "duration": self.duration,
+            "firstIndex": first,
+            "state": self.state_before(first),
+            "events": {key: column[first:last].tolist() for key, column in self.events.items()},
+            "next": float(times[last]) if last < len(times) else None,
+            "nextCursor": last if last < len(times) else None
+        }
@@ -0,0 +1,97 @@
+import json
+import os
+import pathlib
+from logging import getLogger
+
+from fastapi import UploadFile
+
+log = getLogger(__name__)
+
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+class UploadTooLargeError(ValueError):
+    pass
+
+def max_upload_bytes(env: str = "REPLAY_MAX_UPLOAD_BYTES", default: int = 100 * 1024 * 1024) -> int:
+    """
+    Upload size limit from the environment, 0 disables the limit.
+    """
+    return int(os.environ.get(env, default))
+
+async def copy_upload(file: UploadFile, target: pathlib.Path, max_bytes: int = 0) -> int:
+    """
+    Copy an upload to ``target`` in UPLOAD_CHUNK_BYTES chunks instead of reading it into memory at once.
+    Raises UploadTooLargeError as soon as more than ``max_bytes`` were copied (0 means no limit).
+    """
+    await file.seek(0)
+    written = 0
+    with open(target, "wb") as f_out:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            written += len(chunk)
+            if max_bytes and written > max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds the {max_bytes} byte limit.")
+            f_out.write(chunk)
+    return written
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects oversized uploads to ``paths`` with 413 before the multipart body is parsed and spooled:
+    up front from Content-Length, or as soon as the streamed body goes over the limit.
+    """
+    def __init__(self, app, paths: tuple[str, ...], max_bytes: int):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0 or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            log.warning(f"Rejected upload to {scope['path']}: Content-Length {int(content_length)} exceeds {self.max_bytes} bytes.")
+            await self._send_too_large(send)
+            return
+
+        received = 0
+        exceeded = False
+        replaced = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLargeError(f"Upload exceeds the {self.max_bytes} byte limit.")
+            return message
+
+        async def limited_send(message):
+            nonlocal replaced
+            # Whatever the app answers after the body went over the limit is replaced by a 413
+            if exceeded:
+                if not replaced and message["type"] == "http.response.start":
+                    replaced = True
+                    await self._send_too_large(send)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except UploadTooLargeError:
+            if not replaced:
+                await self._send_too_large(send)
+        if exceeded:
+            log.warning(f"Rejected upload to {scope['path']}: body exceeded {self.max_bytes} bytes.")
+
+    async def _send_too_large(self, send):
+        body = json.dumps({"detail": f"Upload is too large, the limit is {self.max_bytes} bytes."}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        })
+        await send({"type": "http.response.body", "body": body})
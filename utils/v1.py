@@ -5,6 +5,8 @@ import zipfile
 from data import RawReplayData, ReplayData
 from logging import getLogger
 
+from utils.export import export_repository
+
 log = getLogger(__name__)
 
 def extract_mod(data: list) -> list:
@@ -114,15 +116,11 @@ def read_replay_data_file(file: pathlib.Path) -> list | None:
 def parse_replay_data(metadata: RawReplayData, data: dict) -> ReplayData:
     return ReplayData.from_dict(metadata, data)
 
-def main(filters: list = None):
-    folder = pathlib.Path("./sonolus/repository/")
-    decompress_folder = pathlib.Path("Export")
-    decompress_folder.mkdir(parents=True, exist_ok=True)
-    processed = 0
-    for filter in filters:
-        for file in folder.glob(str(filter)):
-            try:
-                decompress_gzip_file(file, decompress_folder)
-                processed += 1
-            except Exception as e:
-                log.error(f"Error processing {file}: {e}")
\ No newline at end of file
+def main(filters: list = None, jobs: int = None, compact: bool = False, check: str = "mtime"):
+    """
+    Decode the ./sonolus/repository/ blobs matching ``filters`` (glob patterns, default: all) to Export/,
+    in parallel and skipping outputs that are already up to date. CLI: python -m utils.export --help
+    """
+    return export_repository(
+        pathlib.Path("./sonolus/repository/"), pathlib.Path("Export"), filters, jobs=jobs, compact=compact, check=check
+    )
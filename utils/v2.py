@@ -1,10 +1,15 @@
 import gzip
+import io
 import json
 import pathlib
 import zipfile
+import zlib
+from fnmatch import fnmatch
 from data import RawReplayData, ReplayData
 from logging import getLogger
 
+from utils.export import export_repository
+
 log = getLogger(__name__)
 
 def extract_mod(data: list) -> list:
@@ -78,6 +83,43 @@ def read_replay_data(folder: pathlib.Path):
         _data[file.name] = data
     return _data
 
+def open_replay_archive(source) -> zipfile.ZipFile:
+    """
+    Open a replay archive without extracting it. ``source`` may be raw bytes,
+    a path, or a seekable binary file object (e.g. the spooled file behind an UploadFile).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return zipfile.ZipFile(source, 'r')
+
+def read_replay_data_from_archive(archive: zipfile.ZipFile) -> dict[str, dict]:
+    _data: dict[str, dict] = {}
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        parts = pathlib.PurePosixPath(info.filename).parts
+        if len(parts) != 3 or parts[:2] != ("sonolus", "replays") or not fnmatch(parts[2], "local-*"):
+            continue
+        with archive.open(info) as f:
+            _data[parts[2]] = json.load(f)
+    return _data
+
+def gameplay_data_member(url: str) -> str:
+    """
+    Map a gameplay data URL (e.g. /sonolus/repository/<hash>) to its member name inside the archive.
+    """
+    path = url.replace("\\", "/").lstrip("/")
+    if path.lower().startswith("sonolus/"):
+        path = path[len("sonolus/"):]
+    return f"sonolus/{path}"
+
+def read_archive_member(archive: zipfile.ZipFile, member: str) -> bytes | None:
+    try:
+        return archive.read(member)
+    except KeyError:
+        log.error(f"Member {member} does not exist in the archive.")
+        return None
+
 def process_replay_files(data: dict) -> RawReplayData:
     return RawReplayData(
         name=data["item"]["name"],
@@ -105,6 +147,25 @@ def decompress_gzip_file(input_file_path, output_file_path):
 
     return file
 
+def decode_gzip_data(source) -> dict | None:
+    """
+    Decode gzip'd JSON-lines gameplay data straight to the first frame in one pass, without the
+    intermediate JSON file written by decompress_gzip_file. ``source`` may be raw bytes, a path
+    or a binary file object.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    try:
+        with gzip.open(source, 'rt') as data:
+            for line in data:
+                if line.strip():
+                    return json.loads(line)
+    except (OSError, EOFError, zlib.error, json.JSONDecodeError) as e:
+        log.error(f"Failed to decode gzip data: {e}")
+        return None
+    log.error("Gzip data contains no gameplay frame.")
+    return None
+
 def read_replay_data_file(file: pathlib.Path) -> list | None:
     if not file.exists():
         log.error(f"File {file} does not exist.")
@@ -116,15 +177,11 @@ def read_replay_data_file(file: pathlib.Path) -> list | None:
 def parse_replay_data(metadata: RawReplayData, data: dict) -> ReplayData:
     return ReplayData.from_dict(metadata, data)
 
-def main(filters: list = None):
-    folder = pathlib.Path("./sonolus/repository/")
-    decompress_folder = pathlib.Path("Export")
-    decompress_folder.mkdir(parents=True, exist_ok=True)
-    processed = 0
-    for filter in filters:
-        for file in folder.glob(str(filter)):
-            try:
-                decompress_gzip_file(file, decompress_folder)
-                processed += 1
-            except Exception as e:
-                log.error(f"Error processing {file}: {e}")
\ No newline at end of file
+def main(filters: list = None, jobs: int = None, compact: bool = False, check: str = "mtime"):
+    """
+    Decode the ./sonolus/repository/ blobs matching ``filters`` (glob patterns, default: all) to Export/,
+    in parallel and skipping outputs that are already up to date. CLI: python -m utils.export --help
+    """
+    return export_repository(
+        pathlib.Path("./sonolus/repository/"), pathlib.Path("Export"), filters, jobs=jobs, compact=compact, check=check
+    )
@@ -0,0 +1,156 @@
+import argparse
+import json
+import pathlib
+import sys
+import time
+from logging import getLogger
+
+import numpy as np
+
+from utils.analytics import GOOD, GREAT, JUDGMENT_NAMES, MISS, PERFECT, ordered_events
+
+log = getLogger(__name__)
+
+# Result fields recomputed from the inputs; grade, scores and accuracy depend on the chart and are not checked
+VERIFIED_FIELDS = ("perfect", "great", "good", "miss", "totalCount", "combo")
+VERIFY_BATCH_SIZE = 500
+
+# verdict statuses
+OK, MISMATCH, UNVERIFIABLE = "ok", "mismatch", "unverifiable"
+
+def recompute_results(judgment_columns: list[np.ndarray]) -> dict[str, np.ndarray]:
+    """
+    Judgment counts, total count, max combo and invalid judgment count of many replays in one pass over all
+    their events. ``judgment_columns`` are the time ordered judgments of every replay.
+    Combo rules follow the players: perfect/great add one, miss/good reset it.
+    """
+    replays = len(judgment_columns)
+    lengths = np.fromiter(map(len, judgment_columns), dtype=np.int64, count=replays)
+    judgments = np.concatenate(judgment_columns).astype(np.int64) if replays else np.empty(0, dtype=np.int64)
+    replay_index = np.repeat(np.arange(replays), lengths)
+
+    valid = (judgments >= 0) & (judgments < len(JUDGMENT_NAMES))
+    counts = np.bincount(replay_index[valid] * len(JUDGMENT_NAMES) + judgments[valid],
+                         minlength=replays * len(JUDGMENT_NAMES)).reshape(replays, len(JUDGMENT_NAMES))
+
+    # Combo over the concatenated events: the start of every replay acts as a reset
+    hit = (judgments == PERFECT) | (judgments == GREAT)
+    hits = np.cumsum(hit)
+    base = np.where((judgments == MISS) | (judgments == GOOD), hits, 0)
+    starts = (np.cumsum(lengths) - lengths)[lengths > 0]
+    base[starts] = np.maximum(base[starts], hits[starts] - hit[starts])
+    combo = hits - np.maximum.accumulate(base)
+    max_combo = np.zeros(replays, dtype=np.int64)
+    if len(starts):
+        max_combo[lengths > 0] = np.maximum.reduceat(combo, starts)
+
+    recomputed = {name: counts[:, value] for value, name in JUDGMENT_NAMES.items()}
+    recomputed["totalCount"] = counts.sum(axis=1)
+    recomputed["combo"] = max_combo
+    recomputed["invalidJudgments"] = lengths - recomputed["totalCount"]
+    return recomputed
+
+def verify_columns(judgment_columns: list[np.ndarray], claimed_results: list[dict]) -> list[dict]:
+    """
+    Compare every claimed result block with the values recomputed from its replay's judgments.
+    """
+    recomputed = recompute_results(judgment_columns)
+    verdicts = []
+    for i, claimed in enumerate(claimed_results):
+        computed = {field: int(recomputed[field][i]) for field in (*VERIFIED_FIELDS, "invalidJudgments")}
+        mismatches = {
+            field: {"claimed": claimed.get(field), "computed": computed[field]}
+            for field in VERIFIED_FIELDS if claimed.get(field) != computed[field]
+        }
+        if computed["invalidJudgments"]:
+            mismatches["invalidJudgments"] = {"claimed": 0, "computed": computed["invalidJudgments"]}
+        verdicts.append({"status": MISMATCH if mismatches else OK, "mismatches": mismatches, "computed": computed})
+    return verdicts
+
+def replay_columns(entry: dict) -> tuple[dict, dict]:
+    """
+    (inputs, claimed result) of a /replayv2 item result or library replay, or of a decoded gameplay frame.
+    """
+    replay = entry["replay"] if "replay" in entry else entry
+    return replay["inputs"], entry["result"]
+
+def verify_results(entries: list[dict]) -> list[dict]:
+    """
+    Per-replay verdicts for many replays at once. Entries that are errors or lack inputs get an "unverifiable" verdict.
+    """
+    verdicts: list[dict | None] = [None] * len(entries)
+    positions, judgment_columns, claimed_results = [], [], []
+    for i, entry in enumerate(entries):
+        try:
+            inputs, claimed = replay_columns(entry)
+            judgment_columns.append(ordered_events(inputs["time"], inputs["judgment"], inputs["accuracy"])["judgment"])
+            claimed_results.append(claimed)
+            positions.append(i)
+        except (KeyError, TypeError, ValueError) as e:
+            verdicts[i] = {"status": UNVERIFIABLE, "reason": f"{type(e).__name__}: {e}"}
+
+    for i, verdict in zip(positions, verify_columns(judgment_columns, claimed_results)):
+        verdicts[i] = verdict
+    return verdicts
+
+def load_entries(path: pathlib.Path) -> list[dict]:
+    """
+    Replays of a JSON file: a /replayv2 response ({item: result}), an export file (list of gameplay frames) or a single replay.
+    """
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and ("result" in data or "error" in data):
+        return [data]
+    if isinstance(data, dict):
+        return list(data.values())
+    return []
+
+def iter_file_batches(paths: list[pathlib.Path], batch_size: int):
+    batch = []
+    for path in paths:
+        files = sorted(path.glob("*.json")) if path.is_dir() else [path]
+        for file in files:
+            try:
+                entries = load_entries(file)
+            except (OSError, json.JSONDecodeError, UnicodeDecodeError) as e:
+                log.error(f"Could not read {file}: {e}")
+                continue
+            batch += [(f"{file.name}#{i}", entry) for i, entry in enumerate(entries)]
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute replay results from their inputs and report the ones that do not match.")
+    parser.add_argument("paths", nargs="*", type=pathlib.Path, help="replay JSON files or folders (/replayv2 responses or exported blobs)")
+    parser.add_argument("--library", type=pathlib.Path, default=None, help="verify every replay of this library database")
+    parser.add_argument("--all", action="store_true", help="print the verdict of every replay, not only the failing ones")
+    parser.add_argument("--batch-size", type=int, default=VERIFY_BATCH_SIZE)
+    args = parser.parse_args()
+
+    batches = []
+    if args.library is not None:
+        from utils.library import ReplayLibrary
+        batches.append(ReplayLibrary(args.library).iter_replays(args.batch_size))
+    if args.paths:
+        batches.append(iter_file_batches(args.paths, args.batch_size))
+
+    counts = {OK: 0, MISMATCH: 0, UNVERIFIABLE: 0}
+    started = time.perf_counter()
+    for source in batches:
+        for batch in source:
+            for (name, _), verdict in zip(batch, verify_results([entry for _, entry in batch])):
+                counts[verdict["status"]] += 1
+                if args.all or verdict["status"] != OK:
+                    print(json.dumps({"replay": name, **verdict}))
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"Verified {total} replay(s) in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} replays/s): "
+          f"ok {counts[OK]}, mismatch {counts[MISMATCH]}, unverifiable {counts[UNVERIFIABLE]}", file=sys.stderr)
+    sys.exit(1 if counts[MISMATCH] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from logging import getLogger
+
+from utils.metrics import merge_samples, run_captured
+
+log = getLogger(__name__)
+
+class WorkerPoolFullError(RuntimeError):
+    pass
+
+class ReplayWorkerPool:
+    """
+    Runs the blocking replay pipeline (zip, gzip, JSON and filesystem work) off the event loop.
+
+    mode: "thread" or "process". At most ``max_workers`` archives are processed at once and at most ``max_queue``
+    more wait for a worker; anything beyond that is rejected with WorkerPoolFullError instead of piling up.
+    The replay items of an admitted archive are fanned out over the same workers, ``item_parallelism`` at a time.
+    Jobs submitted in process mode must be module-level functions with picklable arguments, ``initializer(*initargs)``
+    runs once in every worker process.
+    """
+    MODES = ("thread", "process")
+
+    def __init__(self, mode: str = "thread", max_workers: int | None = None, max_queue: int = 32, item_parallelism: int | None = None,
+                 initializer=None, initargs: tuple = ()):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown worker pool mode '{mode}', expected one of {self.MODES}.")
+        self.mode = mode
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.item_parallelism = item_parallelism or self.max_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ReplayWorkerPool":
+        return cls(
+            mode=os.environ.get("REPLAY_WORKER_MODE", "thread").lower(),
+            max_workers=int(os.environ.get("REPLAY_WORKERS", 0)) or None,
+            max_queue=int(os.environ.get("REPLAY_QUEUE_SIZE", 32)),
+            item_parallelism=int(os.environ.get("REPLAY_ITEM_PARALLELISM", 0)) or None
+        )
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=self.initializer, initargs=self.initargs)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="replay-worker")
+                log.info(f"Started replay worker pool: mode={self.mode}, workers={self.max_workers}, queue={self.max_queue}")
+            return self._executor
+
+    @contextmanager
+    def reserve(self):
+        """
+        Admit one archive into the pool, or raise WorkerPoolFullError if every worker and queue slot is taken.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise WorkerPoolFullError(f"Replay worker pool is full ({self.max_workers} running, {self.max_queue} queued).")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    async def submit(self, fn, *args):
+        """
+        Run ``fn(*args)`` on a worker. Callers are expected to hold a reservation and bound their own fan-out.
+        Metrics recorded by a process worker are shipped back with the result and merged into this process.
+        """
+        if self.mode == "process":
+            result, samples = await asyncio.wrap_future(self.executor.submit(run_captured, fn, *args))
+            merge_samples(samples)
+            return result
+        return await asyncio.wrap_future(self.executor.submit(fn, *args))
+
+    async def run(self, fn, *args):
+        with self.reserve():
+            return await self.submit(fn, *args)
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+                log.info("Replay worker pool shut down.")
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import pathlib
+import re
+import shutil
+import threading
+import time
+import uuid
+from logging import getLogger
+
+from utils.metrics import WORKSPACE_BYTES, WORKSPACE_SWEPT, WORKSPACES
+
+log = getLogger(__name__)
+
+TMPFS_DIR = pathlib.Path("/dev/shm")
+WORKSPACE_PREFIX = "processing_"
+# The per-request temp/<uuid> directories of the old v1 pipeline (its temp/processing_<uuid> ones carry WORKSPACE_PREFIX)
+LEGACY_ENTRY = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# Name prefixes of the open pools of this process, whose workspaces another pool's sweep must not touch
+_live_prefixes: set[str] = set()
+_live_prefixes_lock = threading.Lock()
+
+class Workspace:
+    """
+    A scratch directory leased to one request. Its name (processing_<pid>_<pool instance>_<id>) carries the owning
+    process id, so the directories of a crashed process can be told apart from live ones.
+    """
+    __slots__ = ("path", "uses")
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.uses = 0
+
+def workspace_owner(name: str) -> int | None:
+    """
+    Process id encoded in a workspace directory name, None for anything else.
+    """
+    if not name.startswith(WORKSPACE_PREFIX):
+        return None
+    pid, _, _ = name[len(WORKSPACE_PREFIX):].partition("_")
+    return int(pid) if pid.isdigit() else None
+
+def is_workspace_entry(name: str) -> bool:
+    """
+    Whether ``name`` was created by the on-disk pipeline, now or by an earlier version. Nothing else is ever swept.
+    """
+    return name.startswith(WORKSPACE_PREFIX) or LEGACY_ENTRY.fullmatch(name) is not None
+
+def process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def directory_size(path: pathlib.Path) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+def clear_directory(path: pathlib.Path):
+    """
+    Delete everything inside ``path`` but keep the directory itself.
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+def remove_path(path: pathlib.Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+class WorkspacePool:
+    """
+    Scratch directories for the on-disk pipeline under ``root`` (optionally on tmpfs).
+    Released workspaces are emptied and kept for reuse, at most ``max_idle`` of them, instead of
+    creating and deleting a directory per request. sweep() removes what nobody owns anymore:
+    workspaces of dead processes right away, leftovers of earlier versions once older than ``stale_seconds``,
+    and, while the workspaces are over ``budget_bytes``, idle workspaces and the oldest leftovers.
+    Workspaces in use and entries that are not workspaces (see is_workspace_entry) are never touched.
+    """
+    def __init__(self, root: pathlib.Path, max_idle: int = 4, budget_bytes: int = 2 * 1024 * 1024 * 1024, stale_seconds: float = 3600.0):
+        self.root = root
+        self.max_idle = max_idle
+        self.budget_bytes = budget_bytes
+        self.stale_seconds = stale_seconds
+        self._idle: list[Workspace] = []
+        self._in_use: dict[pathlib.Path, Workspace] = {}
+        self._lock = threading.Lock()
+        self.counters = {"created": 0, "reused": 0, "removed": 0, "swept": 0, "swept_bytes": 0}
+        self.usage_bytes = 0
+        # Tells this pool's workspaces apart from a previous run with the same pid (e.g. pid 1 in a container)
+        self._own_prefix = f"{WORKSPACE_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:8]}_"
+        with _live_prefixes_lock:
+            _live_prefixes.add(self._own_prefix)
+
+    @classmethod
+    def from_env(cls) -> "WorkspacePool":
+        root = pathlib.Path(os.environ.get("REPLAY_WORKSPACE_DIR", "temp"))
+        if os.environ.get("REPLAY_WORKSPACE_TMPFS", "0") == "1":
+            if TMPFS_DIR.is_dir() and os.access(TMPFS_DIR, os.W_OK):
+                root = TMPFS_DIR / "replay-workspaces"
+            else:
+                log.warning(f"REPLAY_WORKSPACE_TMPFS is set but {TMPFS_DIR} is not writable, using {root}.")
+        return cls(
+            root=root,
+            max_idle=int(os.environ.get("REPLAY_WORKSPACE_IDLE", 4)),
+            budget_bytes=int(os.environ.get("REPLAY_WORKSPACE_BUDGET_BYTES", 2 * 1024 * 1024 * 1024)),
+            stale_seconds=float(os.environ.get("REPLAY_WORKSPACE_STALE_SECONDS", 3600))
+        )
+
+    def acquire(self) -> Workspace:
+        """
+        An empty workspace, reused when one is idle. Blocking, run it off the event loop.
+        """
+        with self._lock:
+            workspace = self._idle.pop() if self._idle else None
+            if workspace is not None:
+                self.counters["reused"] += 1
+                self._in_use[workspace.path] = workspace
+        if workspace is None:
+            workspace = Workspace(self.root / f"{self._own_prefix}{uuid.uuid4().hex}")
+            with self._lock:
+                self.counters["created"] += 1
+                self._in_use[workspace.path] = workspace
+        try:
+            workspace.path.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            with self._lock:
+                self._in_use.pop(workspace.path, None)
+            raise
+        workspace.uses += 1
+        return workspace
+
+    def release(self, workspace: Workspace):
+        """
+        Empty the workspace and keep it for reuse, or delete it when enough are idle. Blocking, run it off the event loop.
+        """
+        with self._lock:
+            self._in_use.pop(workspace.path, None)
+        try:
+            clear_directory(workspace.path)
+        except OSError as e:
+            log.warning(f"Could not empty workspace {workspace.path}, removing it: {e}")
+            keep = False
+        else:
+            with self._lock:
+                keep = len(self._idle) < self.max_idle
+                if keep:
+                    self._idle.append(workspace)
+        if not keep:
+            shutil.rmtree(workspace.path, ignore_errors=True)
+            with self._lock:
+                self.counters["removed"] += 1
+
+    def sweep(self) -> dict:
+        """
+        One maintenance pass over ``root``. Blocking, run it off the event loop.
+        """
+        if not self.root.is_dir():
+            return self.stats()
+        now = time.time()
+        with self._lock:
+            known = set(self._in_use) | {workspace.path for workspace in self._idle}
+
+        usage = 0
+        candidates = [] # (mtime, path, size) of leftovers still within stale_seconds
+        for entry in self.root.iterdir():
+            if entry in known or entry.name.startswith(self._own_prefix):
+                continue # ours, possibly being created or removed right now
+            if not is_workspace_entry(entry.name):
+                continue # not created by the pipeline, e.g. a file an operator keeps next to the workspaces
+            owner = workspace_owner(entry.name)
+            try:
+                mtime = entry.lstat().st_mtime
+                size = directory_size(entry) if entry.is_dir() else entry.lstat().st_size
+            except FileNotFoundError:
+                continue
+            if owner is not None:
+                # Workspace of another server process sharing the root, or of another pool of this process:
+                # only swept once its owner is gone (a previous process with this pid counts as gone)
+                if self._owner_alive(entry.name, owner):
+                    usage += size
+                else:
+                    self._sweep(entry, size, "orphaned")
+            elif now - mtime > self.stale_seconds:
+                self._sweep(entry, size, "stale")
+            else:
+                candidates.append((mtime, entry, size))
+                usage += size
+
+        with self._lock:
+            tracked = [workspace.path for workspace in self._in_use.values()] + [workspace.path for workspace in self._idle]
+        usage += sum(directory_size(path) for path in tracked if path.exists())
+
+        if usage > self.budget_bytes:
+            with self._lock:
+                idle, self._idle = self._idle, []
+            for workspace in idle:
+                shutil.rmtree(workspace.path, ignore_errors=True)
+                with self._lock:
+                    self.counters["removed"] += 1
+            for _, entry, size in sorted(candidates, key=lambda candidate: candidate[0]):
+                if usage <= self.budget_bytes:
+                    break
+                self._sweep(entry, size, "over budget")
+                usage -= size
+            if usage > self.budget_bytes:
+                log.warning(f"Workspaces use {usage} bytes, over the {self.budget_bytes} byte budget, all by workspaces in use.")
+
+        self.usage_bytes = usage
+        return self.stats()
+
+    @staticmethod
+    def _owner_alive(name: str, owner: int) -> bool:
+        if owner != os.getpid():
+            return process_alive(owner)
+        with _live_prefixes_lock:
+            return any(name.startswith(prefix) for prefix in _live_prefixes)
+
+    def _sweep(self, path: pathlib.Path, size: int, reason: str):
+        log.info(f"Sweeping {reason} workspace entry {path} ({size} bytes).")
+        remove_path(path)
+        with self._lock:
+            self.counters["swept"] += 1
+            self.counters["swept_bytes"] += size
+        WORKSPACE_SWEPT.inc()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "root": str(self.root),
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "usage_bytes": self.usage_bytes,
+                "budget_bytes": self.budget_bytes,
+                **self.counters
+            }
+
+    def close(self):
+        """
+        Remove the idle workspaces, at shutdown.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for workspace in idle:
+            shutil.rmtree(workspace.path, ignore_errors=True)
+        with _live_prefixes_lock:
+            _live_prefixes.discard(self._own_prefix)
+
+async def run_janitor(pool: WorkspacePool, interval: float = 60.0):
+    """
+    Background maintenance task for the app lifespan: sweep the workspaces every ``interval`` seconds until cancelled.
+    """
+    while True:
+        try:
+            stats = await asyncio.to_thread(pool.sweep)
+            WORKSPACES.set(stats["in_use"], state="in_use")
+            WORKSPACES.set(stats["idle"], state="idle")
+            WORKSPACE_BYTES.set(stats["usage_bytes"])
+            log.debug(f"Workspace janitor: {stats}")
+        except Exception as e:
+            log.error(f"Workspace janitor pass failed: {e}", exc_info=True)
+        await asyncio.sleep(interval)